@@ -0,0 +1,74 @@
+import BaseHTTPServer
+import json
+import threading
+
+
+class FakeElasticsearchHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    # Accepts just enough of the REST API for ingestion: _bulk, single
+    # document indexing, index existence checks and templates.
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, code, body=None):
+        data = json.dumps(body if body is not None else {})
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(data)
+
+    def _body(self):
+        return self.rfile.read(int(self.headers.getheader("Content-Length", 0)))
+
+    def do_HEAD(self):
+        self._reply(200 if self.path.strip("/") in self.server.indices else 404)
+
+    def do_GET(self):
+        if self.path.startswith("/_template"):
+            return self._reply(200, {})
+        self._reply(200, {"version": {"number": "6.8.0"}})
+
+    def do_PUT(self):
+        self._body()
+        if not self.path.startswith("/_template"):
+            self.server.indices.add(self.path.strip("/").split("/")[0])
+        self._reply(200, {"acknowledged": True})
+
+    def do_POST(self):
+        body = self._body()
+        if self.path.split("?")[0].endswith("/_bulk"):
+            count = body.count("\n") // 2
+            self.server.documents += count
+            self.server.requests += 1
+            items = [{"index": {"status": 201}}] * count
+            return self._reply(200, {"errors": False, "took": 1,
+                                     "items": items})
+        self.server.documents += 1
+        self.server.requests += 1
+        self._reply(201, {"result": "created"})
+
+
+class FakeElasticsearch(BaseHTTPServer.HTTPServer):
+
+    def __init__(self, host="127.0.0.1", port=0):
+        BaseHTTPServer.HTTPServer.__init__(self, (host, port),
+                                           FakeElasticsearchHandler)
+        self.indices = set()
+        self.documents = 0
+        self.requests = 0
+
+    @property
+    def url(self):
+        return "http://{0}:{1}".format(*self.server_address)
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
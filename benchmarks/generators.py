@@ -0,0 +1,74 @@
+import json
+import random
+
+import subunit
+
+
+def rally_report(path, scenarios=3, iterations=1000, actions=5,
+                 error_rate=0.05, seed=0):
+    """Writes a Rally task report with scenarios x iterations x actions."""
+    rng = random.Random(seed)
+    action_names = ["service_{0}.action_{1}".format(i % 4, i)
+                    for i in range(actions)]
+    with open(path, "w") as f:
+        f.write("[")
+        for s in range(scenarios):
+            if s:
+                f.write(",")
+            f.write('{"key": ')
+            json.dump({"name": "Scenario.run_{0}".format(s),
+                       "kw": {"args": {}}}, f)
+            f.write(', "sla": [], "result": [')
+            for i in range(iterations):
+                if i:
+                    f.write(",")
+                json.dump({
+                    "timestamp": 1500000000 + i,
+                    "duration": rng.uniform(0.5, 10.0),
+                    "idle_duration": 0,
+                    "error": ["Error"] if rng.random() < error_rate else [],
+                    "atomic_actions": {name: rng.lognormvariate(0, 0.5)
+                                       for name in action_names}}, f)
+            f.write('], "load_duration": 1.0, "full_duration": 2.0}')
+        f.write("]")
+
+
+def subunit_stream(path, tests=1000, attachment_tests=100,
+                   attachment_lines=50, seed=0):
+    """Writes a subunit v2 stream, plus v1 results carried in pythonlogging
+    attachments as produced by older tempest runs."""
+    rng = random.Random(seed)
+    statuses = ["success"] * 8 + ["fail", "skip"]
+    with open(path, "wb") as f:
+        out = subunit.StreamResultToBytes(f)
+        for i in range(tests):
+            test_id = "tempest.api.compute.test_servers.Test.test_{0}".format(i)
+            out.status(test_id=test_id, test_status="inprogress")
+            out.status(test_id=test_id, test_status=rng.choice(statuses))
+
+        for i in range(attachment_tests):
+            name = "legacy.test_{0}".format(i)
+            log = "".join("DEBUG line {0} of {1}\n".format(n, name)
+                          for n in range(attachment_lines))
+            v1 = "test: {0}\n{1}{0}\n".format(
+                name, rng.choice(["success: ", "failure: "]))
+            out.status(file_name="pythonlogging", file_bytes=log + v1,
+                       route_code="0")
+
+
+def status_log(path, lines=100000, service="nova", seed=0):
+    """Writes a status log in the format of the upgrade during tests."""
+    rng = random.Random(seed)
+    down = 0.0
+    with open(path, "w") as f:
+        for i in range(lines):
+            status = 1 if rng.random() > 0.02 else 0
+            if not status:
+                down += 1
+            f.write(json.dumps({
+                "service": service,
+                "status": status,
+                "duration": float(i + 1),
+                "total_down": down,
+                service + "_duration": float(i + 1),
+                service + "_total_down": down}) + "\n")
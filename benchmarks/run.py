@@ -0,0 +1,180 @@
+"""Benchmarks for the parsers and the ingestion pipeline.
+
+Run from the repository root:
+
+    python -m benchmarks.run --output report.json
+    python -m benchmarks.run --compare report.json
+
+Every benchmark runs in a forked child so its peak RSS is measured on its
+own. Reports are JSON and can be compared against an earlier one.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+from benchmarks import generators
+from benchmarks.fake_es import FakeElasticsearch
+
+
+def bench_parse_output(workdir, scale):
+    from elastic_benchmark.main import parse_output
+    path = os.path.join(workdir, "rally.json")
+    generators.rally_report(path, scenarios=3, iterations=2000 * scale,
+                            actions=8)
+    yield "parse_output", {"bytes": os.path.getsize(path)}
+    with open(path) as f:
+        for _ in parse_output(f, "bench"):
+            pass
+
+
+def bench_upgrade_parse(workdir, scale):
+    from elastic_benchmark.upgrade import parse
+    path = os.path.join(workdir, "tempest.subunit")
+    generators.subunit_stream(path, tests=2000 * scale,
+                              attachment_tests=200 * scale)
+    yield "upgrade.parse", {"bytes": os.path.getsize(path)}
+    parse(path)
+
+
+def bench_status_parsers(workdir, scale):
+    from elastic_benchmark.upgrade import (
+        parse_api_from_status, parse_during_from_status)
+    path = os.path.join(workdir, "status.log")
+    generators.status_log(path, lines=50000 * scale)
+    yield "status_parsers", {"bytes": os.path.getsize(path)}
+    parse_during_from_status(path)
+    parse_api_from_status(path, api=True, checkpoint_dir=workdir)
+
+
+def bench_ingestion(workdir, scale):
+    from elastic_benchmark.main import ElasticSearchClient, index_rally_output
+    path = os.path.join(workdir, "rally.json")
+    generators.rally_report(path, scenarios=3, iterations=2000 * scale,
+                            actions=8)
+    es = FakeElasticsearch().start()
+    yield "ingestion", {"bytes": os.path.getsize(path)}
+    esc = ElasticSearchClient(hosts=[es.url])
+    with esc.bulk_indexer() as bulk:
+        with open(path) as f:
+            index_rally_output(f, bulk, "bench")
+    es.stop()
+
+
+BENCHMARKS = [bench_parse_output, bench_upgrade_parse, bench_status_parsers,
+              bench_ingestion]
+
+
+def run_child(benchmark, scale, write_fd):
+    workdir = tempfile.mkdtemp(prefix="elastic-benchmark-")
+    try:
+        steps = benchmark(workdir, scale)
+        # Everything before the first yield is input generation and is not
+        # part of the measurement.
+        name, params = next(steps)
+        start_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start_cpu = time.clock()
+        start = time.time()
+        for _ in steps:
+            pass
+        result = {"name": name, "params": params,
+                  "seconds": round(time.time() - start, 4),
+                  "cpu_seconds": round(time.clock() - start_cpu, 4),
+                  "baseline_rss_kb": start_rss}
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    os.write(write_fd, json.dumps(result))
+
+
+def run(benchmark, scale):
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        # Keep log passthrough and parser chatter out of the report.
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, 1)
+        code = 0
+        try:
+            run_child(benchmark, scale, write_fd)
+        except Exception as e:
+            os.write(write_fd, json.dumps({"error": str(e)}))
+            code = 1
+        os._exit(code)
+
+    os.close(write_fd)
+    chunks = []
+    while True:
+        chunk = os.read(read_fd, 65536)
+        if not chunk:
+            break
+        chunks.append(chunk)
+    os.close(read_fd)
+    _, status, usage = os.wait4(pid, 0)
+    result = json.loads("".join(chunks) or "{}")
+    result.setdefault("name", benchmark.__name__)
+    result["peak_rss_kb"] = usage.ru_maxrss
+    if status:
+        result.setdefault("error", "exit status {0}".format(status))
+    return result
+
+
+def compare(report, baseline):
+    previous = {b["name"]: b for b in baseline.get("benchmarks", [])}
+    for bench in report["benchmarks"]:
+        old = previous.get(bench["name"])
+        if not old or "seconds" not in old or "seconds" not in bench:
+            continue
+        print "{0:<16} time {1:>8.3f}s -> {2:>8.3f}s ({3:+.1f}%)  " \
+              "rss {4:>8}kB -> {5:>8}kB".format(
+                  bench["name"], old["seconds"], bench["seconds"],
+                  (bench["seconds"] / old["seconds"] - 1) * 100,
+                  old["peak_rss_kb"], bench["peak_rss_kb"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs the benchmarks.")
+    parser.add_argument("--scale", type=int, default=1,
+                        help="Multiplies the size of every generated input.")
+    parser.add_argument("--only", default=None,
+                        help="Comma separated benchmark names to run.")
+    parser.add_argument("--output", default=None,
+                        help="Write the JSON report to this file.")
+    parser.add_argument("--compare", default=None,
+                        help="Earlier JSON report to compare against.")
+    cl_args = parser.parse_args()
+
+    selected = BENCHMARKS
+    if cl_args.only:
+        names = cl_args.only.split(",")
+        selected = [b for b in BENCHMARKS
+                    if b.__name__[len("bench_"):] in names]
+
+    report = {"python": platform.python_version(),
+              "platform": platform.platform(),
+              "scale": cl_args.scale,
+              "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+              "benchmarks": [run(b, cl_args.scale) for b in selected]}
+
+    data = json.dumps(report, indent=2, sort_keys=True)
+    if cl_args.output:
+        with open(cl_args.output, "w") as f:
+            f.write(data + "\n")
+    else:
+        print data
+
+    if cl_args.compare:
+        with open(cl_args.compare) as f:
+            compare(report, json.load(f))
+
+    if any("error" in b for b in report["benchmarks"]):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+import datetime
+import json
+
+from elastic_benchmark.inputs import open_input
+from elastic_benchmark.sketch import QuantileSketch
+
+
+class RunningStats(object):
+    __slots__ = ("count", "total", "min", "max", "sketch")
+
+    def __init__(self, sketch=None):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.sketch = sketch
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        if self.sketch is not None:
+            self.sketch.add(value)
+
+    def merge(self, other):
+        if (self.sketch is None) != (other.sketch is None):
+            # Merging anyway would leave the sketch short of count.
+            raise ValueError("Cannot merge statistics with and without a "
+                             "percentile sketch")
+        if not other.count:
+            return
+        self.count += other.count
+        self.total += other.total
+        if self.min is None or other.min < self.min:
+            self.min = other.min
+        if self.max is None or other.max > self.max:
+            self.max = other.max
+        if self.sketch is not None:
+            self.sketch.merge(other.sketch)
+
+    def as_dict(self, percentiles=()):
+        stats = {"min": self.min, "max": self.max,
+                 "avg": self.total / self.count}
+        if self.sketch is not None:
+            stats.update(self.sketch.percentiles(percentiles))
+        return stats
+
+    def to_dict(self):
+        return {"count": self.count, "total": self.total,
+                "min": self.min, "max": self.max,
+                "sketch": self.sketch.to_dict() if self.sketch else None}
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        stats.count = data["count"]
+        stats.total = data["total"]
+        stats.min = data["min"]
+        stats.max = data["max"]
+        if data.get("sketch"):
+            stats.sketch = QuantileSketch.from_dict(data["sketch"])
+        return stats
+
+
+class RunAggregator(object):
+    """Builds the aggregated_results document of one Rally run on the fly.
+
+    Iteration documents are folded in as they are parsed, so only running
+    statistics per atomic action are kept instead of every iteration. When
+    percentiles are requested each statistic also carries a QuantileSketch;
+    the whole state can be serialized with to_dict and merged back, so a run
+    split across several reports can be aggregated without its iterations.
+    """
+
+    def __init__(self, scenario_name, run_id, percentiles=(),
+                 relative_accuracy=0.01):
+        self.scenario_name = scenario_name
+        self.run_id = run_id
+        # Every run folded in by merge, this one included.
+        self.run_ids = [run_id]
+        self.percentiles = list(percentiles)
+        self.relative_accuracy = relative_accuracy
+        self.timestamp = None
+        self.count = 0
+        self.passes = 0
+        self.runtime = self._stats()
+        self.atomic_actions = {}
+
+    def _stats(self):
+        if self.percentiles:
+            return RunningStats(QuantileSketch(self.relative_accuracy))
+        return RunningStats()
+
+    def add(self, doc):
+        if self.timestamp is None:
+            self.timestamp = doc.get("run_at")
+        self.count += 1
+        if doc.get("result") == "pass":
+            self.passes += 1
+        self.runtime.add(doc.get("runtime"))
+
+        for name, value in doc.get("atomic_actions").items():
+            if value is None:
+                continue
+            stats = self.atomic_actions.get(name)
+            if stats is None:
+                stats = self.atomic_actions[name] = self._stats()
+            stats.add(float(value))
+
+    def merge(self, other):
+        if self.timestamp is None or (other.timestamp is not None and
+                                      other.timestamp < self.timestamp):
+            self.timestamp = other.timestamp
+        self.run_ids.extend(other.run_ids)
+        self.count += other.count
+        self.passes += other.passes
+        self.runtime.merge(other.runtime)
+        for name, other_stats in other.atomic_actions.items():
+            stats = self.atomic_actions.get(name)
+            if stats is None:
+                stats = self.atomic_actions[name] = self._stats()
+            stats.merge(other_stats)
+
+    def doc(self):
+        doc = {
+            "scenario_name": "aggregated_results",
+            "scenario": self.scenario_name,
+            "run_id": self.run_id,
+            "timestamp": self.timestamp,
+            "success_percentage": float(self.passes) / float(self.count),
+            "avg_runtime": self.runtime.total / float(self.count),
+            "action_count": self.count,
+            "atomic_actions": {name: stats.as_dict(self.percentiles)
+                               for name, stats
+                               in self.atomic_actions.items()}}
+        if self.percentiles:
+            doc["runtime_stats"] = self.runtime.as_dict(self.percentiles)
+        return doc
+
+    def to_dict(self):
+        return {"scenario_name": self.scenario_name,
+                "run_id": self.run_id,
+                "percentiles": self.percentiles,
+                "relative_accuracy": self.relative_accuracy,
+                "timestamp": self.timestamp,
+                "count": self.count,
+                "passes": self.passes,
+                "runtime": self.runtime.to_dict(),
+                "atomic_actions": {name: stats.to_dict() for name, stats
+                                   in self.atomic_actions.items()}}
+
+    @classmethod
+    def from_dict(cls, data):
+        aggregator = cls(data["scenario_name"], data["run_id"],
+                         data["percentiles"], data["relative_accuracy"])
+        aggregator.timestamp = data["timestamp"]
+        aggregator.count = data["count"]
+        aggregator.passes = data["passes"]
+        aggregator.runtime = RunningStats.from_dict(data["runtime"])
+        aggregator.atomic_actions = {
+            name: RunningStats.from_dict(stats)
+            for name, stats in data["atomic_actions"].items()}
+        return aggregator
+
+
+class RollupAggregator(object):
+    """Folds the iterations of one Rally run into fixed time buckets.
+
+    Buckets are aligned to multiples of bucket_seconds since the epoch and
+    keyed by the iteration timestamp. Each one keeps a RunAggregator, so a
+    bucket document carries the same count, success and runtime/action
+    statistics as aggregated_results, only for its slice of the run. All
+    buckets stay open until the run ends because Rally does not guarantee
+    iterations are reported in time order.
+    """
+
+    def __init__(self, scenario_name, run_id, bucket_seconds,
+                 percentiles=(), relative_accuracy=0.01):
+        self.scenario_name = scenario_name
+        self.run_id = run_id
+        self.bucket_seconds = bucket_seconds
+        self.percentiles = percentiles
+        self.relative_accuracy = relative_accuracy
+        self.buckets = {}
+
+    def add(self, doc, timestamp):
+        start = int(timestamp // self.bucket_seconds * self.bucket_seconds)
+        bucket = self.buckets.get(start)
+        if bucket is None:
+            bucket = self.buckets[start] = RunAggregator(
+                self.scenario_name, self.run_id, self.percentiles,
+                self.relative_accuracy)
+        bucket.add(doc)
+
+    def docs(self):
+        for start in sorted(self.buckets):
+            bucket = self.buckets[start]
+            doc = bucket.doc()
+            doc.update({
+                "scenario_name": "rollup_results",
+                "timestamp": datetime.datetime.fromtimestamp(start).strftime(
+                    "%Y-%m-%dT%H:%M:%S"),
+                "bucket_seconds": self.bucket_seconds,
+                "pass_count": bucket.passes,
+                "fail_count": bucket.count - bucket.passes})
+            yield start, doc
+
+
+def merge_saved_runs(paths):
+    # Each path holds one RunAggregator.to_dict() JSON object per line, as
+    # written by elastic-benchmark --sketch-output. Runs of the same scenario
+    # are merged into one aggregator, keyed by scenario name.
+    merged = {}
+    for path in paths:
+        with open_input(path) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                run = RunAggregator.from_dict(json.loads(line))
+                if run.scenario_name in merged:
+                    merged[run.scenario_name].merge(run)
+                else:
+                    merged[run.scenario_name] = run
+    return merged
@@ -0,0 +1,188 @@
+import collections
+import errno
+import multiprocessing
+import os
+import Queue
+import sys
+import time
+
+from elastic_benchmark.inputs import open_input
+from elastic_benchmark.main import parse_output, parse_settings
+from elastic_benchmark.manifest import file_digest
+from elastic_benchmark.profiling import optional_stage
+from elastic_benchmark.schema import normalize_rally_doc
+from elastic_benchmark.sinks import open_sink
+
+# Documents handed from a worker to the indexing process at a time.
+CHUNK_SIZE = 500
+
+# Set in every worker process by _init_worker.
+_queue = None
+_options = None
+_claims = None
+
+
+class QueueWriter(object):
+    # Stands in for the --sketch-output file inside workers; the parent
+    # writes the lines, so runs parsed in parallel never interleave.
+
+    def __init__(self, path):
+        self.path = path
+
+    def write(self, data):
+        _queue.put(("sketch", self.path, data))
+
+
+def _init_worker(queue, options, claims):
+    global _queue, _options, _claims
+    _queue = queue
+    _options = options
+    _claims = claims
+
+
+def _parse_file(task):
+    index, path = task
+    # Written to shared memory rather than sent through the queue, so the
+    # parent sees which worker took the file even if it dies right away.
+    _claims[index] = os.getpid()
+    environment, settings, sketch, normalized, manifest = _options
+    count = 0
+    docs = []
+    error = None
+    digest = None
+    try:
+        digest = file_digest(path)
+        if manifest and manifest.ingested(digest):
+            _queue.put(("done", path, (0, None, digest, True)))
+            return
+        with open_input(path) as f:
+            sketch_output = QueueWriter(path) if sketch else None
+            for doc in parse_output(f, environment,
+                                    sketch_output=sketch_output,
+                                    run_key=digest, **settings):
+                if normalized:
+                    doc = normalize_rally_doc(doc)
+                docs.append(doc)
+                if len(docs) >= CHUNK_SIZE:
+                    _queue.put(("docs", path, docs))
+                    count += len(docs)
+                    docs = []
+    except Exception as e:
+        # One bad file must not stop the others. Documents already handed
+        # over stay indexed and are reported with the error.
+        error = "{0}: {1}".format(type(e).__name__, e)
+    if docs:
+        _queue.put(("docs", path, docs))
+        count += len(docs)
+    _queue.put(("done", path, (count, error, digest, False)))
+
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno != errno.ESRCH
+    return True
+
+
+def lost_files(paths, results, claims, received, tasks):
+    # Files whose worker died before reporting back, killed by the OOM
+    # killer or a crash in a decoder. The pool replaces the worker but not
+    # its task, so without this the parent would wait forever.
+    lost = {}
+    for index, path in enumerate(paths):
+        if path in results:
+            continue
+        pid = claims[index]
+        if tasks.ready() or (pid and not process_alive(pid)):
+            lost[path] = (received[path], "worker process died before "
+                          "finishing the file", None, False)
+    return lost
+
+
+def ingest_files(paths, cl_args, profiler=None, manifest=None):
+    """Parses many Rally reports in worker processes into one sink.
+
+    Every worker parses whole files and hands their documents over in
+    chunks through a bounded queue, so workers pause when indexing falls
+    behind. Files the manifest already lists are skipped, and the manifest
+    is only updated once every document has been indexed. A summary of
+    parsed, skipped and failed files is written to stderr. Returns True if
+    every file was parsed and every document indexed.
+    """
+    start = time.time()
+    unchanged = set()
+    if manifest:
+        unchanged = set(path for path in paths if manifest.unchanged(path))
+        paths = [path for path in paths if path not in unchanged]
+    workers = max(1, min(cl_args.workers, len(paths)))
+    queue = multiprocessing.Queue(workers * 4)
+    options = (cl_args.environment, parse_settings(cl_args),
+               cl_args.sketch_output is not None, cl_args.normalized,
+               manifest)
+
+    # Pid of the worker that took each file, and documents received per
+    # file.
+    claims = multiprocessing.RawArray("i", len(paths))
+    received = collections.Counter()
+
+    # Fork the workers before the sink starts any threads.
+    pool = multiprocessing.Pool(workers, _init_worker,
+                                (queue, options, claims))
+    results = {}
+    try:
+        tasks = pool.map_async(_parse_file, list(enumerate(paths)),
+                               chunksize=1)
+        with open_sink(cl_args, profiler) as bulk:
+            while len(results) < len(paths):
+                try:
+                    with optional_stage(profiler, "wait"):
+                        kind, path, value = queue.get(timeout=1.0)
+                except Queue.Empty:
+                    if bulk.flush_due():
+                        bulk.flush()
+                    results.update(lost_files(paths, results, claims,
+                                              received, tasks))
+                    continue
+
+                if kind == "docs":
+                    received[path] += len(value)
+                    with optional_stage(profiler, "index"):
+                        for doc in value:
+                            bulk.index(logs=cl_args.logs,
+                                       env=cl_args.environment, **doc)
+                elif kind == "sketch":
+                    cl_args.sketch_output.write(value)
+                else:
+                    results[path] = value
+            with optional_stage(profiler, "flush"):
+                bulk.flush()
+    finally:
+        pool.terminate()
+
+    documents = sum(result[0] for result in results.values())
+    failed = [path for path in paths if results[path][1]]
+    skipped = len(unchanged) + len(
+        [path for path in paths if results[path][3]])
+    if profiler:
+        profiler.count("documents", documents)
+        profiler.count("bytes_read", sum(
+            os.path.getsize(path) for path in paths
+            if not results[path][1] and not results[path][3]))
+
+    sys.stderr.write(
+        "Parsed {0} files ({1} skipped, {2} failed) into {3} documents in "
+        "{4:.1f}s\n".format(len(paths) + len(unchanged), skipped,
+                            len(failed), documents, time.time() - start))
+    for path in failed:
+        count, error = results[path][:2]
+        sys.stderr.write("Failed to parse {0} after {1} documents: "
+                         "{2}\n".format(path, count, error))
+    indexed = bulk.report()
+    if manifest and indexed and bulk.delivered():
+        for path in paths:
+            count, error, digest = results[path][:3]
+            if not error:
+                manifest.record(path, digest)
+        manifest.save()
+    return indexed and not failed
@@ -0,0 +1,95 @@
+import cPickle
+import hashlib
+import os
+import tempfile
+import zlib
+
+# Bump whenever the parsed form of a subunit file changes, so entries
+# written by an older parser are never served.
+PARSER_VERSION = 1
+
+
+class ResultCache(object):
+    """On-disk cache of parsed subunit results, keyed by content hash.
+
+    Entries are zlib compressed pickles. Reading an entry refreshes its
+    modification time and the least recently used entries are removed
+    once the directory grows past ``max_bytes``.
+    """
+
+    suffix = ".subunit-cache"
+
+    def __init__(self, directory, max_bytes=256 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def key(self, path, *extra):
+        digest = hashlib.sha1()
+        digest.update("{0}\0".format(PARSER_VERSION))
+        for value in extra:
+            digest.update("{0}\0".format(value))
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), ""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + self.suffix)
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                value = cPickle.loads(zlib.decompress(f.read()))
+        except (IOError, OSError):
+            return None
+        except Exception:
+            # A corrupt or incompatible entry is just a miss.
+            self._remove(path)
+            return None
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return value
+
+    def put(self, key, value):
+        data = zlib.compress(cPickle.dumps(value, cPickle.HIGHEST_PROTOCOL))
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.rename(tmp_path, self._path(key))
+        except (IOError, OSError) as e:
+            self._remove(tmp_path)
+            print "Could not write cache entry {}: {}".format(key, e)
+            return
+        self.evict()
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def evict(self):
+        entries = []
+        total = 0
+        for name in os.listdir(self.directory):
+            if not name.endswith(self.suffix):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+        for mtime, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
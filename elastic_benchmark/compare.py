@@ -0,0 +1,311 @@
+import argparse
+import json
+import sys
+
+from elastic_benchmark.main import ElasticSearchClient
+from elastic_benchmark.profiling import PROFILE_SCENARIO
+from elastic_benchmark.sketch import percentile_name, percentiles_argument
+
+# Indices under an environment that hold something other than iterations.
+NON_ITERATION_SCENARIOS = ("aggregated_results", "rollup_results",
+                           PROFILE_SCENARIO, "upgrade_*")
+
+# Scenario name prefixes parse_output adds for before/after environments.
+RUN_PREFIXES = ("before_", "after_", "_")
+
+# Most atomic actions fetched per scenario from normalized indices.
+MAX_ACTIONS = 1000
+
+
+def iteration_indices(env):
+    return ",".join(["{0}_*".format(env)] +
+                    ["-{0}_{1}".format(env, name)
+                     for name in NON_ITERATION_SCENARIOS])
+
+
+def scenario_key(env, index):
+    # Index names are "{env}_{prefix}_{scenario}"; before and after runs of
+    # a scenario share the part after the prefix.
+    name = index[len(env) + 1:]
+    for prefix in RUN_PREFIXES:
+        if name.startswith(prefix):
+            return name[len(prefix):]
+    return name
+
+
+def mapping_properties(mapping):
+    mappings = mapping.get("mappings", {})
+    if "properties" in mappings:
+        return mappings["properties"]
+    # Mappings of 6.x clusters are still nested under the document type.
+    for type_mapping in mappings.values():
+        return type_mapping.get("properties", {})
+    return {}
+
+
+def describe_indices(client, env):
+    """Looks at the mappings to find how iterations were indexed.
+
+    Returns the field to match passing results on, the atomic action names
+    stored as plain object fields, and whether any index stores actions as
+    nested records (--normalized).
+    """
+    mappings = client.indices.get_mapping(index=iteration_indices(env),
+                                          ignore_unavailable=True,
+                                          allow_no_indices=True)
+    result_field = "result"
+    actions = set()
+    nested = False
+    for mapping in mappings.values():
+        properties = mapping_properties(mapping)
+        result = properties.get("result", {})
+        if result.get("type") != "keyword" and \
+                "keyword" in result.get("fields", {}):
+            result_field = "result.keyword"
+        atomic_actions = properties.get("atomic_actions", {})
+        if atomic_actions.get("type") == "nested":
+            nested = True
+        else:
+            actions.update(atomic_actions.get("properties", {}))
+    return result_field, sorted(actions), nested
+
+
+def stats_aggs(field, percentiles):
+    aggs = {"stats": {"stats": {"field": field}}}
+    if percentiles:
+        aggs["percentiles"] = {"percentiles": {"field": field,
+                                               "percents": percentiles}}
+    return aggs
+
+
+def scenario_query(percentiles, result_field, actions, nested, page_size,
+                   after=None):
+    aggs = stats_aggs("runtime", percentiles)
+    aggs["passes"] = {"filter": {"term": {result_field: "pass"}}}
+    for i, name in enumerate(actions):
+        # Aggregation names cannot hold every character action names can.
+        field = "atomic_actions.{0}".format(name)
+        aggs["action_{0}".format(i)] = {
+            "filter": {"exists": {"field": field}},
+            "aggs": stats_aggs(field, percentiles)}
+    if nested:
+        aggs["records"] = {
+            "nested": {"path": "atomic_actions"},
+            "aggs": {"names": {
+                "terms": {"field": "atomic_actions.name",
+                          "size": MAX_ACTIONS},
+                "aggs": stats_aggs("atomic_actions.value", percentiles)}}}
+
+    composite = {"size": page_size,
+                 "sources": [{"index": {"terms": {"field": "_index"}}}]}
+    if after:
+        composite["after"] = after
+    return {"size": 0,
+            "query": {"exists": {"field": "runtime"}},
+            "aggs": {"scenarios": {"composite": composite, "aggs": aggs}}}
+
+
+def read_stats(bucket):
+    stats = bucket["stats"]
+    if not stats.get("count"):
+        return None
+    values = {"avg": stats["avg"], "min": stats["min"], "max": stats["max"]}
+    for percent, value in bucket.get("percentiles", {}).get(
+            "values", {}).items():
+        values[percentile_name(float(percent))] = value
+    return values
+
+
+def collect_side(client, env, percentiles, page_size=100):
+    """Aggregates every scenario of an environment on the cluster.
+
+    Scenarios are paged through with a composite aggregation on the index
+    name, so only page_size scenarios are in a response at once. Returns
+    a dict of scenario name to iteration count, success percentage and
+    runtime and per-action statistics.
+    """
+    result_field, actions, nested = describe_indices(client, env)
+    scenarios = {}
+    after = None
+    while True:
+        response = client.search(
+            index=iteration_indices(env), ignore_unavailable=True,
+            allow_no_indices=True,
+            body=scenario_query(percentiles, result_field, actions, nested,
+                                page_size, after))
+        composite = response.get("aggregations", {}).get("scenarios", {})
+        buckets = composite.get("buckets", [])
+        for bucket in buckets:
+            count = bucket["doc_count"]
+            scenario = {
+                "count": count,
+                "success_percentage":
+                    100.0 * bucket["passes"]["doc_count"] / count,
+                "runtime": read_stats(bucket),
+                "actions": {}}
+            for i, name in enumerate(actions):
+                stats = read_stats(bucket["action_{0}".format(i)])
+                if stats:
+                    scenario["actions"][name] = stats
+            if nested:
+                for record in bucket["records"]["names"]["buckets"]:
+                    stats = read_stats(record)
+                    if stats:
+                        scenario["actions"][record["key"]] = stats
+            scenarios[scenario_key(env, bucket["key"]["index"])] = scenario
+
+        after = composite.get("after_key")
+        if not buckets or not after:
+            return scenarios
+
+
+def deltas(before, after):
+    changes = {}
+    for metric in sorted(set(before) & set(after)):
+        old, new = before[metric], after[metric]
+        if old is None or new is None:
+            continue
+        changes[metric] = {
+            "before": old, "after": new,
+            "change_pct": (new / old - 1) * 100 if old else None}
+    return changes
+
+
+def regressed(changes, threshold):
+    # Extremes are single iterations and too noisy to fail a comparison on.
+    return [metric for metric, change in sorted(changes.items())
+            if metric not in ("min", "max") and
+            change["change_pct"] is not None and
+            change["change_pct"] > threshold]
+
+
+def compare_runs(before, after, runtime_threshold=10.0,
+                 success_threshold=1.0):
+    """Compares the scenarios of two collect_side results.
+
+    A scenario regresses when its success percentage drops by more than
+    success_threshold points, or when its runtime or one of its atomic
+    actions gets slower by more than runtime_threshold percent on the
+    average or any percentile.
+    """
+    report = []
+    for name in sorted(set(before) | set(after)):
+        old, new = before.get(name), after.get(name)
+        if old is None or new is None:
+            report.append({"scenario": name,
+                           "missing": "before" if old is None else "after",
+                           "regressions": []})
+            continue
+
+        success_delta = new["success_percentage"] - old["success_percentage"]
+        runtime = deltas(old["runtime"] or {}, new["runtime"] or {})
+        actions = {action: deltas(old["actions"][action],
+                                  new["actions"][action])
+                   for action in set(old["actions"]) & set(new["actions"])}
+
+        regressions = []
+        if success_delta < -success_threshold:
+            regressions.append("success_percentage")
+        regressions.extend("runtime.{0}".format(metric)
+                           for metric in regressed(runtime,
+                                                   runtime_threshold))
+        for action in sorted(actions):
+            regressions.extend("{0}.{1}".format(action, metric)
+                               for metric in regressed(actions[action],
+                                                       runtime_threshold))
+        report.append({"scenario": name,
+                       "before_count": old["count"],
+                       "after_count": new["count"],
+                       "success_delta": round(success_delta, 2),
+                       "runtime": runtime,
+                       "actions": actions,
+                       "regressions": regressions})
+    return report
+
+
+def print_report(report):
+    for row in report:
+        if "missing" in row:
+            print "{0}: no {1} run".format(row["scenario"], row["missing"])
+            continue
+        print "{0}: {1} -> {2} iterations, success {3:+.2f} points".format(
+            row["scenario"], row["before_count"], row["after_count"],
+            row["success_delta"])
+        changes = [("runtime", row["runtime"])] + sorted(row["actions"].items())
+        for name, metrics in changes:
+            for metric, change in sorted(metrics.items()):
+                if change["change_pct"] is None:
+                    continue
+                print "  {0:<40} {1:<6} {2:>10.3f} -> {3:>10.3f} " \
+                      "({4:+.1f}%)".format(name, metric, change["before"],
+                                           change["after"],
+                                           change["change_pct"])
+        if row["regressions"]:
+            print "  REGRESSED: {0}".format(", ".join(row["regressions"]))
+
+
+class ArgumentParser(argparse.ArgumentParser):
+    def __init__(self):
+        desc = "Compares before and after runs stored in ElasticSearch."
+        usage_string = "elastic-benchmark compare -b <environment> " \
+                       "[-a <environment>]"
+
+        super(ArgumentParser, self).__init__(
+            usage=usage_string, description=desc)
+
+        self.prog = "Argument Parser"
+
+        self.add_argument(
+            "-b", "--before", metavar="<environment>", required=True,
+            help="Environment the before run was indexed under.")
+
+        self.add_argument(
+            "-a", "--after", metavar="<environment>", default=None,
+            help="Environment the after run was indexed under. Defaults to "
+                 "the before environment with 'before' replaced by "
+                 "'after'.")
+
+        self.add_argument(
+            "--percentiles", metavar="<p1,p2,...>", default="50,90,95,99",
+            type=percentiles_argument,
+            help="Runtime percentiles to compare.")
+
+        self.add_argument(
+            "--runtime-threshold", metavar="<percent>", type=float,
+            default=10.0,
+            help="Flag runtimes and actions slower by more than this.")
+
+        self.add_argument(
+            "--success-threshold", metavar="<points>", type=float,
+            default=1.0,
+            help="Flag success percentages lower by more than this.")
+
+        self.add_argument(
+            "--page-size", metavar="<scenarios>", type=int, default=100,
+            help="Scenarios fetched per composite aggregation page.")
+
+        self.add_argument(
+            "--json", action="store_true", default=False,
+            help="Print the comparison as JSON.")
+
+
+def entry_point(argv=None):
+    cl_args = ArgumentParser().parse_args(argv)
+    after_env = cl_args.after or cl_args.before.replace("before", "after")
+    if after_env == cl_args.before:
+        raise SystemExit("Give the after environment with --after")
+
+    client = ElasticSearchClient().client
+    percentiles = cl_args.percentiles
+    before = collect_side(client, cl_args.before, percentiles,
+                          cl_args.page_size)
+    after = collect_side(client, after_env, percentiles, cl_args.page_size)
+    report = compare_runs(before, after, cl_args.runtime_threshold,
+                          cl_args.success_threshold)
+
+    if cl_args.json:
+        print json.dumps(report, indent=2, sort_keys=True)
+    else:
+        print_report(report)
+    if any(row["regressions"] for row in report):
+        sys.exit(1)
@@ -0,0 +1,235 @@
+import argparse
+import bz2
+import glob
+import mmap
+import os
+import stat
+import sys
+import zlib
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Uncompressed files at least this large are memory mapped instead of read
+# through stdio buffers.
+MMAP_THRESHOLD = 32 * 1024 * 1024
+
+# Formats are recognised by their magic bytes, not by file name.
+MAGIC = (("\x1f\x8b", "gzip"),
+         ("BZh", "bzip2"),
+         ("\xfd7zXZ\x00", "xz"),
+         ("\x28\xb5\x2f\xfd", "zstd"))
+
+
+def detect_compression(stream):
+    # Returns the format name of a seekable stream, or None if it is not
+    # compressed. The stream is left at its start.
+    head = stream.read(6)
+    stream.seek(0)
+    for magic, name in MAGIC:
+        if head.startswith(magic):
+            return name
+    return None
+
+
+def decompressor_factory(name):
+    if name == "gzip":
+        return lambda: zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if name == "bzip2":
+        return bz2.BZ2Decompressor
+    if name == "xz":
+        if lzma is None:
+            raise IOError("Reading xz input needs the backports.lzma module")
+        return lzma.LZMADecompressor
+    if zstandard is None:
+        raise IOError("Reading zstd input needs the zstandard module")
+    return lambda: zstandard.ZstdDecompressor().decompressobj()
+
+
+class DecompressingReader(object):
+    """File-like object decompressing a stream as it is read.
+
+    Only the compressed chunk being decoded and the decompressed data not
+    yet consumed are held in memory. Concatenated members (as written by
+    ``cat a.gz b.gz`` or parallel compressors) are read one after another.
+    """
+
+    def __init__(self, stream, new_decompressor, chunk_size=256 * 1024):
+        self.stream = stream
+        self.new_decompressor = new_decompressor
+        self.decompressor = new_decompressor()
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        data = self.stream.read(self.chunk_size)
+        if not data:
+            self.eof = True
+            return
+        out = []
+        while data:
+            if getattr(self.decompressor, "eof", False):
+                self.decompressor = self.new_decompressor()
+            try:
+                out.append(self.decompressor.decompress(data))
+            except EOFError:
+                # The last member ended exactly at the end of the previous
+                # chunk, leaving no unused_data to notice it by.
+                self.decompressor = self.new_decompressor()
+                out.append(self.decompressor.decompress(data))
+            data = getattr(self.decompressor, "unused_data", "")
+            if data:
+                self.decompressor = self.new_decompressor()
+        self.buffer = self.buffer[self.pos:] + "".join(out)
+        self.pos = 0
+
+    def read(self, size=-1):
+        while not self.eof and (size < 0 or
+                                len(self.buffer) - self.pos < size):
+            self._fill()
+        end = len(self.buffer) if size < 0 else self.pos + size
+        data = self.buffer[self.pos:end]
+        self.pos += len(data)
+        return data
+
+    def readline(self, size=-1):
+        while True:
+            end = self.buffer.find("\n", self.pos)
+            if end >= 0:
+                end += 1
+                break
+            if self.eof or 0 <= size <= len(self.buffer) - self.pos:
+                end = len(self.buffer)
+                break
+            self._fill()
+        if size >= 0:
+            end = min(end, self.pos + size)
+        line = self.buffer[self.pos:end]
+        self.pos = end
+        return line
+
+    def __iter__(self):
+        return iter(self.readline, "")
+
+    def close(self):
+        self.stream.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+
+class MappedReader(object):
+    # File-like view of a memory mapped file. It deliberately has no
+    # fileno(), so subunit reads it directly instead of polling it with
+    # select() byte by byte.
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.map = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def read(self, size=-1):
+        if size < 0:
+            size = self.map.size() - self.map.tell()
+        return self.map.read(size)
+
+    def readline(self):
+        return self.map.readline()
+
+    def __iter__(self):
+        return iter(self.map.readline, "")
+
+    def close(self):
+        self.map.close()
+        self.stream.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+
+def open_input(path, mmap_threshold=MMAP_THRESHOLD):
+    """Opens an input file for reading whatever its compression.
+
+    gzip, bzip2, xz and zstd files are decompressed while they are read,
+    large uncompressed files are memory mapped and anything else is returned
+    as a plain file object. ``-`` stands for stdin, which is read as is.
+    """
+    if path == "-":
+        return sys.stdin
+
+    stream = open(path, "rb")
+    try:
+        info = os.fstat(stream.fileno())
+        if not stat.S_ISREG(info.st_mode):
+            return stream
+        name = detect_compression(stream)
+        if name:
+            return DecompressingReader(stream, decompressor_factory(name))
+        if mmap_threshold is not None and info.st_size >= mmap_threshold:
+            return MappedReader(stream)
+    except Exception:
+        stream.close()
+        raise
+    return stream
+
+
+def expand_inputs(patterns):
+    """Turns input arguments into a list of files.
+
+    Directories are walked recursively (skipping hidden files) and glob
+    patterns are expanded; a pattern matching nothing is kept as is so it
+    is reported as missing. Each file is listed once.
+    """
+    paths = []
+    for pattern in patterns:
+        if pattern != "-" and glob.has_magic(pattern):
+            matches = sorted(glob.glob(pattern)) or [pattern]
+        else:
+            matches = [pattern]
+        for match in matches:
+            if not os.path.isdir(match):
+                paths.append(match)
+                continue
+            for root, dirs, files in os.walk(match):
+                dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+                paths.extend(os.path.join(root, name) for name in sorted(files)
+                             if not name.startswith("."))
+
+    seen = set()
+    unique = []
+    for path in paths:
+        if path not in seen:
+            seen.add(path)
+            unique.append(path)
+    return unique
+
+
+def is_compressed(path):
+    with open(path, "rb") as f:
+        return detect_compression(f) is not None
+
+
+def input_file(path):
+    # argparse type for input arguments.
+    try:
+        return open_input(path)
+    except IOError as e:
+        raise argparse.ArgumentTypeError(
+            "can't open '{0}': {1}".format(path, e))
@@ -0,0 +1,106 @@
+import json
+
+
+class JSONStreamReader(object):
+    """Walks a Rally JSON report without loading it into memory at once.
+
+    Only the structure around the scenario list and each scenario's
+    ``result`` list is tokenized by hand; every other value (and every single
+    iteration) is handed to ``json.JSONDecoder.raw_decode`` on its own, so
+    the buffer never holds more than the largest one of those values.
+    """
+
+    whitespace = " \t\n\r"
+    delimiters = whitespace + ",:]}"
+
+    def __init__(self, stream, chunk_size=64 * 1024):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self, size=None):
+        if self.eof:
+            return False
+        if self.pos > self.chunk_size:
+            self.buffer = self.buffer[self.pos:]
+            self.pos = 0
+        chunk = self.stream.read(size or self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer += chunk
+        return True
+
+    def _peek(self):
+        while True:
+            while self.pos < len(self.buffer):
+                if self.buffer[self.pos] not in self.whitespace:
+                    return self.buffer[self.pos]
+                self.pos += 1
+            if not self._fill():
+                raise ValueError("Unexpected end of JSON input")
+
+    def _expect(self, chars):
+        char = self._peek()
+        if char not in chars:
+            raise ValueError("Expected one of {0!r} at offset {1}, got "
+                             "{2!r}".format(chars, self.pos, char))
+        self.pos += 1
+        return char
+
+    def _value(self):
+        self._peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except ValueError:
+                end = None
+            # A value cut off by the buffer boundary may still decode (e.g. a
+            # truncated number), so only trust it once a delimiter follows.
+            if end is not None and (self.eof or (
+                    end < len(self.buffer) and
+                    self.buffer[end] in self.delimiters)):
+                self.pos = end
+                return value
+            # Grow geometrically so huge values are not re-decoded too often.
+            if not self._fill(max(self.chunk_size, len(self.buffer))):
+                if end is not None:
+                    self.pos = end
+                    return value
+                raise ValueError("Invalid JSON at offset {0}".format(self.pos))
+
+    def _items(self, close):
+        # Yields nothing itself; drives the comma handling of a container
+        # whose opening bracket has already been consumed.
+        if self._peek() == close:
+            self.pos += 1
+            return
+        while True:
+            yield
+            if self._expect("," + close) == close:
+                return
+
+    def iter_events(self):
+        """Yields (event, value) pairs for a Rally task report.
+
+        Events are ``start`` and ``end`` around each scenario, ``field`` with
+        a (name, value) pair for every scenario member other than
+        ``result``, and ``iteration`` for each entry of ``result``.
+        """
+        self._expect("[")
+        for _ in self._items("]"):
+            self._expect("{")
+            yield "start", None
+            for _ in self._items("}"):
+                name = self._value()
+                self._expect(":")
+                if name == "result" and self._peek() == "[":
+                    self.pos += 1
+                    for _ in self._items("]"):
+                        yield "iteration", self._value()
+                else:
+                    yield "field", (name, self._value())
+            yield "end", None
@@ -2,89 +2,458 @@ import argparse
 import datetime
 import dateutil.parser
 import json
+import multiprocessing
+import Queue
 import re
+import StringIO
 import sys
+import threading
+import time
 import uuid
+import zlib
 
 from elasticsearch import Elasticsearch
+from elasticsearch.serializer import JSONSerializer
+from elastic_benchmark.aggregation import RollupAggregator, RunAggregator
+from elastic_benchmark.inputs import expand_inputs, open_input
+from elastic_benchmark.jsonstream import JSONStreamReader
+from elastic_benchmark.profiling import (
+    CountingReader, Profiler, add_profile_arguments, optional_stage,
+    publish_profile)
+from elastic_benchmark.schema import IndexCache, normalize_rally_doc
+from elastic_benchmark.sketch import percentiles_argument
+
+
+PERCENTILES = [50, 90, 95, 99]
+
+# Namespace of the run ids derived from input content.
+RUN_NAMESPACE = uuid.UUID("6a1f8f62-3c1e-5d0a-9d6e-2b8f4c7e9a10")
+
+
+def index_name(env, scenario_name):
+    return "{0}_{1}".format(env, scenario_name.lower())
 
 
 class ElasticSearchClient(object):
-    def __init__(self):
-        self.client = Elasticsearch()
+    def __init__(self, managed=False, **kwargs):
+        self.client = Elasticsearch(**kwargs)
+        # Managed clients install the index templates and create indices
+        # explicitly instead of relying on dynamic mappings.
+        self.indices = IndexCache(self.client) if managed else None
 
     def index(self, scenario_name, env, **kwargs):
+        index = index_name(env, scenario_name)
+        if self.indices:
+            self.indices.ensure(index, env)
 
         self.client.index(
-            index="{0}_{1}".format(env, scenario_name.lower()),
+            index=index,
             doc_type='results', body=kwargs)
 
+    def bulk_indexer(self, concurrency=1, queue_size=None, spool_dir=None,
+                     drain_timeout=None, **kwargs):
+        kwargs["indices"] = self.indices
+        if spool_dir:
+            from elastic_benchmark.spool import SpoolingIndexer
+            return SpoolingIndexer(self.client, spool_dir, drain_timeout,
+                                   **kwargs)
+        if concurrency > 1:
+            return ConcurrentBulkIndexer(self.client, concurrency, queue_size,
+                                         **kwargs)
+        return BulkIndexer(self.client, **kwargs)
+
+
+class BulkIndexer(object):
+    """Buffers documents and sends them through the _bulk API.
+
+    A batch is flushed once it holds batch_size documents, once adding a
+    document would push it past batch_bytes, or once flush_interval seconds
+    have passed since the last flush. Items the cluster rejects are kept in
+    failures as (index, status, error) tuples.
+    """
+
+    def __init__(self, client, batch_size=500, batch_bytes=5 * 1024 * 1024,
+                 flush_interval=5.0, indices=None, profiler=None):
+        self.client = client
+        self.indices = indices
+        self.profiler = profiler
+        if client is not None:
+            self.serializer = client.transport.serializer
+        else:
+            self.serializer = JSONSerializer()
+        self.batch_size = batch_size
+        self.batch_bytes = batch_bytes
+        self.flush_interval = flush_interval
+        self.lines = []
+        self.count = 0
+        self.size = 0
+        self.last_flush = time.time()
+        self.indexed = 0
+        self.failures = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def index(self, scenario_name, env, _id=None, **kwargs):
+        index = index_name(env, scenario_name)
+        if self.indices:
+            self.indices.ensure(index, env)
+        metadata = {"_index": index, "_type": "results"}
+        if _id is not None:
+            metadata["_id"] = _id
+        action = self.serializer.dumps({"index": metadata})
+        source = self.serializer.dumps(kwargs)
+        size = len(action) + len(source) + 2
+
+        if self.count and self.size + size > self.batch_bytes:
+            self._flush_batch()
+
+        self.lines.extend([action, source])
+        self.count += 1
+        self.size += size
+
+        if self.count >= self.batch_size or self.flush_due():
+            self._flush_batch()
+
+    def flush_due(self):
+        return time.time() - self.last_flush >= self.flush_interval
+
+    def _flush_batch(self):
+        self.last_flush = time.time()
+        if not self.count:
+            return
+
+        body = "\n".join(self.lines) + "\n"
+        self.lines = []
+        self.count = 0
+        self.size = 0
+        self._send(body)
+
+    def _request(self, body):
+        if self.profiler is None:
+            return self.client.bulk(body=body)
+        return self.profiler.request(self.client.bulk, body=body)
+
+    def _send(self, body):
+        response = self._request(body)
+        self._record(response)
+
+    def _record(self, response):
+        for item in response.get("items", []):
+            op, result = item.popitem()
+            if result.get("status", 500) >= 300 or "error" in result:
+                self.failures.append((result.get("_index"),
+                                      result.get("status"),
+                                      result.get("error")))
+            else:
+                self.indexed += 1
+
+    def flush(self):
+        self._flush_batch()
+
+    def close(self):
+        self.flush()
+
+    def report(self):
+        for index, status, error in self.failures:
+            sys.stderr.write("Failed to index document into {0} ({1}): "
+                             "{2}\n".format(index, status, error))
+        return not self.failures
+
+    def delivered(self):
+        # Whether the cluster has accepted every document, once closed.
+        return not self.failures
+
+
+class ConcurrentBulkIndexer(BulkIndexer):
+    """BulkIndexer that keeps several bulk requests in flight.
+
+    Finished batches go onto a bounded queue drained by ``concurrency``
+    worker threads sharing the client's connection pool. Once queue_size
+    batches are waiting, index() blocks until a worker frees a slot, so
+    parsers cannot run arbitrarily far ahead of the cluster. flush() returns
+    only after every queued batch has been sent.
+    """
+
+    def __init__(self, client, concurrency=4, queue_size=None, **kwargs):
+        super(ConcurrentBulkIndexer, self).__init__(client, **kwargs)
+        self.lock = threading.Lock()
+        self.queue = Queue.Queue(queue_size or concurrency * 2)
+        self.workers = []
+        for _ in range(concurrency):
+            worker = threading.Thread(target=self._work)
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+
+    def _send(self, body):
+        self.queue.put(body)
+
+    def _work(self):
+        while True:
+            body = self.queue.get()
+            try:
+                if body is None:
+                    return
+                try:
+                    response = self._request(body)
+                except Exception as e:
+                    # Every document of a batch that never reached the
+                    # cluster counts as failed.
+                    with self.lock:
+                        count = body.count("\n") // 2
+                        self.failures.extend([(None, None, str(e))] * count)
+                    continue
+                with self.lock:
+                    self._record(response)
+            finally:
+                self.queue.task_done()
+
+    def flush(self):
+        self._flush_batch()
+        self.queue.join()
+
+    def close(self):
+        self.flush()
+        for _ in self.workers:
+            self.queue.put(None)
+        for worker in self.workers:
+            worker.join()
+        self.workers = []
+
+
+def iteration_doc(scenario_name, run_id, ir):
+    run_at = ir.get('timestamp')
+    duration = ir.get('duration')
+    result = 'pass' if len(ir.get('error')) == 0 else 'fail'
+
+    return {
+        "scenario_name": scenario_name,
+        "run_id": run_id,
+        "run_at": datetime.datetime.fromtimestamp(int(run_at)).strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "runtime": duration,
+        "atomic_actions": {key.replace(".", ":"): val for key, val in ir.get("atomic_actions").items()},
+        "result": result}
+
+
+def sampled(doc_id, fraction):
+    # Keeps a stable subset of documents: the same ids are picked on every
+    # run, so re-ingesting never mixes two different samples.
+    if fraction >= 1:
+        return True
+    return (zlib.crc32(doc_id) & 0xffffffff) < fraction * 0x100000000
+
+
+def fold_iterations(iterations, aggregator, rollup=None, raw_sample=1.0):
+    # Adds iterations to the run's aggregates and yields the sampled raw
+    # documents.
+    for ir in iterations:
+        doc = iteration_doc(aggregator.scenario_name, aggregator.run_id, ir)
+        aggregator.add(doc)
+        if rollup:
+            rollup.add(doc, ir.get("timestamp"))
+        doc["_id"] = "{0}-{1}".format(aggregator.run_id, aggregator.count)
+        if sampled(doc["_id"], raw_sample):
+            yield doc
+
+
+def parse_output(output, environment=None, percentiles=PERCENTILES,
+                 sketch_accuracy=0.01, sketch_output=None, profiler=None,
+                 run_key=None, rollup_seconds=None, raw_sample=1.0):
+    """Yields a document per Rally iteration and one aggregate per scenario.
+
+    ``output`` may be the report as a string or a file object; file objects
+    are read incrementally so indexing can start before the whole report
+    has been read. Scenario names get a before/after prefix when the
+    environment name contains one.
 
-def parse_output(output):
+    Run ids are derived from ``run_key`` (normally a hash of the report)
+    and the scenario's position when it is given, and are random otherwise.
+    Every document carries an ``_id`` derived from its run id, so indexing
+    the same report twice overwrites the first copy.
+
+    With ``rollup_seconds`` every scenario also yields one rollup_results
+    document per time bucket of that many seconds. ``raw_sample`` is the
+    fraction of per-iteration documents yielded; all of them still count
+    towards the aggregated and rollup documents.
+    """
     prefix = ''
-    cl_args = ArgumentParser().parse_args()
-    if cl_args.environment:
-        if 'after' in cl_args.environment:
+    if environment:
+        if 'after' in environment:
             prefix = 'after'
-        elif 'before' in cl_args.environment:
+        elif 'before' in environment:
             prefix = 'before'
 
-    json_output = json.loads(output)
-    return_data = []
-    for o in json_output:
-        scenario_name = o.get("key", {}).get("kw", {}).get("args", {}).get(
-            "alternate_name", None) or o.get("key", {}).get("name", None)
-        run_id = str(uuid.uuid4())
-        for ir in o.get('result'):
-            run_at = ir.get('timestamp')
-            duration = ir.get('duration')
-            result = 'pass' if len(ir.get('error')) == 0 else 'fail'
-
-            return_data.append({
-                "scenario_name": prefix + "_" + scenario_name,
-                "run_id": run_id,
-                "run_at": datetime.datetime.fromtimestamp(int(run_at)).strftime("%Y-%m-%dT%H:%M:%S%z"),
-                "runtime": duration,
-                "atomic_actions": {key.replace(".", ":"): val for key, val in ir.get("atomic_actions").items()},
-                "result": result})
-
-    agg = {}
-    for item in return_data:
-        run_id = item.get("run_id")
-        if run_id in agg.keys():
-            agg.get(run_id).get("runtime").append(item.get("runtime"))
-            agg.get(run_id).get("atomic_actions").append(item.get("atomic_actions"))
-            result = 1 if item.get("result") == "pass" else 0
-            agg.get(run_id).update({
-                "passes": agg.get(run_id).get("passes") + result,
-                "count": agg.get(run_id).get("count") + 1})
-        else:
-            agg.update({item.get("run_id"): {
-                "passes": 1 if item.get("result") == "pass" else 0,
-                "scenario": item.get("scenario_name"),
-                "count": 1, "timestamp": item.get("run_at"),
-                "runtime": [item.get("runtime")],
-                "atomic_actions": [item.get("atomic_actions")]}})
-    for run_id, dic in agg.items():
-        atomic_actions = {k: {"min": min(v), "max": max(v), "avg": sum(v)/len(v)}
-                          for k, v in {ok: [float(i.get(ok)) for i in dic.get("atomic_actions") if i.get(ok) <> None]
-                          for ok in set().union(*(d.keys() for d in dic.get("atomic_actions")))}.items()}
-        return_data.append({
-            "scenario_name": "aggregated_results",
-            "scenario": dic.get("scenario"),
-            "run_id": run_id,
-            "timestamp": dic.get("timestamp"),
-            "success_percentage": float(dic.get("passes")) / float(dic.get("count")),
-            "avg_runtime": float(sum(dic.get("runtime"))) / float(dic.get("count")),
-            "action_count": dic.get("count"),
-            "atomic_actions": atomic_actions})
-    return return_data
+    if isinstance(output, basestring):
+        output = StringIO.StringIO(output)
+
+    scenario_name = None
+    scenarios = 0
+    events = JSONStreamReader(output).iter_events()
+    if profiler:
+        events = profiler.timed("decode", events)
+    for event, value in events:
+        if event == "start":
+            key = None
+            scenarios += 1
+            if run_key:
+                run_id = str(uuid.uuid5(RUN_NAMESPACE, "{0}:{1}".format(
+                    run_key, scenarios)))
+            else:
+                run_id = str(uuid.uuid4())
+            # Iterations that show up before the scenario's "key" field
+            # cannot be named yet, so they wait here until it is seen.
+            pending = []
+            aggregator = None
+            rollup = None
+        elif event == "field" and value[0] == "key":
+            key = value[1]
+            scenario_name = prefix + "_" + (key.get("kw", {}).get("args", {}).get(
+                "alternate_name", None) or key.get("name", None))
+            aggregator = RunAggregator(scenario_name, run_id, percentiles,
+                                       sketch_accuracy)
+            if rollup_seconds:
+                rollup = RollupAggregator(scenario_name, run_id,
+                                          rollup_seconds, percentiles,
+                                          sketch_accuracy)
+            for doc in fold_iterations(pending, aggregator, rollup, raw_sample):
+                yield doc
+            pending = []
+        elif event == "iteration":
+            if key is None:
+                pending.append(value)
+            else:
+                for doc in fold_iterations([value], aggregator, rollup,
+                                           raw_sample):
+                    yield doc
+        elif event == "end":
+            if key is None:
+                raise ValueError("Scenario without a key in Rally output")
+            if aggregator.count:
+                if sketch_output:
+                    sketch_output.write(json.dumps(aggregator.to_dict()) + "\n")
+                doc = aggregator.doc()
+                doc["_id"] = "{0}-summary".format(run_id)
+                yield doc
+            if rollup:
+                for start, doc in rollup.docs():
+                    doc["_id"] = "{0}-rollup-{1}".format(run_id, start)
+                    yield doc
+
+
+def index_rally_output(output, indexer, environment, logs=None,
+                       normalized=False, profiler=None, **kwargs):
+    count = 0
+    docs = parse_output(output, environment, profiler=profiler, **kwargs)
+    if profiler is None:
+        for line in docs:
+            if normalized:
+                line = normalize_rally_doc(line)
+            indexer.index(logs=logs, env=environment, **line)
+            count += 1
+        return count
+
+    # Same loop, with reading and decoding, aggregation and batching
+    # (including synchronous bulk requests) timed as separate stages.
+    for line in profiler.timed("aggregate", docs):
+        with profiler.stage("index"):
+            if normalized:
+                line = normalize_rally_doc(line)
+            indexer.index(logs=logs, env=environment, **line)
+        count += 1
+    profiler.count("documents", count)
+    return count
+
+
+def parse_settings(cl_args):
+    # parse_output keyword arguments shared by every Rally entry point.
+    return {"percentiles": cl_args.percentiles,
+            "sketch_accuracy": cl_args.sketch_accuracy,
+            "rollup_seconds": cl_args.rollup,
+            "raw_sample": cl_args.raw_sample}
+
+
+def manifest_context(cl_args):
+    # Everything besides the input that changes what is indexed where.
+    context = parse_settings(cl_args)
+    context.update({"environment": cl_args.environment,
+                    "normalized": cl_args.normalized,
+                    "sink": cl_args.sink,
+                    "sink_file": cl_args.sink_file})
+    return json.dumps(context, sort_keys=True)
+
+
+def add_bulk_arguments(parser):
+    parser.add_argument(
+        "--sink", choices=("elasticsearch", "file", "stdout", "null"),
+        default="elasticsearch",
+        help="Where documents go: ElasticSearch, a _bulk NDJSON file, "
+             "stdout, or nowhere.")
+
+    parser.add_argument(
+        "--sink-file", metavar="<path>", default=None,
+        help="Output of the file sink; .gz and .bz2 names are "
+             "compressed.")
+
+    parser.add_argument(
+        "--batch-size", metavar="<documents>", type=int, default=500,
+        help="Maximum number of documents sent in one bulk request.")
+
+    parser.add_argument(
+        "--batch-bytes", metavar="<bytes>", type=int,
+        default=5 * 1024 * 1024,
+        help="Maximum size in bytes of one bulk request body.")
+
+    parser.add_argument(
+        "--flush-interval", metavar="<seconds>", type=float, default=5.0,
+        help="Maximum number of seconds documents wait before being sent.")
+
+    parser.add_argument(
+        "--concurrency", metavar="<requests>", type=int, default=1,
+        help="Number of bulk requests kept in flight at once.")
+
+    parser.add_argument(
+        "--queue-size", metavar="<batches>", type=int, default=None,
+        help="Number of finished batches allowed to wait for a free "
+             "request before parsing is paused. Defaults to twice the "
+             "concurrency.")
+
+    parser.add_argument(
+        "--spool-dir", metavar="<directory>", default=None,
+        help="Write documents to a durable local spool first and replay "
+             "them into ElasticSearch in the background, retrying until "
+             "the cluster accepts them.")
+
+    parser.add_argument(
+        "--drain-timeout", metavar="<seconds>", type=float, default=60.0,
+        help="With --spool-dir, how long to wait at exit for the spool to "
+             "drain. Whatever is left is replayed on the next run.")
+
+
+def bulk_settings(cl_args):
+    return {"batch_size": cl_args.batch_size,
+            "batch_bytes": cl_args.batch_bytes,
+            "flush_interval": cl_args.flush_interval,
+            "concurrency": cl_args.concurrency,
+            "queue_size": cl_args.queue_size,
+            "spool_dir": cl_args.spool_dir,
+            "drain_timeout": cl_args.drain_timeout}
+
+
+def client_settings(cl_args):
+    # One pooled connection per in-flight bulk request.
+    return {"maxsize": max(10, cl_args.concurrency),
+            "managed": cl_args.normalized}
 
 
 class ArgumentParser(argparse.ArgumentParser):
     def __init__(self):
         desc = "Parses a given input and inserts into ElasticSearch."
-        usage_string = "elastic-benchmark [-t/--type]"
+        usage_string = "elastic-benchmark [-t/--type] | elastic-benchmark serve | " \
+                       "elastic-benchmark compare | elastic-benchmark merge"
 
         super(ArgumentParser, self).__init__(
             usage=usage_string, description=desc)
@@ -100,13 +469,128 @@ class ArgumentParser(argparse.ArgumentParser):
             "-l", "--logs", metavar="<log link>",
             required=False, default=None, help="A link to the logs.")
 
-        self.add_argument('input', nargs='?', type=argparse.FileType('r'),
-                          default=sys.stdin)
+        self.add_argument(
+            "--percentiles", metavar="<p1,p2,...>", default="50,90,95,99",
+            type=percentiles_argument,
+            help="Percentiles of runtime and atomic actions added to "
+                 "aggregated results. An empty value disables them.")
+
+        self.add_argument(
+            "--sketch-accuracy", metavar="<relative error>", type=float,
+            default=0.01, help="Relative accuracy of the percentile sketches.")
+
+        self.add_argument(
+            "--rollup", metavar="<seconds>", type=float, default=None,
+            help="Also index rollup_results documents summarizing the "
+                 "iterations of each scenario in buckets of this many "
+                 "seconds.")
+
+        self.add_argument(
+            "--raw-sample", metavar="<fraction>", type=float, default=1.0,
+            help="Fraction of per-iteration documents to index, from 0 "
+                 "(none) to 1 (all). Aggregates always use every "
+                 "iteration.")
+
+        self.add_argument(
+            "--sketch-output", metavar="<file>", type=argparse.FileType('a'),
+            default=None,
+            help="Append the serialized aggregation state of every run to "
+                 "this file so runs can be merged later with "
+                 "'elastic-benchmark merge'.")
+
+        self.add_argument(
+            "--normalized", action="store_true", default=False,
+            help="Store atomic actions as nested name/metric/value records "
+                 "and manage index templates explicitly.")
+
+        add_bulk_arguments(self)
+
+        add_profile_arguments(self)
+
+        self.add_argument(
+            "--manifest", metavar="<file>", default=None,
+            help="Record ingested files here and skip files whose content "
+                 "was already ingested into the same environment with the "
+                 "same settings.")
+
+        self.add_argument(
+            "--workers", metavar="<processes>", type=int,
+            default=multiprocessing.cpu_count(),
+            help="Processes parsing input files in parallel when more than "
+                 "one is given.")
+
+        self.add_argument('input', nargs='*', default=["-"],
+                          help="Rally JSON reports, directories of them or "
+                               "glob patterns, optionally gzip, bzip2, xz or "
+                               "zstd compressed. Defaults to stdin.")
 
 
 def entry_point():
-    cl_args = ArgumentParser().parse_args()
-    output = parse_output(cl_args.input.read())
-    esc = ElasticSearchClient()
-    for line in output:
-        esc.index(logs=cl_args.logs, env=cl_args.environment, **line)
+    if sys.argv[1:2] == ["serve"]:
+        from elastic_benchmark import server
+        return server.entry_point(sys.argv[2:])
+    if sys.argv[1:2] == ["compare"]:
+        from elastic_benchmark import compare
+        return compare.entry_point(sys.argv[2:])
+    if sys.argv[1:2] == ["merge"]:
+        from elastic_benchmark import merge
+        return merge.entry_point(sys.argv[2:])
+
+    from elastic_benchmark.manifest import Manifest, file_digest
+    from elastic_benchmark.sinks import claim_stdout, open_sink
+
+    parser = ArgumentParser()
+    cl_args = parser.parse_args()
+    claim_stdout(cl_args)
+    profiler = Profiler() if cl_args.profile else None
+    manifest = None
+    if cl_args.manifest:
+        manifest = Manifest(cl_args.manifest, manifest_context(cl_args))
+    paths = expand_inputs(cl_args.input)
+    if not paths:
+        parser.error("no input files found")
+    if len(paths) > 1:
+        if "-" in paths:
+            parser.error("stdin cannot be combined with other inputs")
+        from elastic_benchmark.batch import ingest_files
+        success = ingest_files(paths, cl_args, profiler, manifest)
+        if profiler:
+            publish_profile(profiler, cl_args, "elastic-benchmark")
+        if not success:
+            sys.exit(1)
+        return
+
+    path = paths[0]
+    digest = None
+    try:
+        if path != "-":
+            if manifest and manifest.unchanged(path):
+                sys.stderr.write("Skipping {0}, already ingested.\n".format(path))
+                return
+            digest = file_digest(path)
+            if manifest and manifest.ingested(digest):
+                sys.stderr.write("Skipping {0}, its content was already "
+                                 "ingested.\n".format(path))
+                manifest.record(path, digest)
+                manifest.save()
+                return
+        output = open_input(path)
+    except IOError as e:
+        parser.error("can't open '{0}': {1}".format(path, e))
+    if profiler:
+        output = CountingReader(output, profiler)
+    with open_sink(cl_args, profiler) as bulk:
+        index_rally_output(
+            output, bulk, cl_args.environment, cl_args.logs,
+            sketch_output=cl_args.sketch_output,
+            normalized=cl_args.normalized, profiler=profiler,
+            run_key=digest, **parse_settings(cl_args))
+        with optional_stage(profiler, "flush"):
+            bulk.flush()
+    if profiler:
+        publish_profile(profiler, cl_args, "elastic-benchmark")
+    if not bulk.report():
+        sys.exit(1)
+    if manifest and digest and bulk.delivered():
+        manifest.record(path, digest)
+        manifest.save()
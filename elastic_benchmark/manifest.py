@@ -0,0 +1,58 @@
+import hashlib
+import os
+import time
+
+from elastic_benchmark.statuslog import load_json, save_json
+
+
+def file_digest(path, block_size=1024 * 1024):
+    # Hash of the file as stored, so compressed inputs are not decompressed.
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(block_size), ""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class Manifest(object):
+    """Local record of the input files already ingested.
+
+    Entries are grouped by context, a string naming the environment and
+    the settings the files were ingested with, so ingesting a file into
+    another environment or with other settings is not skipped. Within a
+    context they are keyed by absolute path and hold the size, modification
+    time and SHA-1 of the file. A file whose size and modification time
+    still match its entry is not even hashed; any other file is skipped
+    only if its content was ingested before, under whatever name.
+    """
+
+    def __init__(self, path, context=""):
+        self.path = path
+        self.context = context
+        self.contexts = load_json(path)
+        self.entries = self.contexts.setdefault(context, {})
+        self.digests = set(entry["sha1"] for entry in self.entries.values())
+
+    def unchanged(self, path):
+        entry = self.entries.get(os.path.abspath(path))
+        if entry is None:
+            return False
+        try:
+            info = os.stat(path)
+        except OSError:
+            return False
+        return (entry["size"], entry["mtime"]) == (info.st_size,
+                                                   info.st_mtime)
+
+    def ingested(self, digest):
+        return digest in self.digests
+
+    def record(self, path, digest):
+        info = os.stat(path)
+        self.entries[os.path.abspath(path)] = {
+            "size": info.st_size, "mtime": info.st_mtime, "sha1": digest,
+            "ingested_at": time.strftime("%Y-%m-%dT%H:%M:%S")}
+        self.digests.add(digest)
+
+    def save(self):
+        save_json(self.path, self.contexts)
@@ -0,0 +1,80 @@
+import argparse
+import sys
+import uuid
+
+from elastic_benchmark.aggregation import merge_saved_runs
+from elastic_benchmark.inputs import expand_inputs
+from elastic_benchmark.main import RUN_NAMESPACE, add_bulk_arguments
+from elastic_benchmark.schema import normalize_rally_doc
+from elastic_benchmark.sinks import claim_stdout, open_sink
+
+
+def merged_docs(paths):
+    """Yields one aggregated_results document per scenario of the saved runs.
+
+    Each merged document gets a run id of its own, derived from the runs
+    it combines, so it never overwrites the summary of one of them and
+    merging the same runs again replaces the earlier merge.
+    """
+    for scenario_name, aggregator in sorted(merge_saved_runs(paths).items()):
+        run_ids = sorted(aggregator.run_ids)
+        key = ",".join(run_ids).encode("utf-8")
+        aggregator.run_id = str(uuid.uuid5(RUN_NAMESPACE, key))
+        doc = aggregator.doc()
+        doc["merged_runs"] = run_ids
+        doc["_id"] = "{0}-summary".format(aggregator.run_id)
+        yield doc
+
+
+class ArgumentParser(argparse.ArgumentParser):
+    def __init__(self):
+        desc = "Merges runs saved with --sketch-output and inserts the " \
+               "combined aggregated results into ElasticSearch."
+        usage_string = "elastic-benchmark merge -e <environment> <file> ..."
+
+        super(ArgumentParser, self).__init__(
+            usage=usage_string, description=desc)
+
+        self.prog = "Argument Parser"
+
+        self.add_argument(
+            "-e", "--environment", metavar="<environment>", required=True,
+            help="The environment the merged results are indexed under.")
+
+        self.add_argument(
+            "-l", "--logs", metavar="<log link>", default=None,
+            help="A link to the logs.")
+
+        self.add_argument(
+            "--normalized", action="store_true", default=False,
+            help="Store atomic actions as nested name/metric/value records "
+                 "and manage index templates explicitly.")
+
+        add_bulk_arguments(self)
+
+        self.add_argument(
+            "input", nargs="+",
+            help="Files written by --sketch-output, directories of them or "
+                 "glob patterns.")
+
+
+def entry_point(argv=None):
+    parser = ArgumentParser()
+    cl_args = parser.parse_args(argv)
+    claim_stdout(cl_args)
+    paths = expand_inputs(cl_args.input)
+    if "-" in paths:
+        parser.error("saved runs cannot be read from stdin")
+
+    try:
+        docs = list(merged_docs(paths))
+    except (IOError, ValueError, KeyError) as e:
+        parser.error("can't merge saved runs: {0}".format(e))
+
+    with open_sink(cl_args) as bulk:
+        for doc in docs:
+            if cl_args.normalized:
+                doc = normalize_rally_doc(doc)
+            bulk.index(logs=cl_args.logs, env=cl_args.environment, **doc)
+    if not bulk.report():
+        sys.exit(1)
@@ -0,0 +1,206 @@
+import bisect
+import collections
+import contextlib
+import json
+import resource
+import sys
+import threading
+import time
+
+# Upper bounds in milliseconds of the bulk request latency histogram; the
+# last bucket counts everything slower.
+LATENCY_BOUNDS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000,
+                     10000)
+
+PROFILE_SCENARIO = "pipeline_profile"
+
+
+def children_cpu(usage=None):
+    # User and system CPU seconds of the child processes waited for so far.
+    if usage is None:
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+class Profiler(object):
+    """Records where a run spends its time.
+
+    Stages are timed with stage() or, for generators, timed(). Stages may
+    nest on a thread, in which case only the time not spent in the inner
+    stage is charged to the outer one, so the stage times add up to the
+    run. CPU times are process CPU time, so stages running on several
+    threads at once overlap. Worker processes are reported apart, under
+    children_*, once they have exited and been waited for. Bulk requests
+    are timed separately into a latency histogram from whichever thread
+    sends them.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.start = time.time()
+        self.start_cpu = time.clock()
+        self.start_children_cpu = children_cpu()
+        self.stages = collections.OrderedDict()
+        self.counters = collections.Counter()
+        self.latencies = [0] * (len(LATENCY_BOUNDS_MS) + 1)
+        self.request_seconds = 0.0
+        self.request_max = 0.0
+
+    def _enter(self, name):
+        stack = getattr(self.local, "stack", None)
+        if stack is None:
+            stack = self.local.stack = []
+        # name, wall start, cpu start, wall and cpu of nested stages
+        stack.append([name, time.time(), time.clock(), 0.0, 0.0])
+
+    def _exit(self):
+        name, start, start_cpu, child, child_cpu = self.local.stack.pop()
+        wall = time.time() - start
+        cpu = time.clock() - start_cpu
+        if self.local.stack:
+            parent = self.local.stack[-1]
+            parent[3] += wall
+            parent[4] += cpu
+        self.add_stage(name, wall - child, cpu - child_cpu)
+
+    def add_stage(self, name, wall, cpu, calls=1):
+        with self.lock:
+            stage = self.stages.setdefault(name, [0, 0.0, 0.0])
+            stage[0] += calls
+            stage[1] += wall
+            stage[2] += cpu
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        self._enter(name)
+        try:
+            yield
+        finally:
+            self._exit()
+
+    def timed(self, name, iterable):
+        # Charges the time spent producing each item to the stage, but not
+        # the time the consumer spends on it.
+        iterator = iter(iterable)
+        while True:
+            self._enter(name)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self._exit()
+            yield item
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+
+    def request(self, function, *args, **kwargs):
+        start = time.time()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            seconds = time.time() - start
+            index = bisect.bisect_left(LATENCY_BOUNDS_MS, seconds * 1000)
+            with self.lock:
+                self.latencies[index] += 1
+                self.request_seconds += seconds
+                self.request_max = max(self.request_max, seconds)
+
+    def report(self):
+        wall = time.time() - self.start
+        with self.lock:
+            stages = collections.OrderedDict(
+                (name, {"calls": calls,
+                        "wall_seconds": round(seconds, 4),
+                        "cpu_seconds": round(cpu, 4)})
+                for name, (calls, seconds, cpu) in self.stages.items())
+            histogram = collections.OrderedDict(
+                (str(bound), count)
+                for bound, count in zip(LATENCY_BOUNDS_MS, self.latencies))
+            histogram["inf"] = self.latencies[-1]
+            requests = sum(self.latencies)
+            children = resource.getrusage(resource.RUSAGE_CHILDREN)
+            report = {
+                "wall_seconds": round(wall, 4),
+                "cpu_seconds": round(time.clock() - self.start_cpu, 4),
+                "peak_rss_kb": resource.getrusage(
+                    resource.RUSAGE_SELF).ru_maxrss,
+                "children_cpu_seconds": round(
+                    children_cpu(children) - self.start_children_cpu, 4),
+                # Of the largest child, not their sum.
+                "children_peak_rss_kb": children.ru_maxrss,
+                "stages": stages,
+                "bytes_read": self.counters["bytes_read"],
+                "documents": self.counters["documents"],
+                "documents_per_second": round(
+                    self.counters["documents"] / wall, 2) if wall else None,
+                "es_requests": {
+                    "count": requests,
+                    "total_seconds": round(self.request_seconds, 4),
+                    "max_ms": round(self.request_max * 1000, 2),
+                    "latency_ms": histogram}}
+        return report
+
+
+@contextlib.contextmanager
+def _no_stage():
+    yield
+
+
+def optional_stage(profiler, name):
+    # profiler.stage(name), or nothing when profiling is off.
+    if profiler is None:
+        return _no_stage()
+    return profiler.stage(name)
+
+
+class CountingReader(object):
+    # Passes reads through to a file object, counting bytes into a Profiler.
+
+    def __init__(self, stream, profiler):
+        self.stream = stream
+        self.profiler = profiler
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.profiler.count("bytes_read", len(data))
+        return data
+
+    def readline(self, size=-1):
+        line = self.stream.readline(size)
+        self.profiler.count("bytes_read", len(line))
+        return line
+
+    def __iter__(self):
+        for line in self.stream:
+            self.profiler.count("bytes_read", len(line))
+            yield line
+
+
+def add_profile_arguments(parser):
+    parser.add_argument(
+        "--profile", action="store_true", default=False,
+        help="Write per-stage timings, throughput, peak memory and bulk "
+             "request latencies to stderr as JSON when done.")
+
+    parser.add_argument(
+        "--profile-index", action="store_true", default=False,
+        help="With --profile, also index the report as the {0} scenario "
+             "of the environment.".format(PROFILE_SCENARIO))
+
+
+def publish_profile(profiler, cl_args, tool):
+    report = profiler.report()
+    report["tool"] = tool
+    report["done_time"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+    sys.stderr.write(json.dumps(report, sort_keys=True) + "\n")
+    if cl_args.profile_index:
+        from elastic_benchmark.sinks import open_sink
+        with open_sink(cl_args) as sink:
+            sink.index(scenario_name=PROFILE_SCENARIO,
+                       env=cl_args.environment, **report)
+        sink.report()
+    return report
@@ -0,0 +1,129 @@
+import array
+import bisect
+
+STATUSES = ("success", "skip", "error", "failure")
+STATUS_CODES = {status: code for code, status in enumerate(STATUSES)}
+
+# Test ids are shared between every store in the process, so the before and
+# after runs of the same suite hold a single copy of each name.
+_interned = {}
+
+
+def intern_id(test_id):
+    return _interned.setdefault(test_id, test_id)
+
+
+class TestStore(object):
+    """Compact test id to status mapping.
+
+    Results are collected in a dict while a stream is parsed and folded into
+    a sorted tuple of interned ids plus a parallel array of one-byte status
+    codes the first time the store is read. The sorted layout is what lets
+    diff_tests compare two runs in a single merge pass.
+    """
+
+    __slots__ = ("_pending", "ids", "codes")
+
+    def __init__(self):
+        self._pending = {}
+        self.ids = ()
+        self.codes = array.array("b")
+
+    def __getstate__(self):
+        self.freeze()
+        return self.ids, self.codes.tostring()
+
+    def __setstate__(self, state):
+        self._pending = {}
+        self.ids = tuple(intern_id(test_id) for test_id in state[0])
+        self.codes = array.array("b")
+        self.codes.fromstring(state[1])
+
+    def add(self, test_id, status):
+        self._pending[intern_id(test_id)] = STATUS_CODES[status]
+
+    def freeze(self):
+        if not self._pending:
+            return
+        merged = dict(zip(self.ids, self.codes))
+        merged.update(self._pending)
+        self._pending = {}
+        self.ids = tuple(sorted(merged))
+        self.codes = array.array("b", (merged[i] for i in self.ids))
+
+    def code(self, test_id):
+        self.freeze()
+        position = bisect.bisect_left(self.ids, test_id)
+        if position < len(self.ids) and self.ids[position] == test_id:
+            return self.codes[position]
+        return None
+
+    def get(self, test_id, default=None):
+        code = self.code(test_id)
+        return default if code is None else STATUSES[code]
+
+    def __contains__(self, test_id):
+        return self.code(test_id) is not None
+
+    def __len__(self):
+        self.freeze()
+        return len(self.ids)
+
+    def __iter__(self):
+        self.freeze()
+        return iter(self.ids)
+
+    def keys(self):
+        return list(self)
+
+    def items(self):
+        self.freeze()
+        return [(test_id, STATUSES[code])
+                for test_id, code in zip(self.ids, self.codes)]
+
+
+def diff_tests(before, after, limit=None, offset=0):
+    """Compares two TestStores in one pass over their sorted ids.
+
+    Returns the added, removed and changed tests as lists holding at most
+    ``limit`` entries each, starting at ``offset``, together with the full
+    count of each kind.
+    """
+    before.freeze()
+    after.freeze()
+    added, removed, changed = [], [], []
+    totals = {"added": 0, "removed": 0, "changed": 0}
+    end = None if limit is None else offset + limit
+
+    def keep(kind, target, entry):
+        position = totals[kind]
+        totals[kind] += 1
+        if position >= offset and (end is None or position < end):
+            target.append(entry)
+
+    b_ids, b_codes = before.ids, before.codes
+    a_ids, a_codes = after.ids, after.codes
+    i = j = 0
+    while i < len(b_ids) and j < len(a_ids):
+        if b_ids[i] == a_ids[j]:
+            if b_codes[i] != a_codes[j]:
+                keep("changed", changed, {"test": a_ids[j],
+                                          "before": STATUSES[b_codes[i]],
+                                          "after": STATUSES[a_codes[j]]})
+            i += 1
+            j += 1
+        elif b_ids[i] < a_ids[j]:
+            keep("removed", removed, b_ids[i])
+            i += 1
+        else:
+            keep("added", added, a_ids[j])
+            j += 1
+    for test_id in b_ids[i:]:
+        keep("removed", removed, test_id)
+    for test_id in a_ids[j:]:
+        keep("added", added, test_id)
+
+    return {"added": added, "removed": removed, "changed": changed,
+            "added_total": totals["added"],
+            "removed_total": totals["removed"],
+            "changed_total": totals["changed"]}
@@ -0,0 +1,140 @@
+import sys
+import time
+
+# Bump when the template below changes so clusters pick up the new one.
+TEMPLATE_VERSION = 1
+
+# Summary fields whose names do not depend on the services under test.
+SUMMARY_PREFIXES = ("smoke_", "pers_", "console_")
+SUMMARY_FIELDS = ("done_time", "upgrade_start", "base_branch",
+                  "collector_timings", "api_uptime", "during_uptime",
+                  "persistence_uptime")
+
+
+def metric_record(name, metric, value):
+    # Numbers and numeric strings share one numeric field; anything else is
+    # kept apart so the two never clash in the mapping.
+    record = {"name": name, "metric": metric}
+    try:
+        record["value"] = float(value)
+    except (TypeError, ValueError):
+        record["text"] = None if value is None else str(value)
+    return record
+
+
+def normalize_rally_doc(doc):
+    """Replaces the per-action fields of atomic_actions with records.
+
+    Iteration documents get one ``duration`` record per action, aggregated
+    results one record per action and statistic (min, max, avg, p95...).
+    """
+    doc = dict(doc)
+    records = []
+    for name, value in sorted(doc.get("atomic_actions", {}).items()):
+        if isinstance(value, dict):
+            for metric, stat in sorted(value.items()):
+                records.append(metric_record(name, metric, stat))
+        else:
+            records.append(metric_record(name, "duration", value))
+    doc["atomic_actions"] = records
+    return doc
+
+
+def normalize_summary(summary):
+    """Moves the service-named fields of an upgrade summary into records.
+
+    Keys such as ``nova_api_uptime`` or ``swift_during_total`` are split at
+    the first underscore into a service name and a metric, which assumes
+    service names themselves contain no underscore.
+    """
+    doc = {}
+    records = []
+    for key, value in sorted(summary.items()):
+        if key in SUMMARY_FIELDS or key.startswith(SUMMARY_PREFIXES) or \
+                "_" not in key:
+            doc[key] = value
+        else:
+            name, metric = key.split("_", 1)
+            records.append(metric_record(name, metric, value))
+    doc["metrics"] = records
+    return doc
+
+
+def normalize_status_line(line):
+    # Status lines prefix their per-service fields with line['service'].
+    service = line.get("service")
+    if not service:
+        return line
+    prefix = service + "_"
+    doc = {}
+    records = []
+    for key, value in sorted(line.items()):
+        if key.startswith(prefix):
+            records.append(metric_record(service, key[len(prefix):], value))
+        else:
+            doc[key] = value
+    doc["metrics"] = records
+    return doc
+
+
+def index_template(env):
+    record = {"type": "nested",
+              "properties": {"name": {"type": "keyword"},
+                             "metric": {"type": "keyword"},
+                             "value": {"type": "double"},
+                             "text": {"type": "keyword"}}}
+    return {"index_patterns": ["{0}_*".format(env)],
+            "version": TEMPLATE_VERSION,
+            "mappings": {"results": {
+                "properties": {"atomic_actions": record,
+                               "metrics": record}}}}
+
+
+class IndexCache(object):
+    """Remembers which indices and templates are already in place.
+
+    The template for an environment is checked (and installed or upgraded)
+    the first time one of its indices is used; each index is then created
+    at most once per process instead of relying on dynamic creation. An
+    index that could not be prepared is retried after 1, 2, 4... seconds up
+    to max_backoff, not on every document.
+    """
+
+    def __init__(self, client, max_backoff=60.0):
+        self.client = client
+        self.max_backoff = max_backoff
+        self.templates = set()
+        self.indices = set()
+        # Index name -> (failed attempts, time of the next attempt).
+        self.failed = {}
+
+    def install_template(self, env):
+        name = "elastic-benchmark-{0}".format(env)
+        existing = self.client.indices.get_template(name=name, ignore=404)
+        if existing.get(name, {}).get("version") != TEMPLATE_VERSION:
+            self.client.indices.put_template(name=name,
+                                             body=index_template(env))
+        self.templates.add(env)
+
+    def ensure(self, index, env):
+        if index in self.indices:
+            return
+        attempts, retry_at = self.failed.get(index, (0, 0))
+        if time.time() < retry_at:
+            return
+        try:
+            if env not in self.templates:
+                self.install_template(env)
+            if not self.client.indices.exists(index=index):
+                # 400 means another writer created it first.
+                self.client.indices.create(index=index, ignore=400)
+        except Exception as e:
+            # Indexing still works through dynamic creation and the
+            # template, so only warn and retry later.
+            delay = min(self.max_backoff, 2 ** attempts)
+            self.failed[index] = (attempts + 1, time.time() + delay)
+            sys.stderr.write("Could not prepare index {0}, retrying in "
+                             "{1:g}s: {2}\n".format(index, delay, e))
+            return
+        self.failed.pop(index, None)
+        self.indices.add(index)
@@ -0,0 +1,241 @@
+import argparse
+import BaseHTTPServer
+import json
+import SocketServer
+import sys
+import threading
+import urlparse
+
+from elastic_benchmark.main import (
+    add_bulk_arguments, index_rally_output, parse_settings)
+from elastic_benchmark.sinks import claim_stdout, open_sink
+from elastic_benchmark.sketch import percentiles_argument
+from elastic_benchmark.upgrade import index_status_lines
+
+
+class BodyReader(object):
+    # File-like view of a request body that never reads past Content-Length.
+
+    def __init__(self, stream, length):
+        self.stream = stream
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.stream.read(size) if size else ""
+        self.remaining -= len(data)
+        return data
+
+    def __iter__(self):
+        while self.remaining > 0:
+            line = self.stream.readline(self.remaining)
+            if not line:
+                return
+            self.remaining -= len(line)
+            yield line
+
+
+class SharedIndexer(object):
+    """Serializes access to the one BulkIndexer shared by every request."""
+
+    def __init__(self, indexer):
+        self.indexer = indexer
+        self.lock = threading.Lock()
+
+    def index(self, *args, **kwargs):
+        with self.lock:
+            self.indexer.index(*args, **kwargs)
+
+    def flush(self, due_only=False):
+        with self.lock:
+            if not due_only or self.indexer.flush_due():
+                self.indexer.flush()
+
+    def stats(self):
+        with self.lock:
+            return {"indexed": self.indexer.indexed,
+                    "failures": len(self.indexer.failures)}
+
+
+class RequestCounter(object):
+    # Counts the documents one request hands to the shared indexer, so a
+    # request failing halfway can say how many were already queued.
+
+    def __init__(self, indexer):
+        self.indexer = indexer
+        self.count = 0
+
+    def index(self, *args, **kwargs):
+        self.indexer.index(*args, **kwargs)
+        self.count += 1
+
+
+class IngestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def _reply(self, code, body):
+        data = json.dumps(body)
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if urlparse.urlparse(self.path).path != "/health":
+            return self._reply(404, {"error": "Not found"})
+        self._reply(200, self.server.indexer.stats())
+
+    def do_POST(self):
+        url = urlparse.urlparse(self.path)
+        query = dict(urlparse.parse_qsl(url.query))
+        environment = query.get("environment", self.server.environment)
+        indexer = RequestCounter(self.server.indexer)
+
+        try:
+            length = int(self.headers.getheader("Content-Length", 0))
+            if length < 0:
+                raise ValueError("negative length")
+        except ValueError as e:
+            # The body cannot be delimited, so the connection is not reused.
+            self.close_connection = 1
+            return self._reply(400, {"error": "Invalid Content-Length: "
+                                              "{0}".format(e), "queued": 0})
+        body = BodyReader(self.rfile, length)
+
+        try:
+            if url.path == "/rally":
+                index_rally_output(
+                    body, indexer, environment, query.get("logs"),
+                    normalized=self.server.normalized,
+                    **self.server.settings)
+            elif url.path == "/status":
+                index_status_lines(
+                    body, indexer, environment,
+                    query.get("api", "").lower() in ("1", "true", "yes"),
+                    self.server.normalized)
+            else:
+                return self._reply(404, {"error": "Not found"})
+            if query.get("flush"):
+                self.server.indexer.flush()
+        except (ValueError, TypeError, KeyError, AttributeError) as e:
+            # Malformed input. Documents parsed before the error stay queued.
+            return self._reply(400, {"error": "{0}: {1}".format(
+                type(e).__name__, e), "queued": indexer.count})
+        except Exception as e:
+            self.log_error("Failed to ingest %s: %r", url.path, e)
+            return self._reply(500, {"error": "{0}: {1}".format(
+                type(e).__name__, e), "queued": indexer.count})
+        self._reply(200, {"queued": indexer.count})
+
+
+class IngestServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """Accepts Rally reports and status lines over HTTP.
+
+    POST /rally takes a Rally JSON report and POST /status takes status log
+    lines; both accept ``environment`` (and ``logs`` or ``api``) query
+    arguments. Every request feeds the same Elasticsearch client and bulk
+    pipeline, which a background thread flushes on the flush interval.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, indexer, environment, settings,
+                 normalized=False):
+        BaseHTTPServer.HTTPServer.__init__(self, address, IngestHandler)
+        self.normalized = normalized
+        self.indexer = indexer
+        self.environment = environment
+        # parse_output keyword arguments for Rally reports.
+        self.settings = settings
+
+
+def flush_periodically(indexer, interval, stopped):
+    while not stopped.wait(interval):
+        try:
+            indexer.flush(due_only=True)
+        except Exception as e:
+            sys.stderr.write("Bulk flush failed: {0}\n".format(e))
+
+
+class ArgumentParser(argparse.ArgumentParser):
+    def __init__(self):
+        desc = "Serves an endpoint that parses input and inserts into ElasticSearch."
+        usage_string = "elastic-benchmark serve [--host] [--port]"
+
+        super(ArgumentParser, self).__init__(
+            usage=usage_string, description=desc)
+
+        self.prog = "Argument Parser"
+
+        self.add_argument(
+            "--host", metavar="<address>", default="127.0.0.1",
+            help="Address to listen on.")
+
+        self.add_argument(
+            "--port", metavar="<port>", type=int, default=8089,
+            help="Port to listen on.")
+
+        self.add_argument(
+            "-e", "--environment", metavar="<environment>",
+            default="devstack",
+            help="Environment used when a request does not name one.")
+
+        self.add_argument(
+            "--percentiles", metavar="<p1,p2,...>", default="50,90,95,99",
+            type=percentiles_argument,
+            help="Percentiles of runtime and atomic actions added to "
+                 "aggregated results. An empty value disables them.")
+
+        self.add_argument(
+            "--sketch-accuracy", metavar="<relative error>", type=float,
+            default=0.01, help="Relative accuracy of the percentile sketches.")
+
+        self.add_argument(
+            "--rollup", metavar="<seconds>", type=float, default=None,
+            help="Also index rollup_results documents summarizing the "
+                 "iterations of each scenario in buckets of this many "
+                 "seconds.")
+
+        self.add_argument(
+            "--raw-sample", metavar="<fraction>", type=float, default=1.0,
+            help="Fraction of per-iteration documents to index, from 0 "
+                 "(none) to 1 (all). Aggregates always use every "
+                 "iteration.")
+
+        self.add_argument(
+            "--normalized", action="store_true", default=False,
+            help="Store metrics as nested name/metric/value records and "
+                 "manage index templates explicitly.")
+
+        add_bulk_arguments(self)
+
+
+def entry_point(argv=None):
+    cl_args = ArgumentParser().parse_args(argv)
+    claim_stdout(cl_args)
+    bulk = open_sink(cl_args)
+    indexer = SharedIndexer(bulk)
+    server = IngestServer((cl_args.host, cl_args.port), indexer,
+                          cl_args.environment,
+                          parse_settings(cl_args), cl_args.normalized)
+
+    stopped = threading.Event()
+    flusher = threading.Thread(
+        target=flush_periodically,
+        args=(indexer, max(cl_args.flush_interval / 2.0, 0.1), stopped))
+    flusher.daemon = True
+    flusher.start()
+
+    print "Listening on {0}:{1}".format(cl_args.host, cl_args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print "Shutting down."
+    finally:
+        stopped.set()
+        server.server_close()
+        bulk.close()
+    if not bulk.report():
+        sys.exit(1)
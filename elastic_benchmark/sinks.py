@@ -0,0 +1,97 @@
+import bz2
+import gzip
+import sys
+
+from elastic_benchmark.main import (
+    BulkIndexer, ElasticSearchClient, bulk_settings, client_settings)
+
+SINKS = ("elasticsearch", "file", "stdout", "null")
+
+
+class FileSink(BulkIndexer):
+    """Writes batches as _bulk NDJSON instead of sending them.
+
+    The output can be loaded later with ``curl -XPOST --data-binary
+    @file <host>/_bulk`` (after decompressing, if needed).
+    """
+
+    def __init__(self, stream, **kwargs):
+        super(FileSink, self).__init__(None, **kwargs)
+        self.stream = stream
+
+    def _send(self, body):
+        self.stream.write(body)
+        self.indexed += body.count("\n") // 2
+
+    def close(self):
+        super(FileSink, self).close()
+        if self.stream is sys.__stdout__:
+            self.stream.flush()
+        else:
+            self.stream.close()
+
+
+class NullSink(BulkIndexer):
+    # Counts documents and throws them away, for measuring the parsers.
+
+    def __init__(self, **kwargs):
+        super(NullSink, self).__init__(None, **kwargs)
+
+    def index(self, scenario_name, env, _id=None, **kwargs):
+        self.indexed += 1
+
+
+class BZ2Appender(object):
+    # BZ2File cannot append, so each opening adds a bz2 stream of its own
+    # to the end of the file, the way gzip adds a member. bzip2 and
+    # open_input read the streams back as one.
+
+    def __init__(self, path):
+        self.file = open(path, "ab")
+        self.compressor = bz2.BZ2Compressor()
+
+    def write(self, data):
+        self.file.write(self.compressor.compress(data))
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.write(self.compressor.flush())
+        self.file.close()
+
+
+def open_output(path):
+    # Compression follows the file extension. Outputs are always appended
+    # to, so a second sink on the same file keeps what the first wrote.
+    if path.endswith(".gz"):
+        return gzip.open(path, "ab")
+    if path.endswith(".bz2"):
+        return BZ2Appender(path)
+    return open(path, "ab")
+
+
+def claim_stdout(cl_args):
+    # With --sink stdout the _bulk stream owns stdout, so whatever the tools
+    # print from here on goes to stderr instead of corrupting it. Call this
+    # before printing anything.
+    if cl_args.sink == "stdout":
+        sys.stdout = sys.stderr
+
+
+def open_sink(cl_args, profiler=None):
+    if cl_args.sink == "elasticsearch":
+        esc = ElasticSearchClient(**client_settings(cl_args))
+        return esc.bulk_indexer(profiler=profiler, **bulk_settings(cl_args))
+
+    settings = {"batch_size": cl_args.batch_size,
+                "batch_bytes": cl_args.batch_bytes,
+                "flush_interval": cl_args.flush_interval,
+                "profiler": profiler}
+    if cl_args.sink == "file":
+        if not cl_args.sink_file:
+            raise SystemExit("--sink file needs --sink-file")
+        return FileSink(open_output(cl_args.sink_file), **settings)
+    if cl_args.sink == "stdout":
+        return FileSink(sys.__stdout__, **settings)
+    return NullSink(**settings)
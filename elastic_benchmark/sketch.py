@@ -0,0 +1,125 @@
+import argparse
+import math
+
+
+class QuantileSketch(object):
+    """Mergeable quantile sketch with a bounded relative error.
+
+    Values are counted in logarithmically sized buckets (as in DDSketch), so
+    every quantile is within ``relative_accuracy`` of the exact answer. The
+    number of buckets is capped at ``max_bins``; past that the lowest buckets
+    are folded together, which only costs accuracy at the low end and keeps
+    the tail percentiles exact to the configured error.
+    """
+
+    min_value = 1e-9
+
+    def __init__(self, relative_accuracy=0.01, max_bins=2048):
+        if not 0 < relative_accuracy < 1:
+            raise ValueError("relative_accuracy must be between 0 and 1")
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.bins = {}
+        self.zero_count = 0
+        self.count = 0
+        self.min = None
+        self.max = None
+
+    def add(self, value, count=1):
+        self.count += count
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+        if value <= self.min_value:
+            self.zero_count += count
+            return
+        index = int(math.ceil(math.log(value) / self.log_gamma))
+        self.bins[index] = self.bins.get(index, 0) + count
+        if len(self.bins) > self.max_bins:
+            self._collapse()
+
+    def _collapse(self):
+        indexes = sorted(self.bins)
+        excess = len(indexes) - self.max_bins
+        folded = sum(self.bins.pop(i) for i in indexes[:excess])
+        self.bins[indexes[excess]] += folded
+
+    def quantile(self, q):
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        if rank < self.zero_count:
+            return self.min
+
+        seen = self.zero_count
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if seen > rank:
+                value = 2 * self.gamma ** index / (self.gamma + 1)
+                return max(self.min, min(self.max, value))
+        return self.max
+
+    def percentiles(self, percentiles):
+        return {percentile_name(p): self.quantile(p / 100.0)
+                for p in percentiles}
+
+    def merge(self, other):
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Cannot merge sketches with different accuracy")
+        if not other.count:
+            return
+        self.count += other.count
+        self.zero_count += other.zero_count
+        if self.min is None or other.min < self.min:
+            self.min = other.min
+        if self.max is None or other.max > self.max:
+            self.max = other.max
+        for index, count in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + count
+        if len(self.bins) > self.max_bins:
+            self._collapse()
+
+    def to_dict(self):
+        return {"relative_accuracy": self.relative_accuracy,
+                "max_bins": self.max_bins,
+                "zero_count": self.zero_count,
+                "count": self.count,
+                "min": self.min,
+                "max": self.max,
+                "bins": sorted(self.bins.items())}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data["relative_accuracy"], data["max_bins"])
+        sketch.zero_count = data["zero_count"]
+        sketch.count = data["count"]
+        sketch.min = data["min"]
+        sketch.max = data["max"]
+        sketch.bins = {int(index): count for index, count in data["bins"]}
+        return sketch
+
+
+def percentile_name(percentile):
+    # Dots are path separators in Elasticsearch field names.
+    return "p" + "{0:g}".format(percentile).replace(".", "_")
+
+
+def parse_percentiles(value):
+    percentiles = [float(p) for p in value.split(",") if p.strip()]
+    for p in percentiles:
+        if not 0 <= p <= 100:
+            raise ValueError("Percentiles must be between 0 and 100")
+    return percentiles
+
+
+def percentiles_argument(value):
+    # argparse type for --percentiles.
+    try:
+        return parse_percentiles(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(
+            "invalid percentiles '{0}': {1}".format(value, e))
@@ -0,0 +1,319 @@
+import fcntl
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+
+from elastic_benchmark.main import BulkIndexer, index_name
+from elastic_benchmark.statuslog import load_json, save_json
+
+# Bulk item statuses worth retrying; anything else is a permanent rejection.
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class Spool(object):
+    """Append-only store of bulk actions waiting to be sent.
+
+    Documents are appended as _bulk NDJSON lines to numbered segment files.
+    ``position.json`` is the write-ahead index: it records the segment and
+    byte offset up to which the cluster has acknowledged everything, and is
+    only advanced after a successful bulk request. Every action carries an
+    explicit _id, so lines replayed after a crash overwrite their earlier
+    copy instead of duplicating it.
+    """
+
+    segment_pattern = re.compile(r"^segment-(\d+)\.ndjson$")
+
+    def __init__(self, directory, segment_bytes=64 * 1024 * 1024):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        # Only one process may write to and drain a spool at a time.
+        self.lock_file = open(os.path.join(directory, "lock"), "w")
+        try:
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except IOError:
+            raise RuntimeError("Spool {0} is in use by another "
+                               "process".format(directory))
+
+        self.position_path = os.path.join(directory, "position.json")
+        self.rejected_path = os.path.join(directory, "rejected.ndjson")
+        existing = self.segments()
+        position = load_json(self.position_path)
+        self.read_segment = position.get(
+            "segment", existing[0] if existing else 0)
+        self.read_offset = position.get("offset", 0)
+
+        # New documents always start a fresh segment, so older segments are
+        # never written to again once this process owns the spool.
+        self.write_segment = max([n + 1 for n in existing] +
+                                 [self.read_segment + 1])
+        self.write_file = open(self.segment_path(self.write_segment), "ab")
+        self.durable_segment = self.write_segment
+        self.durable_offset = 0
+        self.condition = threading.Condition()
+
+    def segments(self):
+        numbers = []
+        for name in os.listdir(self.directory):
+            match = self.segment_pattern.match(name)
+            if match:
+                numbers.append(int(match.group(1)))
+        return sorted(numbers)
+
+    def segment_path(self, number):
+        return os.path.join(self.directory,
+                            "segment-{0:010d}.ndjson".format(number))
+
+    def append(self, body):
+        self.write_file.write(body)
+        self.write_file.flush()
+        os.fsync(self.write_file.fileno())
+        offset = self.write_file.tell()
+
+        with self.condition:
+            if offset >= self.segment_bytes:
+                self.write_file.close()
+                self.write_segment += 1
+                self.write_file = open(
+                    self.segment_path(self.write_segment), "ab")
+                self.durable_segment = self.write_segment
+                self.durable_offset = 0
+            else:
+                self.durable_offset = offset
+            self.condition.notify_all()
+
+    def pending(self):
+        with self.condition:
+            return ((self.read_segment, self.read_offset) <
+                    (self.durable_segment, self.durable_offset))
+
+    def read_batch(self, max_count, max_bytes):
+        """Returns up to max_count (action, source) pairs and the position
+        just past them, or an empty list when nothing is waiting."""
+        with self.condition:
+            durable = (self.durable_segment, self.durable_offset)
+
+        while (self.read_segment, self.read_offset) < durable:
+            finished = self.read_segment < durable[0]
+            path = self.segment_path(self.read_segment)
+            pairs = []
+            size = 0
+            offset = self.read_offset
+            if os.path.isfile(path):
+                with open(path, "rb") as f:
+                    f.seek(offset)
+                    while len(pairs) < max_count and size < max_bytes:
+                        if not finished and offset >= durable[1]:
+                            break
+                        action = f.readline()
+                        source = f.readline()
+                        if not source.endswith("\n"):
+                            break
+                        offset += len(action) + len(source)
+                        size += len(action) + len(source)
+                        pairs.append((action.rstrip("\n"),
+                                      source.rstrip("\n")))
+            if pairs:
+                return pairs, (self.read_segment, offset)
+            if not finished:
+                break
+            # A finished segment has been drained completely.
+            self._remove(path)
+            self.read_segment += 1
+            self.read_offset = 0
+            self.commit((self.read_segment, 0))
+        return [], (self.read_segment, self.read_offset)
+
+    def commit(self, position):
+        self.read_segment, self.read_offset = position
+        save_json(self.position_path, {"segment": self.read_segment,
+                                       "offset": self.read_offset})
+        with self.condition:
+            self.condition.notify_all()
+
+    def reject(self, action, source, error):
+        with open(self.rejected_path, "ab") as f:
+            f.write(json.dumps({"action": action, "source": source,
+                                "error": error}) + "\n")
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def close(self):
+        self.write_file.close()
+        self.lock_file.close()
+
+
+class Replayer(threading.Thread):
+    """Drains a Spool into Elasticsearch with exponential backoff.
+
+    Requests that fail as a whole, and items rejected with a retryable
+    status, are sent again after 1, 2, 4... seconds up to max_backoff.
+    Items the cluster refuses permanently go to the spool's rejected file
+    so they cannot block the documents behind them. With an IndexCache,
+    the indices handed to prepare() are set up before the next request.
+    """
+
+    def __init__(self, client, spool, results, batch_size=500,
+                 batch_bytes=5 * 1024 * 1024, max_backoff=60.0,
+                 profiler=None, indices=None):
+        super(Replayer, self).__init__()
+        self.daemon = True
+        self.client = client
+        self.spool = spool
+        # Outcomes are tallied on results.indexed and results.failures.
+        self.results = results
+        self.batch_size = batch_size
+        self.batch_bytes = batch_bytes
+        self.max_backoff = max_backoff
+        self.profiler = profiler
+        self.indices = indices
+        # Index name -> environment, for indices not set up yet.
+        self.unprepared = {}
+        self.stopped = threading.Event()
+        self.lock = threading.Lock()
+
+    def prepare(self, index, env):
+        if index in self.indices.indices:
+            return
+        with self.lock:
+            self.unprepared[index] = env
+
+    def _prepare_indices(self):
+        with self.lock:
+            unprepared = self.unprepared.items()
+        for index, env in unprepared:
+            self.indices.ensure(index, env)
+            if index in self.indices.indices:
+                with self.lock:
+                    self.unprepared.pop(index, None)
+
+    def stop(self):
+        self.stopped.set()
+        with self.spool.condition:
+            self.spool.condition.notify_all()
+
+    def run(self):
+        while not self.stopped.is_set():
+            pairs, position = self.spool.read_batch(self.batch_size,
+                                                    self.batch_bytes)
+            if not pairs:
+                with self.spool.condition:
+                    if not self.spool.pending() and not self.stopped.is_set():
+                        self.spool.condition.wait(1.0)
+                continue
+            if self._send(pairs):
+                self.spool.commit(position)
+
+    def _send(self, pairs):
+        attempt = 0
+        while pairs:
+            if self.indices is not None:
+                self._prepare_indices()
+            try:
+                body = "".join(a + "\n" + s + "\n" for a, s in pairs)
+                if self.profiler is None:
+                    response = self.client.bulk(body=body)
+                else:
+                    response = self.profiler.request(self.client.bulk,
+                                                     body=body)
+            except Exception as e:
+                sys.stderr.write("Bulk request failed, retrying: "
+                                 "{0}\n".format(e))
+                retry = pairs
+            else:
+                retry = []
+                for pair, item in zip(pairs, response.get("items", [])):
+                    op, result = item.popitem()
+                    status = result.get("status", 500)
+                    if status < 300 and "error" not in result:
+                        with self.lock:
+                            self.results.indexed += 1
+                    elif status in RETRY_STATUSES:
+                        retry.append(pair)
+                    else:
+                        self.spool.reject(pair[0], pair[1],
+                                          result.get("error"))
+                        with self.lock:
+                            self.results.failures.append(
+                                (result.get("_index"), status,
+                                 result.get("error")))
+            pairs = retry
+            if pairs:
+                delay = min(self.max_backoff, 2 ** attempt)
+                attempt += 1
+                if self.stopped.wait(delay):
+                    # Shutting down: leave the batch in the spool for the
+                    # next run.
+                    return False
+        return True
+
+
+class SpoolingIndexer(BulkIndexer):
+    """BulkIndexer that writes every batch to a Spool instead of the cluster.
+
+    Parsing never waits on Elasticsearch: batches are made durable on local
+    disk and a Replayer thread sends them on, setting up managed indices
+    on the way. close() waits until the spool has been drained, up to
+    drain_timeout seconds; whatever is left is replayed the next time the
+    same spool directory is used.
+    """
+
+    def __init__(self, client, spool_dir, drain_timeout=None, indices=None,
+                 **kwargs):
+        super(SpoolingIndexer, self).__init__(client, **kwargs)
+        self.spool = Spool(spool_dir)
+        self.drain_timeout = drain_timeout
+        self.drained = False
+        self.replayer = Replayer(client, self.spool, self, self.batch_size,
+                                 self.batch_bytes, profiler=self.profiler,
+                                 indices=indices)
+        self.replayer.start()
+
+    def index(self, scenario_name, env, _id=None, **kwargs):
+        if _id is None:
+            _id = uuid.uuid4().hex
+        if self.replayer.indices is not None:
+            self.replayer.prepare(index_name(env, scenario_name), env)
+        super(SpoolingIndexer, self).index(scenario_name, env, _id, **kwargs)
+
+    def _send(self, body):
+        self.spool.append(body)
+
+    def drain(self, timeout=None):
+        deadline = None if timeout is None else time.time() + timeout
+        with self.spool.condition:
+            while self.spool.pending():
+                remaining = 1.0
+                if deadline is not None:
+                    remaining = min(remaining, deadline - time.time())
+                    if remaining <= 0:
+                        return False
+                self.spool.condition.wait(remaining)
+        return True
+
+    def close(self):
+        self.flush()
+        try:
+            self.drained = self.drain(self.drain_timeout)
+            if not self.drained:
+                sys.stderr.write("Spool {0} not drained yet, it will be "
+                                 "replayed on the next run.\n".format(
+                                     self.spool.directory))
+        finally:
+            self.replayer.stop()
+            self.replayer.join()
+            self.spool.close()
+
+    def delivered(self):
+        # Spooled documents count as delivered only once acknowledged.
+        return self.drained and super(SpoolingIndexer, self).delivered()
@@ -0,0 +1,281 @@
+import hashlib
+import json
+import os
+
+from elastic_benchmark.inputs import is_compressed, open_input
+
+# Bytes at the start of a log that identify it, along with its inode, when
+# a checkpoint is resumed.
+HEAD_BYTES = 4096
+
+
+def read_last_line(path, block_size=4096):
+    # Reads backwards from the end of the file, so only the blocks holding
+    # the final record are touched no matter how long the log has grown.
+    # Compressed logs cannot be read backwards and are streamed instead.
+    if is_compressed(path):
+        last = None
+        with open_input(path) as f:
+            for line in f:
+                if line.strip():
+                    last = line
+        return last.strip() if last else None
+
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        data = ""
+        while position > 0:
+            step = min(block_size, position)
+            position -= step
+            f.seek(position)
+            data = f.read(step) + data
+            stripped = data.rstrip()
+            if "\n" in stripped:
+                return stripped.rsplit("\n", 1)[1].strip()
+        return data.strip() or None
+
+
+def head_digest(f, size):
+    # Hash of the first size bytes of a file. A log rewritten in place keeps
+    # its inode and may outgrow the old offset, but not its first records.
+    f.seek(0)
+    return hashlib.sha1(f.read(size)).hexdigest()
+
+
+def checkpoint_path(log_path, checkpoint_dir, suffix):
+    if checkpoint_dir:
+        name = os.path.abspath(log_path).strip(os.sep).replace(os.sep, "_")
+        return os.path.join(checkpoint_dir, name + suffix)
+    return log_path + suffix
+
+
+def save_json(path, data):
+    # Written to a temporary file first so a crash never leaves a
+    # half-written checkpoint behind.
+    tmp_path = path + ".tmp"
+    try:
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.rename(tmp_path, path)
+    except (IOError, OSError) as e:
+        print "Could not save checkpoint {}: {}".format(path, e)
+
+
+def load_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return {}
+
+
+class StatusCheckpoint(object):
+    """Running sum of the ``status`` field of a status log.
+
+    The byte offset of the last complete line that has been summed is
+    persisted together with the sum and a digest of the head of the log, so
+    the next invocation only reads the lines appended since. The checkpoint
+    is discarded when the log has been replaced, truncated or rewritten.
+    """
+
+    def __init__(self, log_path, checkpoint_dir=None):
+        self.log_path = log_path
+        self.path = checkpoint_path(log_path, checkpoint_dir, ".checkpoint")
+        self.inode = None
+        self.offset = 0
+        self.head_size = 0
+        self.head = None
+        self.status_sum = 0
+        self.lines = 0
+
+    def load(self):
+        data = load_json(self.path)
+        self.inode = data.get("inode")
+        self.offset = data.get("offset", 0)
+        self.head_size = data.get("head_size", 0)
+        self.head = data.get("head")
+        self.status_sum = data.get("status_sum", 0)
+        self.lines = data.get("lines", 0)
+
+    def save(self):
+        save_json(self.path, {"inode": self.inode, "offset": self.offset,
+                              "head_size": self.head_size, "head": self.head,
+                              "status_sum": self.status_sum,
+                              "lines": self.lines})
+
+    def reset(self, inode):
+        self.inode = inode
+        self.offset = 0
+        self.head_size = 0
+        self.head = None
+        self.status_sum = 0
+        self.lines = 0
+
+    def update(self):
+        """Returns the sum of ``status`` over every line of the log."""
+        if is_compressed(self.log_path):
+            # There is no offset to resume a compressed log from, so it is
+            # summed whole every time and no checkpoint is kept.
+            total = 0
+            with open_input(self.log_path) as f:
+                for line in f:
+                    if line.strip():
+                        total += json.loads(line)['status']
+            return total
+
+        self.load()
+        tail_sum = 0
+        with open(self.log_path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            if self.inode != stat.st_ino or stat.st_size < self.offset or \
+                    head_digest(f, self.head_size) != self.head:
+                self.reset(stat.st_ino)
+
+            f.seek(self.offset)
+            for line in f:
+                if not line.endswith("\n"):
+                    # The writer may still be appending this record; count it
+                    # now but read it again next time.
+                    try:
+                        tail_sum += json.loads(line)['status']
+                    except ValueError:
+                        pass
+                    break
+                if line.strip():
+                    self.status_sum += json.loads(line)['status']
+                    self.lines += 1
+                self.offset += len(line)
+
+            # Only summed bytes are hashed, so appending to a log shorter
+            # than HEAD_BYTES does not change its digest.
+            self.head_size = min(self.offset, HEAD_BYTES)
+            self.head = head_digest(f, self.head_size)
+
+        self.save()
+        return self.status_sum + tail_sum
+
+
+class StatusFollower(object):
+    """Tails one status log and yields each JSON record appended to it.
+
+    Only complete lines are consumed; a partially written record is read
+    again on the next poll. When the log is rotated the old file is drained
+    before the new one is opened, and when it is truncated or rewritten
+    reading restarts from the top. save() persists the current position so
+    a restarted follower resumes where the last one stopped, unless the log
+    has been rewritten since. Records are yielded with an id made of the log
+    path, inode, generation and line offset, so a line read again after a
+    crash overwrites its first copy while the lines of a rewritten log,
+    which start over at offset 0 in a new generation, do not.
+    """
+
+    def __init__(self, log_path, checkpoint_dir=None):
+        self.log_path = log_path
+        self.path = checkpoint_path(log_path, checkpoint_dir, ".follow")
+        self.path_key = hashlib.sha1(os.path.abspath(log_path)).hexdigest()[:16]
+        self.file = None
+        self.inode = None
+        self.generation = -1
+        self.offset = 0
+        self.head_size = 0
+        self.head = None
+
+    def _mark(self):
+        # Remembers the head of what has been read so far, then puts the
+        # file back where reading stopped.
+        self.head_size = min(self.offset, HEAD_BYTES)
+        self.head = head_digest(self.file, self.head_size)
+        self.file.seek(self.offset)
+
+    def save(self):
+        if self.inode is None:
+            return
+        if self.file is not None:
+            self._mark()
+        save_json(self.path, {"inode": self.inode, "offset": self.offset,
+                              "generation": self.generation,
+                              "head_size": self.head_size, "head": self.head})
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def _open(self, resume):
+        try:
+            self.file = open(self.log_path, "rb")
+        except IOError:
+            return False
+        inode = os.fstat(self.file.fileno()).st_ino
+        data = load_json(self.path) if resume else {}
+        self.inode = inode
+        if resume and data.get("inode") == inode and head_digest(
+                self.file, data.get("head_size", 0)) == data.get("head"):
+            self.offset = data.get("offset", 0)
+            self.generation = data.get("generation", 0)
+            self._mark()
+        else:
+            # Every restart from the top is a new generation, persisted
+            # right away so a restarted follower never reuses its ids.
+            self.offset = 0
+            self.generation = max(self.generation,
+                                  data.get("generation", -1)) + 1
+            self.save()
+        return True
+
+    def _rewritten(self, stat):
+        if stat.st_size < self.offset:
+            return True
+        # Through a new handle: seeking the open one may land in a read
+        # buffer that still holds the old head.
+        try:
+            with open(self.log_path, "rb") as f:
+                return head_digest(f, self.head_size) != self.head
+        except IOError:
+            return False
+
+    def _read(self):
+        while True:
+            line = self.file.readline()
+            if not line.endswith("\n"):
+                self.file.seek(self.offset)
+                return
+            line_id = "{0}-{1}-{2}-{3}".format(self.path_key, self.inode,
+                                               self.generation, self.offset)
+            self.offset += len(line)
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                print "Skipping malformed line at offset {} of {}: {}".format(
+                    self.offset - len(line), self.log_path, e)
+                continue
+            yield line_id, record
+
+    def poll(self):
+        if self.file is None and not self._open(resume=True):
+            return
+
+        try:
+            stat = os.stat(self.log_path)
+        except OSError:
+            stat = None
+
+        if stat is not None and stat.st_ino != self.inode:
+            for item in self._read():
+                yield item
+            self.close()
+            if not self._open(resume=False):
+                return
+        elif stat is not None and self._rewritten(stat):
+            # Reopen rather than seek, the read buffer may still hold bytes
+            # from before the truncation.
+            self.close()
+            if not self._open(resume=False):
+                return
+
+        for item in self._read():
+            yield item
+        self._mark()
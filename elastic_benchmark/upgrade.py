@@ -1,44 +1,174 @@
 import argparse
 import collections
-import io
+import multiprocessing
 import re
 import sys
 import json
 import subunit
+import tempfile
 import testtools
+import time
 import os
 
 from datetime import datetime
-from elastic_benchmark.main import ElasticSearchClient
-
-
-# Currently Unused
-def parse_console_output(output):
-    deploy_pat = "(?P<name>.*)\s*: ok=(?P<ok>[0-9]*)\s+changed=(?P<changed>[0-9]*)\s+unreachable=(?P<unreachable>[0-9]*)\s+failed=(?P<failed>[0-9]*)\s+Run Time = (?P<runtime>[0-9]*)"
-    upgrade_pat = "(?P<name>.*)\s*: ok=(?P<ok>[0-9]*)\s+changed=(?P<changed>[0-9]*)\s+unreachable=(?P<unreachable>[0-9]*)\s+failed=(?P<failed>[0-9]*)"
-    data = open("upgradeOSASetup.txt").read()
-    runs = []
-    errors = 0
-    ok_total = 0
-    changed_total = 0
-
-    for match in re.finditer(upgrade_pat, data):
-        dic = match.groupdict()
-        dic['name'] = dic['name'].strip()
-        runs.append(dic)
-
-    errors = sum([run.get("unreachable") + run.get("failed") for run in runs])
-    ok_total = sum([run.get("ok") for run in runs])
-    changed_total = sum([run.get("changed") for run in runs])
-    names = ", ".join([run.get("name") for run in runs])
-
-    for run in runs:
-        errors += run.get("unreachable") + run.get("failed")
-        ok_total += run.get("ok")
-        changed_total = run.get("changed")
-
-
-def parse_differences(before, after):
+from multiprocessing.pool import ThreadPool
+from elastic_benchmark.cache import ResultCache
+from elastic_benchmark.inputs import input_file, open_input
+from elastic_benchmark.main import add_bulk_arguments
+from elastic_benchmark.profiling import (
+    CountingReader, Profiler, add_profile_arguments, optional_stage,
+    publish_profile)
+from elastic_benchmark.results import TestStore, diff_tests
+from elastic_benchmark.sinks import claim_stdout, open_sink
+from elastic_benchmark.schema import normalize_status_line, normalize_summary
+from elastic_benchmark.statuslog import StatusCheckpoint, StatusFollower, read_last_line
+
+# Bytes of v1 attachment data per route code held in memory by parse()
+# before it is spilled to a temporary file.
+SPOOL_SIZE = 16 * 1024 * 1024
+
+# Default size limit of the parsed subunit cache.
+CACHE_SIZE = 256 * 1024 * 1024
+
+# Maximum number of added, removed and changed test names put in a summary.
+DIFF_LIMIT = 100
+
+# Ansible output, matched line by line by parse_console_output.
+ANSI_ESCAPE = re.compile(r"\x1b\[[0-9;]*m")
+# Date and/or time a log collector may put in front of each line, e.g.
+# "2017-03-01 12:00:00.123 | " or "[12:00:00] ".
+TIMESTAMP_PREFIX = re.compile(
+    r"^\s*\[?(?:\d{4}-\d{2}-\d{2}[ T])?\d{2}:\d{2}:\d{2}(?:[.,]\d+)?"
+    r"(?:Z|[+-]\d{2}:?\d{2})?\]?\s*\|?\s*")
+RECAP_LINE = re.compile(r"(?P<host>[^\s:]+)\s*:\s*(?P<counts>ok=\d+.*)")
+RECAP_COUNT = re.compile(r"(\w+)=(\d+)")
+RUN_TIME = re.compile(r"Run Time = (\d+)")
+PLAY_NAME = re.compile(r"PLAY \[(?P<name>.*?)\]")
+
+# Maximum number of hosts, recaps and run times listed in a summary.
+CONSOLE_LIMIT = 500
+
+RECAP_COUNTS = ("ok", "changed", "unreachable", "failed", "skipped")
+
+
+def close_recap(recap, recaps, run_times, limit):
+    if recap is None:
+        return
+    if recap["run_time"] is not None and len(run_times) < limit:
+        run_times.append(recap["run_time"])
+    if len(recaps) < limit:
+        recaps.append(recap)
+
+
+def parse_console_output(output, limit=CONSOLE_LIMIT):
+    """Summarizes the console output of an OpenStack-Ansible upgrade.
+
+    The file is streamed one line at a time, and only lines containing one
+    of the markers below are matched against a pattern, so memory stays
+    bounded by the number of hosts whatever the size of the log. Colour
+    codes and timestamp prefixes are stripped from recap lines. Recap
+    counts are summed per host over every PLAY RECAP in the output, and
+    also listed per PLAY RECAP together with the plays it closes and the
+    largest Run Time reported in it.
+    """
+    if output is None:
+        return {"console_recaps": None}
+    elif not os.path.isfile(output):
+        print "File {} does not exist.".format(output)
+        return {"console_recaps": None}
+
+    plays = 0
+    fatal = 0
+    hosts = collections.OrderedDict()
+    recaps = []
+    recaps_total = 0
+    # Run times outside a recap are kept as they are; those on the lines of
+    # a recap count once per recap, since every host line repeats them.
+    run_times = []
+    run_time_total = 0
+    # Plays seen since the last PLAY RECAP, and the recap being read.
+    pending = {"plays": 0, "play": None}
+    recap = None
+    with open_input(output) as f:
+        for line in f:
+            if "Run Time =" in line:
+                match = RUN_TIME.search(line)
+                if match:
+                    run_time = int(match.group(1))
+                    if recap is None:
+                        run_time_total += run_time
+                        if len(run_times) < limit:
+                            run_times.append(run_time)
+                    elif recap["run_time"] is None:
+                        run_time_total += run_time
+                        recap["run_time"] = run_time
+                    elif run_time > recap["run_time"]:
+                        run_time_total += run_time - recap["run_time"]
+                        recap["run_time"] = run_time
+            if "ok=" in line:
+                match = RECAP_LINE.search(TIMESTAMP_PREFIX.sub(
+                    "", ANSI_ESCAPE.sub("", line)))
+                if match:
+                    counts = hosts.setdefault(match.group("host"),
+                                              collections.Counter())
+                    for name, value in RECAP_COUNT.findall(match.group("counts")):
+                        counts[name] += int(value)
+                        if recap is not None and name in RECAP_COUNTS:
+                            recap[name] += int(value)
+                    if recap is not None:
+                        recap["hosts"] += 1
+            elif "PLAY RECAP" in line:
+                close_recap(recap, recaps, run_times, limit)
+                recaps_total += 1
+                recap = dict(pending, recap=recaps_total, hosts=0,
+                             run_time=None)
+                recap.update((name, 0) for name in RECAP_COUNTS)
+                pending = {"plays": 0, "play": None}
+            elif "PLAY [" in line:
+                close_recap(recap, recaps, run_times, limit)
+                recap = None
+                plays += 1
+                pending["plays"] += 1
+                match = PLAY_NAME.search(line)
+                if match and pending["play"] is None:
+                    pending["play"] = match.group("name")
+            elif "fatal: [" in line:
+                fatal += 1
+    close_recap(recap, recaps, run_times, limit)
+
+    totals = collections.Counter()
+    for counts in hosts.values():
+        totals.update(counts)
+    failed_hosts = [host for host, counts in hosts.items()
+                    if counts["failed"] or counts["unreachable"]]
+
+    summary = {"console_plays": plays,
+               "console_recaps": recaps_total,
+               "console_recap_counts": recaps,
+               "console_hosts_total": len(hosts),
+               "console_hosts": [dict(counts, host=host) for host, counts
+                                 in hosts.items()[:limit]],
+               "console_failed_hosts": failed_hosts[:limit],
+               "console_errors": totals["failed"] + totals["unreachable"],
+               "console_fatal_total": fatal,
+               "console_run_times": run_times[:limit],
+               "console_run_time_total": run_time_total}
+    for name in RECAP_COUNTS:
+        summary["console_{0}_total".format(name)] = totals[name]
+    return summary
+
+
+def diff_summary(prefix, before, after, limit):
+    diff = diff_tests(before.tests, after.tests, limit)
+    return {prefix + "_added_tests": diff["added"],
+            prefix + "_removed_tests": diff["removed"],
+            prefix + "_changed_tests": diff["changed"],
+            prefix + "_added_total": diff["added_total"],
+            prefix + "_removed_total": diff["removed_total"],
+            prefix + "_changed_total": diff["changed_total"]}
+
+
+def parse_differences(before, after, limit=DIFF_LIMIT):
     # If the test fails there will be no after tests so it will skip differences logic
     if before is None:
         return {"smoke_before_success_pct": None,
@@ -46,22 +176,17 @@ def parse_differences(before, after):
                 "smoke_before_failures_total": None}
 
     if after:
-        different_keys = set(after.tests.keys()) - set(before.tests.keys())
-        print after.tests.keys()
-        different_keys.update(set(before.tests.keys()) - set(after.tests.keys()))
-        different_keys.update([key for key, value in after.tests.items()
-                           if before.tests.get(key) != value])
-
         before_percentage = int((before.success / float(before.total)) * 100)
         after_percentage = int((after.success / float(after.total))  * 100)
 
-        return {"smoke_different_tests": ", ".join(different_keys),
-                "smoke_before_success_pct": before_percentage,
-                "smoke_after_success_pct": after_percentage,
-                "smoke_before_success_total": before.success,
-                "smoke_after_success_total": after.success,
-                "smoke_before_failures_total": before.failure + before.error,
-                "smoke_after_failures_total": after.failure + after.error}
+        summary = diff_summary("smoke", before, after, limit)
+        summary.update({"smoke_before_success_pct": before_percentage,
+                        "smoke_after_success_pct": after_percentage,
+                        "smoke_before_success_total": before.success,
+                        "smoke_after_success_total": after.success,
+                        "smoke_before_failures_total": before.failure + before.error,
+                        "smoke_after_failures_total": after.failure + after.error})
+        return summary
     else:
         before_percentage = int((before.success / float(before.total)) * 100)
 
@@ -70,22 +195,18 @@ def parse_differences(before, after):
                 "smoke_before_failures_total": before.failure + before.error}
 
 
-def parse_persistence_validation(before, after):
-    different_keys = set(after.tests.keys()) - set(before.tests.keys())
-    different_keys.update(set(before.tests.keys()) - set(after.tests.keys()))
-    different_keys.update([key for key, value in after.tests.items()
-                           if before.tests.get(key) != value])
-
+def parse_persistence_validation(before, after, limit=DIFF_LIMIT):
     before_percentage = before.success / before.total
     after_percentage = after.success / after.total
 
-    return {"pers_different_tests": ", ".join(different_keys),
-            "pers_before_success_pct": before_percentage,
-            "pers_after_success_pct": after_percentage,
-            "pers_before_success_total": before.success,
-            "pers_after_success_total": after.success,
-            "pers_before_failures_total": before.failure + before.error,
-            "pers_after_failures_total": after.failure + after.error}
+    summary = diff_summary("pers", before, after, limit)
+    summary.update({"pers_before_success_pct": before_percentage,
+                    "pers_after_success_pct": after_percentage,
+                    "pers_before_success_total": before.success,
+                    "pers_after_success_total": after.success,
+                    "pers_before_failures_total": before.failure + before.error,
+                    "pers_after_failures_total": after.failure + after.error})
+    return summary
 
 
 def parse_uptime(output):
@@ -96,7 +217,8 @@ def parse_uptime(output):
         print "File {} does not exist.".format(output)
         return {"api_uptime": None}
 
-    data = json.loads(open(output).read())
+    with open_input(output) as f:
+        data = json.load(f)
     api_data = {}
 
     for k,v in data.items():
@@ -115,7 +237,8 @@ def parse_during(output):
         print "File {} does not exist.".format(output)
         return {"during_uptime": None}
 
-    data = json.loads(open(output).read())
+    with open_input(output) as f:
+        data = json.load(f)
     during_data = {}
 
     for k,v in data.items():
@@ -138,11 +261,7 @@ def parse_during_from_status(output):
 
     during_data = {}
 
-    statuslog = open(output, "r")
-    linelist = statuslog.readlines()
-    statuslog.close()
-    line = linelist[len(linelist)-1].strip()
-    line = json.loads(line)
+    line = json.loads(read_last_line(output))
 
     service = line['service']
 
@@ -156,9 +275,8 @@ def parse_during_from_status(output):
     return during_data
 
 
-def parse_api_from_status(output):
+def parse_api_from_status(output, api=True, checkpoint_dir=None):
     # This is for cases when test fails soon
-    cl_args = ArgumentParser().parse_args()
     down_time = 0
     if output is None:
         return {"api_uptime": None}
@@ -168,25 +286,18 @@ def parse_api_from_status(output):
 
     during_data = {}
 
-    statuslog = open(output, "r")
-    linelist = statuslog.readlines()
-    statuslog.close()
-    line = linelist[len(linelist)-1].strip()
-    line = json.loads(line)
+    line = json.loads(read_last_line(output))
     service = line['service']
 
     #If it is one of the api tests go here
-    if cl_args.apig or cl_args.apiw:
-        for i in range(len(linelist)):
-            one_line = linelist[i]
-            one_line = json.loads(one_line)
-            down_time += one_line['status']
+    if api:
+        down_time = StatusCheckpoint(output, checkpoint_dir).update()
         line['total_down'] = line['duration'] - down_time
         uptime_pct = str(round(((float(line['duration']) - line['total_down']) / line['duration']) * 100, 1))
     else:
         uptime_pct = str(round(((line['duration'] - line['total_down']) / line['duration']) * 100, 1))
 
-    if cl_args.apig or cl_args.apiw:
+    if api:
         during_data.update({service + "_api_uptime": uptime_pct})
         during_data.update({service + "_api_duration": round(line['duration'])})
         during_data.update({service + "_api_total_down": round(line['total_down'])})
@@ -204,7 +315,8 @@ def parse_persistence(output):
         print "File {} does not exist.".format(output)
         return {"persistence_uptime": None}
 
-    data = json.loads(open(output).read())
+    with open_input(output) as f:
+        data = json.load(f)
 
     body = {}
 
@@ -242,7 +354,7 @@ def parse_upgrade_time():
 class SubunitParser(testtools.TestResult):
     def __init__(self):
         super(SubunitParser, self).__init__()
-        self.tests = {}
+        self.tests = TestStore()
         self.success = 0
         self.skip = 0
         self.error = 0
@@ -253,24 +365,34 @@ class SubunitParser(testtools.TestResult):
         output = test.shortDescription() or test.id()
         self.success += 1
         self.total += 1
-        self.tests.update({output: "success"})
+        self.tests.add(output, "success")
 
     def addSkip(self, test, err, details=None):
         output = test.shortDescription() or test.id()
         self.skip += 1
-        self.tests.update({output: "skip"})
+        self.tests.add(output, "skip")
 
     def addError(self, test, err, details=None):
         output = test.shortDescription() or test.id()
         self.error += 1
         self.total += 1
-        self.tests.update({output: "error"})
+        self.tests.add(output, "error")
 
     def addFailure(self, test, err, details=None):
         output = test.shortDescription() or test.id()
         self.failure += 1
         self.total += 1
-        self.tests.update({output: "failure"})
+        self.tests.add(output, "failure")
+
+    def __getstate__(self):
+        # Only the tallies survive pickling, which is all the summary needs
+        # when parse() runs in a worker process.
+        return {"tests": self.tests, "success": self.success,
+                "skip": self.skip, "error": self.error,
+                "failure": self.failure, "total": self.total}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
 
     def stopTestRun(self):
         super(SubunitParser, self).stopTestRun()
@@ -281,9 +403,13 @@ class SubunitParser(testtools.TestResult):
 
 class FileAccumulator(testtools.StreamResult):
 
-    def __init__(self, non_subunit_name='pythonlogging'):
+    def __init__(self, non_subunit_name='pythonlogging',
+                 spool_size=SPOOL_SIZE):
         super(FileAccumulator, self).__init__()
-        self.route_codes = collections.defaultdict(io.BytesIO)
+        # Attachments are kept in memory up to spool_size bytes per route
+        # code and spill over to a temporary file beyond that.
+        self.route_codes = collections.defaultdict(
+            lambda: tempfile.SpooledTemporaryFile(max_size=spool_size))
         self.non_subunit_name = non_subunit_name
 
     def status(self, **kwargs):
@@ -321,7 +447,8 @@ class ArgumentParser(argparse.ArgumentParser):
                                                                                                                          
         self.add_argument(
             "-c", "--console", metavar="<console output>",
-            required=False, default=None, help="A link to the console output from the upgrade.")
+            required=False, default=None,
+            help="Ansible console output of the upgrade, summarized per host and play.")
 
         self.add_argument(
             "-u", "--uptime", metavar="<uptime output>",
@@ -367,15 +494,55 @@ class ArgumentParser(argparse.ArgumentParser):
             "-w", "--apiw", metavar="<api status logs>",
             required=False, default=None, help="Api status logs.")
 
+        self.add_argument(
+            "--normalized", action="store_true", default=False,
+            help="Store service-named fields as nested name/metric/value records and manage index templates.")
+
+        self.add_argument(
+            "--diff-limit", metavar="<tests>", type=int,
+            required=False, default=DIFF_LIMIT, help="Maximum number of added, removed and changed tests listed in the summary.")
+
+        self.add_argument(
+            "--spool-size", metavar="<bytes>", type=int,
+            required=False, default=SPOOL_SIZE, help="Bytes of v1 subunit attachments kept in memory before spilling to disk.")
+
+        self.add_argument(
+            "--cache-dir", metavar="<directory>",
+            required=False, default=None, help="Cache parsed subunit files here, keyed by their content.")
+
+        self.add_argument(
+            "--cache-size", metavar="<bytes>", type=int,
+            required=False, default=CACHE_SIZE, help="Size above which the least recently used cache entries are removed.")
+
+        self.add_argument(
+            "--workers", metavar="<threads>", type=int,
+            required=False, default=8, help="Number of threads running the I/O bound summary parsers.")
+
+        self.add_argument(
+            "--follow", action="store_true", default=False,
+            help="Keep tailing the --status files and index new lines as they are written.")
+
+        self.add_argument(
+            "--poll-interval", metavar="<seconds>", type=float,
+            required=False, default=1.0, help="How often followed status files are checked for new lines.")
+
+        self.add_argument(
+            "--checkpoint-dir", metavar="<directory>",
+            required=False, default=None, help="Where status log checkpoints are kept. Defaults to next to each log.")
+
         self.add_argument(
             "-m", "--environment", metavar="<environment>",
             required=False, default="osa_baremetal", help="Environment name for ElasticSearch index.")
 
-        self.add_argument('input', nargs='?', type=argparse.FileType('r'),
-                          default=sys.stdin)
+        add_bulk_arguments(self)
+
+        add_profile_arguments(self)
+
+        self.add_argument('input', nargs='?', type=input_file, default="-")
 
 
-def parse(subunit_file, non_subunit_name="pythonlogging"):
+def parse(subunit_file, non_subunit_name="pythonlogging", spool_size=SPOOL_SIZE,
+          cache_dir=None, cache_size=CACHE_SIZE):
     # In some cases the upgrade may fail in the before test section and there will be no after
     if subunit_file is None:
         return None
@@ -383,68 +550,268 @@ def parse(subunit_file, non_subunit_name="pythonlogging"):
         print "File {} does not exist.".format(subunit_file)
         return None
 
+    if cache_dir:
+        cache = ResultCache(cache_dir, cache_size)
+        key = cache.key(subunit_file, non_subunit_name)
+        subunit_parser = cache.get(key)
+        if subunit_parser is None:
+            subunit_parser = parse_subunit(subunit_file, non_subunit_name, spool_size)
+            cache.put(key, subunit_parser)
+        return subunit_parser
+
+    return parse_subunit(subunit_file, non_subunit_name, spool_size)
+
+
+def parse_subunit(subunit_file, non_subunit_name, spool_size):
     subunit_parser = SubunitParser()
-    stream = open(subunit_file, 'rb')
+    stream = open_input(subunit_file)
     suite = subunit.ByteStreamToStreamResult(
       stream, non_subunit_name=non_subunit_name)
     result = testtools.StreamToExtendedDecorator(subunit_parser)
-    accumulator = FileAccumulator(non_subunit_name)
+    accumulator = FileAccumulator(non_subunit_name, spool_size)
     result = testtools.StreamResultRouter(result)
     result.add_rule(accumulator, 'test_id', test_id=None)
     result.startTestRun()
     suite.run(result)
+    stream.close()
 
-    for bytes_io in accumulator.route_codes.values():  # v1 processing
-        bytes_io.seek(0)
-        suite = subunit.ProtocolTestCase(bytes_io)
+    for spool in accumulator.route_codes.values():  # v1 processing
+        spool.seek(0)
+        suite = subunit.ProtocolTestCase(spool)
         suite.run(subunit_parser)
+        spool.close()
     result.stopTestRun()
 
     return subunit_parser
 
 
+Stage = collections.namedtuple("Stage", ["name", "function", "args", "pool"])
+
+
+def collector_stages(cl_args):
+    # Stages are merged into the summary in this order, whatever order they
+    # finish in. Subunit decoding is CPU bound and goes to worker processes,
+    # everything else mostly waits on file I/O and runs on threads.
+    stages = []
+    api = bool(cl_args.apig or cl_args.apiw)
+    if cl_args.before:
+        parse_args = ("pythonlogging", cl_args.spool_size, cl_args.cache_dir, cl_args.cache_size)
+        stages.append(Stage("before", parse, (cl_args.before,) + parse_args, "process"))
+        stages.append(Stage("after", parse, (cl_args.after,) + parse_args, "process"))
+    stages.extend([
+        Stage("uptime", parse_uptime, (cl_args.uptime,), "thread"),
+        Stage("during", parse_during, (cl_args.during,), "thread"),
+        Stage("swift", parse_during_from_status, (cl_args.swift,), "thread"),
+        Stage("keystone", parse_during_from_status, (cl_args.keystone,), "thread"),
+        Stage("nova", parse_during_from_status, (cl_args.nova,), "thread"),
+        Stage("apig", parse_api_from_status, (cl_args.apig, api, cl_args.checkpoint_dir), "thread"),
+        Stage("apiw", parse_api_from_status, (cl_args.apiw, api, cl_args.checkpoint_dir), "thread"),
+        Stage("persistence", parse_persistence, (cl_args.persistence,), "thread"),
+        Stage("console", parse_console_output, (cl_args.console,), "process"),
+        Stage("upgrade_time", parse_upgrade_time, (), "thread")])
+    return stages
+
+
+def timed_call(function, args):
+    # CPU time is measured in whichever worker ran the stage; stages sharing
+    # the thread pool share one process and overlap.
+    start = time.time()
+    start_cpu = time.clock()
+    result = function(*args)
+    return result, time.time() - start, time.clock() - start_cpu
+
+
+def stage_input_bytes(stage):
+    return sum(os.path.getsize(arg) for arg in stage.args
+               if isinstance(arg, basestring) and os.path.isfile(arg))
+
+
+def _stage_process(connection, function, args):
+    try:
+        outcome = ("result", timed_call(function, args))
+    except Exception as e:
+        outcome = ("error", e)
+    try:
+        connection.send(outcome)
+    except Exception:
+        # The exception itself may not pickle.
+        connection.send(("error", RuntimeError(repr(outcome[1]))))
+    connection.close()
+
+
+class StageProcess(object):
+    # Runs one stage in a child process of its own. The parent keeps only
+    # the reading end of the pipe, so a child that dies without answering
+    # (OOM killer, a crash in a decoder) ends get() instead of hanging it.
+
+    def __init__(self, stage):
+        self.stage = stage
+        self.connection, child_end = multiprocessing.Pipe(False)
+        self.process = multiprocessing.Process(
+            target=_stage_process,
+            args=(child_end, stage.function, stage.args))
+        self.process.daemon = True
+        self.process.start()
+        child_end.close()
+
+    def get(self):
+        try:
+            outcome, value = self.connection.recv()
+        except EOFError:
+            outcome = value = None
+        finally:
+            self.connection.close()
+            self.process.join()
+        if outcome is None:
+            raise RuntimeError("Collector stage {0} died with exit code "
+                               "{1}".format(self.stage.name,
+                                            self.process.exitcode))
+        if outcome == "error":
+            raise value
+        return value
+
+    def stop(self):
+        if self.process.is_alive():
+            self.process.terminate()
+        self.process.join()
+
+
+def run_stages(stages, workers, profiler=None):
+    results = collections.OrderedDict()
+    timings = collections.OrderedDict()
+
+    # Fork the worker processes before any threads exist.
+    processes = [StageProcess(stage) for stage in stages
+                 if stage.pool == "process"]
+    thread_pool = ThreadPool(max(1, workers))
+    try:
+        pending = []
+        children = iter(processes)
+        for stage in stages:
+            if stage.pool == "process":
+                pending.append((stage, next(children)))
+            else:
+                pending.append((stage, thread_pool.apply_async(timed_call, (stage.function, stage.args))))
+
+        for stage, async_result in pending:
+            result, seconds, cpu = async_result.get()
+            results[stage.name] = result
+            timings[stage.name] = round(seconds, 3)
+            if profiler:
+                profiler.add_stage(stage.name, seconds, cpu)
+                profiler.count("bytes_read", stage_input_bytes(stage))
+    finally:
+        thread_pool.terminate()
+        for process in processes:
+            process.stop()
+    return results, timings
+
+
+def status_scenario_name(api):
+    if api:
+        return 'upgrade_api_status_log'
+    return 'upgrade_status_log'
+
+
+def index_status_lines(lines, indexer, environment, api=False, normalized=False):
+    count = 0
+    scenario_name = status_scenario_name(api)
+    for line in lines:
+        if line.strip():
+            line = json.loads(line)
+            if normalized:
+                line = normalize_status_line(line)
+            indexer.index(scenario_name=scenario_name, env=environment, **line)
+            count += 1
+    return count
+
+
+def follow_status(status_files, bulk, scenario_name, cl_args):
+    followers = [StatusFollower(s, cl_args.checkpoint_dir) for s in status_files]
+    print "Following status files: {}".format(", ".join(status_files))
+
+    try:
+        while True:
+            for follower in followers:
+                for line_id, line in follower.poll():
+                    if cl_args.normalized:
+                        line = normalize_status_line(line)
+                    bulk.index(scenario_name=scenario_name, env=cl_args.environment, _id=line_id, **line)
+            if bulk.flush_due():
+                bulk.flush()
+                # Offsets are only stored once everything read so far has
+                # been sent, so a restart never skips unindexed lines. Lines
+                # sent by an automatic flush since are read again, and
+                # overwrite their first copy by _id.
+                for follower in followers:
+                    follower.save()
+            time.sleep(cl_args.poll_interval)
+    except KeyboardInterrupt:
+        print "Stopped following status files."
+    finally:
+        bulk.flush()
+        for follower in followers:
+            follower.save()
+            follower.close()
+
+
 def entry_point():
     current_time = ''
     summary = {}
     cl_args = ArgumentParser().parse_args()
-    esc = ElasticSearchClient()
+    claim_stdout(cl_args)
+    profiler = Profiler() if cl_args.profile else None
 
     # Parses aggregate log file
     if cl_args.status is None:
         current_time = str(datetime.now().strftime("%Y-%m-%dT%H:%M:%S%z"))
 
         print "Start aggregating results."
+        results, timings = run_stages(collector_stages(cl_args), cl_args.workers, profiler)
+        for name, seconds in timings.items():
+            print "Collected {0} in {1:.3f}s".format(name, seconds)
+
         if cl_args.before:
-            before = parse(cl_args.before)
-            after = parse(cl_args.after)
-            summary = parse_differences(before, after)
-        summary.update(parse_uptime(cl_args.uptime))
-        summary.update(parse_during(cl_args.during))
-        summary.update(parse_during_from_status(cl_args.swift))
-        summary.update(parse_during_from_status(cl_args.keystone))
-        summary.update(parse_during_from_status(cl_args.nova))
-        summary.update(parse_api_from_status(cl_args.apig))
-        summary.update(parse_api_from_status(cl_args.apiw))
-        summary.update(parse_persistence(cl_args.persistence))
-        summary.update(parse_upgrade_time())
+            summary = parse_differences(results.pop("before"), results.pop("after"), cl_args.diff_limit)
+        for result in results.values():
+            if result:
+                summary.update(result)
+        summary.update({"collector_timings": timings})
         summary.update({"done_time": current_time})
+        if cl_args.normalized:
+            summary = normalize_summary(summary)
         print summary
-        esc.index(scenario_name='upgrade_test', env=cl_args.environment, **summary)
+        with open_sink(cl_args, profiler) as sink:
+            sink.index(scenario_name='upgrade_test', env=cl_args.environment, **summary)
+        if profiler:
+            profiler.count("documents")
+            publish_profile(profiler, cl_args, "elastic-upgrade")
+        if not sink.report():
+            sys.exit(1)
         print "Done aggregating results. "
     else:
         status_files = [status_files.strip() for status_files in (cl_args.status).split(",")]
-
-        for s in status_files:
-            # Parses status log file
-            print "Start parsing status file: {}".format(str(s))
-
-            if os.path.isfile(s):
-                with open(s) as f:
-                    for line in f:
-                        if line.strip():
-                            line = json.loads(line)
-                            if 'api' in cl_args.status:
-                                esc.index(scenario_name='upgrade_api_status_log', env=cl_args.environment, **line)
-                            else:
-                                esc.index(scenario_name='upgrade_status_log', env=cl_args.environment, **line)
-            print "Done parsing {}".format(str(s))
+        scenario_name = status_scenario_name('api' in cl_args.status)
+
+        with open_sink(cl_args, profiler) as bulk:
+            if cl_args.follow:
+                follow_status(status_files, bulk, scenario_name, cl_args)
+            else:
+                for s in status_files:
+                    # Parses status log file
+                    print "Start parsing status file: {}".format(str(s))
+
+                    if os.path.isfile(s):
+                        with open_input(s) as f, optional_stage(profiler, "status"):
+                            lines = CountingReader(f, profiler) if profiler else f
+                            count = index_status_lines(lines, bulk, cl_args.environment, 'api' in cl_args.status,
+                                                       cl_args.normalized)
+                        if profiler:
+                            profiler.count("documents", count)
+                    print "Done parsing {}".format(str(s))
+            with optional_stage(profiler, "flush"):
+                bulk.flush()
+        if profiler:
+            publish_profile(profiler, cl_args, "elastic-upgrade")
+        if not bulk.report():
+            sys.exit(1)
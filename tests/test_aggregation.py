@@ -0,0 +1,170 @@
+import datetime
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from elastic_benchmark.aggregation import (
+    RollupAggregator, RunAggregator, RunningStats, merge_saved_runs)
+from elastic_benchmark.main import parse_output
+from elastic_benchmark.merge import merged_docs
+from elastic_benchmark.sketch import QuantileSketch
+
+
+def iteration(runtime, passed=True, **actions):
+    return {"run_at": "2017-01-01T00:00:00", "runtime": runtime,
+            "result": "pass" if passed else "fail",
+            "atomic_actions": actions}
+
+
+class RunningStatsTest(unittest.TestCase):
+
+    def test_merge(self):
+        first, second = RunningStats(QuantileSketch()), RunningStats(
+            QuantileSketch())
+        for value in (1.0, 2.0):
+            first.add(value)
+        second.add(6.0)
+        first.merge(second)
+        self.assertEqual((3, 9.0, 1.0, 6.0), (first.count, first.total,
+                                              first.min, first.max))
+        self.assertEqual(3, first.sketch.count)
+
+    def test_merge_without_sketches(self):
+        first, second = RunningStats(), RunningStats()
+        second.add(1.0)
+        first.merge(second)
+        self.assertEqual({"min": 1.0, "max": 1.0, "avg": 1.0},
+                         first.as_dict())
+
+    def test_merge_mismatched_sketches(self):
+        with_sketch = RunningStats(QuantileSketch())
+        without = RunningStats()
+        without.add(1.0)
+        with self.assertRaises(ValueError):
+            with_sketch.merge(without)
+        with self.assertRaises(ValueError):
+            without.merge(with_sketch)
+
+
+class RunAggregatorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def aggregator(self, run_id, docs, percentiles=(50,)):
+        aggregator = RunAggregator("before_boot", run_id, percentiles)
+        for doc in docs:
+            aggregator.add(doc)
+        return aggregator
+
+    def save(self, name, *aggregators):
+        path = os.path.join(self.directory, name)
+        with open(path, "w") as f:
+            for aggregator in aggregators:
+                f.write(json.dumps(aggregator.to_dict()) + "\n")
+        return path
+
+    def test_doc(self):
+        doc = self.aggregator("a", [iteration(1.0, boot=2.0),
+                                    iteration(3.0, False, boot=4.0)]).doc()
+        self.assertEqual(0.5, doc["success_percentage"])
+        self.assertEqual(2.0, doc["avg_runtime"])
+        self.assertEqual(2, doc["action_count"])
+        self.assertEqual(3.0, doc["atomic_actions"]["boot"]["avg"])
+        self.assertIn("p50", doc["atomic_actions"]["boot"])
+
+    def test_merge_saved_runs(self):
+        first = self.aggregator("a", [iteration(1.0, boot=1.0)])
+        second = self.aggregator("b", [iteration(3.0, False, boot=3.0,
+                                                 ssh=1.0)])
+        paths = [self.save("one.json", first), self.save("two.json", second)]
+
+        merged = merge_saved_runs(paths)["before_boot"]
+        self.assertEqual(["a", "b"], merged.run_ids)
+        self.assertEqual(2, merged.count)
+        self.assertEqual(1, merged.passes)
+        self.assertEqual(2, merged.runtime.sketch.count)
+        self.assertEqual(1, merged.atomic_actions["ssh"].count)
+
+    def test_merged_docs(self):
+        paths = [self.save("runs.json",
+                           self.aggregator("a", [iteration(1.0)]),
+                           self.aggregator("b", [iteration(2.0)]))]
+        doc, = merged_docs(paths)
+        again, = merged_docs(paths)
+        self.assertEqual(["a", "b"], doc["merged_runs"])
+        self.assertEqual(doc["_id"], again["_id"])
+        self.assertNotIn(doc["run_id"], ("a", "b"))
+        self.assertEqual(1.5, doc["avg_runtime"])
+
+    def test_merge_with_and_without_percentiles(self):
+        paths = [self.save("runs.json",
+                           self.aggregator("a", [iteration(1.0)]),
+                           self.aggregator("b", [iteration(2.0)], ()))]
+        with self.assertRaises(ValueError):
+            merge_saved_runs(paths)
+
+
+def rally_report(timestamps):
+    return json.dumps([{"key": {"name": "Boot"}, "result": [
+        {"timestamp": timestamp, "duration": 1.0,
+         "error": ["Fail"] if i % 4 == 3 else [],
+         "atomic_actions": {"nova.boot": 0.5}}
+        for i, timestamp in enumerate(timestamps)]}])
+
+
+class RollupAggregatorTest(unittest.TestCase):
+
+    def test_buckets(self):
+        rollup = RollupAggregator("before_boot", "run", 60, (50,))
+        # Out of order, as Rally may report them.
+        for timestamp, runtime, passed in ((125.0, 2.0, True),
+                                           (61.0, 1.0, False),
+                                           (119.9, 3.0, True),
+                                           (130.0, 4.0, True)):
+            rollup.add(iteration(runtime, passed), timestamp)
+
+        docs = list(rollup.docs())
+        self.assertEqual([60, 120], [start for start, _ in docs])
+        first, second = docs[0][1], docs[1][1]
+        self.assertEqual("rollup_results", first["scenario_name"])
+        self.assertEqual("before_boot", first["scenario"])
+        self.assertEqual(datetime.datetime.fromtimestamp(60).strftime(
+            "%Y-%m-%dT%H:%M:%S"), first["timestamp"])
+        self.assertEqual(60, first["bucket_seconds"])
+        self.assertEqual((1, 1, 2.0), (first["pass_count"],
+                                       first["fail_count"],
+                                       first["avg_runtime"]))
+        self.assertEqual((2, 0, 3.0), (second["pass_count"],
+                                       second["fail_count"],
+                                       second["avg_runtime"]))
+        self.assertIn("p50", second["runtime_stats"])
+
+    def test_parse_output(self):
+        docs = list(parse_output(rally_report(range(1000, 1100)), "before",
+                                 percentiles=[], run_key="report",
+                                 rollup_seconds=30, raw_sample=0.25))
+        rollups = [doc for doc in docs
+                   if doc["scenario_name"] == "rollup_results"]
+        summary, = [doc for doc in docs
+                    if doc["scenario_name"] == "aggregated_results"]
+        iterations = [doc for doc in docs if doc["scenario_name"] ==
+                      "before_Boot"]
+
+        # Every iteration counts towards the summary and rollups, only a
+        # sample of them is indexed, always the same one.
+        self.assertEqual(100, summary["action_count"])
+        self.assertEqual(100, sum(doc["pass_count"] + doc["fail_count"]
+                                  for doc in rollups))
+        self.assertEqual(len(rollups), len(set(doc["_id"] for doc in rollups)))
+        self.assertTrue(10 < len(iterations) < 40)
+        again = parse_output(rally_report(range(1000, 1100)), "before",
+                             percentiles=[], run_key="report",
+                             rollup_seconds=30, raw_sample=0.25)
+        self.assertEqual([doc["_id"] for doc in docs],
+                         [doc["_id"] for doc in again])
@@ -0,0 +1,62 @@
+import json
+import os
+import shutil
+import signal
+import tempfile
+import unittest
+
+from elastic_benchmark import batch
+from elastic_benchmark.main import ArgumentParser
+
+
+def report(iterations):
+    return json.dumps([{"key": {"name": "Boot"}, "result": [
+        {"timestamp": 1500000000 + i, "duration": 1.0, "error": [],
+         "atomic_actions": {"nova.boot": 0.5}} for i in range(iterations)]}])
+
+
+class IngestFilesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.parse_output = batch.parse_output
+
+    def tearDown(self):
+        batch.parse_output = self.parse_output
+        shutil.rmtree(self.directory)
+
+    def write(self, name, data):
+        path = os.path.join(self.directory, name)
+        with open(path, "w") as f:
+            f.write(data)
+        return path
+
+    def ingest(self, paths):
+        cl_args = ArgumentParser().parse_args(
+            ["-e", "env", "--sink", "null", "--workers", "2"] + paths)
+        return batch.ingest_files(paths, cl_args)
+
+    def test_failed_file_is_isolated(self):
+        paths = [self.write("good.json", report(3)),
+                 self.write("bad.json", "[{"),
+                 self.write("missing.json", "")]
+        os.remove(paths[2])
+        self.assertFalse(self.ingest(paths))
+
+    def test_all_files_parsed(self):
+        paths = [self.write("{0}.json".format(i), report(i + 1))
+                 for i in range(3)]
+        self.assertTrue(self.ingest(paths))
+
+    def test_killed_worker(self):
+        def parse_output(f, *args, **kwargs):
+            if "killed" in f.name:
+                os.kill(os.getpid(), signal.SIGKILL)
+            return self.parse_output(f, *args, **kwargs)
+
+        # Workers are forked after this, so they inherit the patch.
+        batch.parse_output = parse_output
+        paths = [self.write("one.json", report(2)),
+                 self.write("killed.json", report(2)),
+                 self.write("two.json", report(2))]
+        self.assertFalse(self.ingest(paths))
@@ -0,0 +1,118 @@
+import json
+import threading
+import time
+import unittest
+
+from elasticsearch.serializer import JSONSerializer
+
+from elastic_benchmark.main import BulkIndexer, ConcurrentBulkIndexer
+
+
+class FakeClient(object):
+    """Bulk endpoint recording requests, optionally blocked or failing."""
+
+    class transport(object):
+        serializer = JSONSerializer()
+
+    def __init__(self, status=201, error=None):
+        self.status = status
+        self.error = error
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.released = threading.Event()
+        self.released.set()
+        self.lock = threading.Lock()
+
+    def bulk(self, body):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            self.released.wait()
+            if self.error:
+                raise self.error
+            lines = body.splitlines()
+            with self.lock:
+                self.requests.append(lines)
+            return {"items": [
+                {"index": {"_index": json.loads(action)["index"]["_index"],
+                           "status": self.status}}
+                for action in lines[::2]]}
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+
+class BulkIndexerTest(unittest.TestCase):
+
+    def test_batches(self):
+        client = FakeClient()
+        with BulkIndexer(client, batch_size=2) as indexer:
+            for i in range(5):
+                indexer.index("boot", "env", _id=str(i), n=i)
+        self.assertEqual([4, 4, 2], [len(lines) for lines in client.requests])
+        self.assertEqual(5, indexer.indexed)
+        self.assertTrue(indexer.report())
+
+    def test_rejected_items(self):
+        client = FakeClient(status=400)
+        with BulkIndexer(client) as indexer:
+            indexer.index("boot", "env", n=1)
+        self.assertEqual([("env_boot", 400, None)], indexer.failures)
+        self.assertFalse(indexer.delivered())
+
+
+class ConcurrentBulkIndexerTest(unittest.TestCase):
+
+    def test_requests_in_flight(self):
+        client = FakeClient()
+        client.released.clear()
+        indexer = ConcurrentBulkIndexer(client, concurrency=3, queue_size=10,
+                                        batch_size=1)
+        for i in range(6):
+            indexer.index("boot", "env", n=i)
+        deadline = time.time() + 5
+        while client.in_flight < 3 and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(3, client.in_flight)
+        client.released.set()
+        indexer.close()
+        self.assertEqual(3, client.max_in_flight)
+        self.assertEqual(6, indexer.indexed)
+        self.assertEqual(range(6), sorted(json.loads(lines[1])["n"]
+                                          for lines in client.requests))
+
+    def test_backpressure(self):
+        client = FakeClient()
+        client.released.clear()
+        indexer = ConcurrentBulkIndexer(client, concurrency=1, queue_size=1,
+                                        batch_size=1)
+        indexed = []
+
+        def produce():
+            for i in range(4):
+                indexer.index("boot", "env", n=i)
+                indexed.append(i)
+
+        producer = threading.Thread(target=produce)
+        producer.daemon = True
+        producer.start()
+        time.sleep(0.2)
+        # One batch is being sent and one waits in the queue; the third
+        # index() call blocks until a slot frees up.
+        self.assertEqual([0, 1], indexed)
+        client.released.set()
+        producer.join(5)
+        indexer.close()
+        self.assertEqual(4, indexer.indexed)
+
+    def test_failed_requests(self):
+        client = FakeClient(error=IOError("cluster down"))
+        indexer = ConcurrentBulkIndexer(client, concurrency=2, batch_size=2)
+        for i in range(3):
+            indexer.index("boot", "env", n=i)
+        indexer.flush()
+        self.assertEqual(3, len(indexer.failures))
+        self.assertEqual((None, None, "cluster down"), indexer.failures[0])
+        indexer.close()
@@ -0,0 +1,61 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from elastic_benchmark.cache import ResultCache
+
+
+class ResultCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = ResultCache(os.path.join(self.directory, "cache"))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, data):
+        path = os.path.join(self.directory, name)
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def entries(self):
+        return sorted(name for name in os.listdir(self.cache.directory)
+                      if name.endswith(ResultCache.suffix))
+
+    def test_key(self):
+        first = self.write("a.subunit", "results")
+        copy = self.write("b.subunit", "results")
+        other = self.write("c.subunit", "other results")
+        self.assertEqual(self.cache.key(first), self.cache.key(copy))
+        self.assertNotEqual(self.cache.key(first), self.cache.key(other))
+        self.assertNotEqual(self.cache.key(first),
+                            self.cache.key(first, "v1 attachments"))
+
+    def test_round_trip(self):
+        self.assertIsNone(self.cache.get("missing"))
+        self.cache.put("key", {"test_a": "success"})
+        self.assertEqual({"test_a": "success"}, self.cache.get("key"))
+
+    def test_corrupt_entry(self):
+        self.cache.put("key", [1, 2])
+        with open(self.cache._path("key"), "wb") as f:
+            f.write("not zlib")
+        self.assertIsNone(self.cache.get("key"))
+        self.assertEqual([], self.entries())
+
+    def test_least_recently_used_evicted(self):
+        value = os.urandom(4096)
+        self.cache.put("old", value)
+        self.cache.put("used", value)
+        os.utime(self.cache._path("old"), (1, 1))
+        os.utime(self.cache._path("used"), (2, 2))
+        self.cache.get("used")
+
+        size = os.path.getsize(self.cache._path("used"))
+        self.cache.max_bytes = size * 2
+        self.cache.put("new", value)
+        self.assertEqual(["new" + ResultCache.suffix,
+                          "used" + ResultCache.suffix], self.entries())
@@ -0,0 +1,148 @@
+import unittest
+
+from elastic_benchmark.compare import (
+    collect_side, compare_runs, deltas, iteration_indices, scenario_key)
+
+
+def stats(count, avg=None, p95=None):
+    bucket = {"stats": {"count": count, "avg": avg, "min": avg, "max": avg}}
+    if p95 is not None:
+        bucket["percentiles"] = {"values": {"95.0": p95}}
+    return bucket
+
+
+def scenario_bucket(index, count, passes, runtime, boot=None):
+    bucket = dict(stats(count, runtime, runtime * 2),
+                  key={"index": index}, doc_count=count,
+                  passes={"doc_count": passes})
+    bucket["action_0"] = stats(1, boot) if boot else stats(0)
+    return bucket
+
+
+class FakeIndices(object):
+
+    def __init__(self, mappings):
+        self.mappings = mappings
+
+    def get_mapping(self, **kwargs):
+        return self.mappings
+
+
+class FakeClient(object):
+    """Answers searches with canned composite aggregation pages."""
+
+    def __init__(self, mappings, pages):
+        self.indices = FakeIndices(mappings)
+        self.pages = list(pages)
+        self.queries = []
+
+    def search(self, index, body, **kwargs):
+        self.queries.append(body)
+        buckets, after_key = self.pages.pop(0)
+        scenarios = {"buckets": buckets}
+        if after_key:
+            scenarios["after_key"] = after_key
+        return {"aggregations": {"scenarios": scenarios}}
+
+
+class ScenarioKeyTest(unittest.TestCase):
+
+    def test_prefixes(self):
+        self.assertEqual("boot", scenario_key("env", "env_before_boot"))
+        self.assertEqual("boot", scenario_key("env", "env_after_boot"))
+        self.assertEqual("boot", scenario_key("env", "env__boot"))
+        self.assertEqual("boot", scenario_key("env", "env_boot"))
+
+    def test_iteration_indices(self):
+        indices = iteration_indices("env").split(",")
+        self.assertEqual("env_*", indices[0])
+        self.assertIn("-env_aggregated_results", indices)
+
+
+class DeltasTest(unittest.TestCase):
+
+    def test_deltas(self):
+        self.assertEqual(
+            {"avg": {"before": 2.0, "after": 3.0, "change_pct": 50.0},
+             "min": {"before": 0, "after": 1.0, "change_pct": None}},
+            deltas({"avg": 2.0, "min": 0, "max": None, "p95": 1.0},
+                   {"avg": 3.0, "min": 1.0, "max": 4.0}))
+
+
+class CompareRunsTest(unittest.TestCase):
+
+    def scenario(self, success, runtime, boot):
+        return {"count": 10, "success_percentage": success,
+                "runtime": {"avg": runtime, "max": runtime * 3},
+                "actions": {"boot": {"avg": boot, "p95": boot}}}
+
+    def test_regressions(self):
+        before = {"boot": self.scenario(100.0, 2.0, 1.0),
+                  "gone": self.scenario(100.0, 1.0, 1.0)}
+        after = {"boot": self.scenario(98.0, 2.1, 1.5),
+                 "new": self.scenario(100.0, 1.0, 1.0)}
+        report = compare_runs(before, after)
+        self.assertEqual(["boot", "gone", "new"],
+                         [row["scenario"] for row in report])
+        self.assertEqual("before", report[2]["missing"])
+        self.assertEqual("after", report[1]["missing"])
+        # A 5% runtime increase and the slower max are within the limits.
+        self.assertEqual(["success_percentage", "boot.avg", "boot.p95"],
+                         report[0]["regressions"])
+        self.assertEqual(-2.0, report[0]["success_delta"])
+
+    def test_thresholds(self):
+        before = {"boot": self.scenario(100.0, 2.0, 1.0)}
+        after = {"boot": self.scenario(98.0, 2.1, 1.5)}
+        report = compare_runs(before, after, runtime_threshold=60.0,
+                              success_threshold=5.0)
+        self.assertEqual([], report[0]["regressions"])
+
+
+class CollectSideTest(unittest.TestCase):
+
+    mappings = {"env_before_boot": {"mappings": {"results": {"properties": {
+        "result": {"type": "text", "fields": {"keyword": {}}},
+        "atomic_actions": {"properties": {"nova:boot": {}}}}}}}}
+
+    def test_pages(self):
+        client = FakeClient(self.mappings, [
+            ([scenario_bucket("env_before_boot", 4, 3, 2.0, boot=1.5)],
+             {"index": "env_before_boot"}),
+            ([scenario_bucket("env_before_list", 2, 2, 0.5)],
+             {"index": "env_before_list"}),
+            ([], None)])
+        scenarios = collect_side(client, "env", [95], page_size=1)
+
+        self.assertEqual(["boot", "list"], sorted(scenarios))
+        boot = scenarios["boot"]
+        self.assertEqual(4, boot["count"])
+        self.assertEqual(75.0, boot["success_percentage"])
+        self.assertEqual({"avg": 2.0, "min": 2.0, "max": 2.0, "p95": 4.0},
+                         boot["runtime"])
+        self.assertEqual({"nova:boot": {"avg": 1.5, "min": 1.5,
+                                        "max": 1.5}}, boot["actions"])
+        self.assertEqual({}, scenarios["list"]["actions"])
+
+        # Pages follow each other and passes match on the keyword field.
+        self.assertEqual(3, len(client.queries))
+        self.assertNotIn("after", client.queries[0]["aggs"]["scenarios"][
+            "composite"])
+        self.assertEqual({"index": "env_before_list"}, client.queries[2][
+            "aggs"]["scenarios"]["composite"]["after"])
+        self.assertEqual({"term": {"result.keyword": "pass"}},
+                         client.queries[0]["aggs"]["scenarios"]["aggs"][
+                             "passes"]["filter"])
+
+    def test_nested_actions(self):
+        mappings = {"env_boot": {"mappings": {"properties": {
+            "result": {"type": "keyword"},
+            "atomic_actions": {"type": "nested"}}}}}
+        bucket = scenario_bucket("env_boot", 2, 2, 1.0)
+        del bucket["action_0"]
+        bucket["records"] = {"names": {"buckets": [
+            dict(stats(2, 0.5), key="nova:boot")]}}
+        client = FakeClient(mappings, [([bucket], None)])
+        scenarios = collect_side(client, "env", [])
+        self.assertEqual({"nova:boot": {"avg": 0.5, "min": 0.5, "max": 0.5}},
+                         scenarios["boot"]["actions"])
@@ -0,0 +1,107 @@
+import bz2
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+import zlib
+
+from elastic_benchmark.inputs import (
+    DecompressingReader, MappedReader, decompressor_factory, expand_inputs,
+    is_compressed, open_input)
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+
+def gzip_member(data):
+    compressor = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+LINES = "".join("line {0}\n".format(i) for i in range(1000))
+
+
+class DecompressingReaderTest(unittest.TestCase):
+
+    def read(self, name, members, chunk_size):
+        stream = tempfile.TemporaryFile()
+        stream.write("".join(members))
+        stream.seek(0)
+        with DecompressingReader(stream, decompressor_factory(name),
+                                 chunk_size) as reader:
+            return list(reader)
+
+    def check_members(self, name, compress):
+        members = [compress(LINES), compress(LINES)]
+        expected = (LINES * 2).splitlines(True)
+        # A chunk ending exactly where the first member does, as well as
+        # chunks splitting members at arbitrary points.
+        for chunk_size in (len(members[0]), 7, 4096):
+            self.assertEqual(expected, self.read(name, members, chunk_size))
+
+    def test_gzip_members(self):
+        self.check_members("gzip", gzip_member)
+
+    def test_bzip2_streams(self):
+        self.check_members("bzip2", bz2.compress)
+
+    @unittest.skipIf(lzma is None, "lzma is not available")
+    def test_xz_streams(self):
+        self.check_members("xz", lzma.compress)
+
+    def test_read_and_readline(self):
+        stream = tempfile.TemporaryFile()
+        stream.write(gzip_member(LINES))
+        stream.seek(0)
+        reader = DecompressingReader(stream, decompressor_factory("gzip"), 5)
+        self.assertEqual("line 0\n", reader.readline())
+        self.assertEqual("line", reader.readline(4))
+        self.assertEqual(" 1\nline 2\n", reader.read(10))
+        self.assertEqual(LINES[21:], reader.read())
+        self.assertEqual("", reader.readline())
+
+
+class OpenInputTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def test_detected_by_content(self):
+        # The name says nothing about the compression.
+        with gzip.open(self.path("report.json"), "wb") as f:
+            f.write(LINES)
+        self.assertTrue(is_compressed(self.path("report.json")))
+        with open_input(self.path("report.json")) as f:
+            self.assertEqual(LINES, f.read())
+
+    def test_plain_and_mapped(self):
+        with open(self.path("plain"), "w") as f:
+            f.write(LINES)
+        self.assertFalse(is_compressed(self.path("plain")))
+        with open_input(self.path("plain")) as f:
+            self.assertEqual(LINES, f.read())
+        with open_input(self.path("plain"), mmap_threshold=0) as f:
+            self.assertIsInstance(f, MappedReader)
+            self.assertEqual(LINES.splitlines(True), list(f))
+
+    def test_expand_inputs(self):
+        os.makedirs(self.path("runs/b"))
+        for name in ("runs/a.json", "runs/b/c.json", "runs/.hidden"):
+            open(self.path(name), "w").close()
+        self.assertEqual(
+            [self.path("runs/a.json"), self.path("runs/b/c.json"),
+             self.path("missing*")],
+            expand_inputs([self.path("runs"), self.path("runs/*.json"),
+                           self.path("missing*")]))
@@ -0,0 +1,79 @@
+import collections
+import json
+import StringIO
+import unittest
+
+from elastic_benchmark.jsonstream import JSONStreamReader
+
+
+def events(data, chunk_size):
+    return list(JSONStreamReader(StringIO.StringIO(data),
+                                 chunk_size).iter_events())
+
+
+def expected_events(data):
+    # What iter_events should yield, worked out from the fully decoded
+    # report with its member order kept.
+    report = json.loads(data, object_pairs_hook=collections.OrderedDict)
+    result = []
+    for scenario in report:
+        result.append(("start", None))
+        for name, value in scenario.items():
+            if name == "result":
+                result.extend(("iteration", ir) for ir in value)
+            else:
+                result.append(("field", (name, value)))
+        result.append(("end", None))
+    return result
+
+
+class JSONStreamReaderTest(unittest.TestCase):
+
+    report = [
+        {"key": {"name": "NovaServers.boot", "kw": {"args": {}}},
+         "result": [{"duration": 12345.678, "error": [],
+                     "atomic_actions": {"nova.boot_server": 1.5e-3}},
+                    {"duration": 7, "error": ["Timeout", "x\"y"],
+                     "atomic_actions": {}}],
+         "sla": [], "load_duration": 10},
+        {"result": [], "key": {"name": u"Keystone.auth \\ \u00e9"},
+         "full_duration": None, "flag": True}]
+
+    def test_every_chunk_boundary(self):
+        data = json.dumps(self.report, indent=1)
+        expected = expected_events(data)
+        for chunk_size in range(1, 40):
+            self.assertEqual(expected, events(data, chunk_size),
+                             "chunk size {0}".format(chunk_size))
+
+    def test_compact_input(self):
+        data = json.dumps(self.report, separators=(",", ":"))
+        expected = expected_events(data)
+        for chunk_size in (1, 2, 3, 5, 8, 64 * 1024):
+            self.assertEqual(expected, events(data, chunk_size))
+
+    def test_number_split_at_boundary(self):
+        # "1234" must not be taken for the whole of "12345".
+        data = '[{"result": [12345, 6]}]'
+        for chunk_size in range(1, len(data) + 1):
+            self.assertEqual(
+                [("start", None), ("iteration", 12345), ("iteration", 6),
+                 ("end", None)],
+                events(data, chunk_size))
+
+    def test_number_at_end_of_input(self):
+        reader = JSONStreamReader(StringIO.StringIO("12345"), 2)
+        self.assertEqual(12345, reader._value())
+
+    def test_empty_report(self):
+        self.assertEqual([], events(" [ ] ", 1))
+
+    def test_truncated_input(self):
+        data = json.dumps(self.report)
+        for end in (0, 1, len(data) // 2, len(data) - 1):
+            with self.assertRaises(ValueError):
+                events(data[:end], 7)
+
+    def test_invalid_delimiter(self):
+        with self.assertRaises(ValueError):
+            events('[{"key": 1; "result": []}]', 4)
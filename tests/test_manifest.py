@@ -0,0 +1,73 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from elastic_benchmark.main import ArgumentParser, manifest_context
+from elastic_benchmark.manifest import Manifest, file_digest
+
+
+class ManifestTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "manifest.json")
+        self.report = os.path.join(self.directory, "report.json")
+        with open(self.report, "w") as f:
+            f.write("[]")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def context(self, *args):
+        return manifest_context(ArgumentParser().parse_args(
+            list(args) + [self.report]))
+
+    def record(self, context):
+        manifest = Manifest(self.path, context)
+        manifest.record(self.report, file_digest(self.report))
+        manifest.save()
+
+    def test_same_context(self):
+        context = self.context("-e", "one")
+        self.record(context)
+        manifest = Manifest(self.path, context)
+        self.assertTrue(manifest.unchanged(self.report))
+        self.assertTrue(manifest.ingested(file_digest(self.report)))
+
+    def test_copy_is_ingested(self):
+        context = self.context("-e", "one")
+        self.record(context)
+        copy = os.path.join(self.directory, "copy.json")
+        shutil.copy(self.report, copy)
+        manifest = Manifest(self.path, context)
+        self.assertFalse(manifest.unchanged(copy))
+        self.assertTrue(manifest.ingested(file_digest(copy)))
+
+    def test_modified_file(self):
+        context = self.context("-e", "one")
+        self.record(context)
+        with open(self.report, "w") as f:
+            f.write("[ ]")
+        manifest = Manifest(self.path, context)
+        self.assertFalse(manifest.unchanged(self.report))
+        self.assertFalse(manifest.ingested(file_digest(self.report)))
+
+    def test_other_contexts(self):
+        self.record(self.context("-e", "one"))
+        for args in (("-e", "two"), ("-e", "one", "--normalized"),
+                     ("-e", "one", "--rollup", "60"),
+                     ("-e", "one", "--raw-sample", "0.1"),
+                     ("-e", "one", "--sink", "null")):
+            manifest = Manifest(self.path, self.context(*args))
+            self.assertFalse(manifest.unchanged(self.report), args)
+            self.assertFalse(manifest.ingested(file_digest(self.report)))
+
+    def test_contexts_kept_apart(self):
+        self.record(self.context("-e", "one"))
+        self.record(self.context("-e", "two"))
+        with open(self.path) as f:
+            self.assertEqual(2, len(json.load(f)))
+        self.assertTrue(Manifest(self.path, self.context("-e", "one"))
+                        .unchanged(self.report))
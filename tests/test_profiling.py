@@ -0,0 +1,61 @@
+import multiprocessing
+import time
+import unittest
+
+from elastic_benchmark.profiling import LATENCY_BOUNDS_MS, Profiler
+
+
+def burn(seconds):
+    end = time.time() + seconds
+    while time.time() < end:
+        pass
+
+
+class ProfilerTest(unittest.TestCase):
+
+    def test_nested_stages_charge_self_time(self):
+        profiler = Profiler()
+        with profiler.stage("outer"):
+            time.sleep(0.05)
+            with profiler.stage("inner"):
+                time.sleep(0.1)
+        stages = profiler.report()["stages"]
+        self.assertAlmostEqual(0.05, stages["outer"]["wall_seconds"],
+                               delta=0.04)
+        self.assertAlmostEqual(0.1, stages["inner"]["wall_seconds"],
+                               delta=0.04)
+
+    def test_timed_charges_producer_only(self):
+        profiler = Profiler()
+
+        def produce():
+            for i in range(3):
+                time.sleep(0.02)
+                yield i
+
+        for _ in profiler.timed("produce", produce()):
+            time.sleep(0.05)
+        stage = profiler.report()["stages"]["produce"]
+        self.assertEqual(4, stage["calls"])
+        self.assertLess(stage["wall_seconds"], 0.12)
+
+    def test_request_histogram(self):
+        profiler = Profiler()
+        profiler.request(time.sleep, 0.003)
+        with self.assertRaises(ZeroDivisionError):
+            profiler.request(lambda: 1 / 0)
+        requests = profiler.report()["es_requests"]
+        self.assertEqual(2, requests["count"])
+        self.assertEqual(1, requests["latency_ms"]["5"])
+        self.assertEqual(len(LATENCY_BOUNDS_MS) + 1,
+                         len(requests["latency_ms"]))
+
+    def test_child_processes(self):
+        profiler = Profiler()
+        child = multiprocessing.Process(target=burn, args=(0.3,))
+        child.start()
+        child.join()
+        report = profiler.report()
+        self.assertGreater(report["children_cpu_seconds"], 0.2)
+        self.assertLess(report["cpu_seconds"], 0.2)
+        self.assertGreater(report["children_peak_rss_kb"], 0)
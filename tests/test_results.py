@@ -0,0 +1,80 @@
+import pickle
+import random
+import unittest
+
+from elastic_benchmark.results import STATUSES, TestStore, diff_tests
+
+
+def store(results):
+    tests = TestStore()
+    for test_id, status in results.items():
+        tests.add(test_id, status)
+    return tests
+
+
+def naive_diff(before, after):
+    # Reference answer worked out with plain dicts and sets.
+    return {"added": sorted(set(after) - set(before)),
+            "removed": sorted(set(before) - set(after)),
+            "changed": [{"test": test_id, "before": before[test_id],
+                         "after": after[test_id]}
+                        for test_id in sorted(set(before) & set(after))
+                        if before[test_id] != after[test_id]]}
+
+
+class TestStoreTest(unittest.TestCase):
+
+    def test_lookup(self):
+        tests = store({"b": "success", "a": "failure"})
+        self.assertEqual(["a", "b"], tests.keys())
+        self.assertEqual("failure", tests.get("a"))
+        self.assertIsNone(tests.get("c"))
+        self.assertIn("b", tests)
+        self.assertEqual(2, len(tests))
+
+    def test_add_after_read(self):
+        tests = store({"a": "success"})
+        self.assertEqual(1, len(tests))
+        tests.add("a", "error")
+        tests.add("0", "skip")
+        self.assertEqual([("0", "skip"), ("a", "error")], tests.items())
+
+    def test_pickle(self):
+        tests = store({"a": "success", "b": "skip"})
+        restored = pickle.loads(pickle.dumps(tests, 2))
+        self.assertEqual(tests.items(), restored.items())
+
+
+class DiffTestsTest(unittest.TestCase):
+
+    def test_matches_naive_diff(self):
+        rng = random.Random(3)
+        for _ in range(50):
+            names = ["test_{0}".format(i) for i in range(rng.randint(0, 60))]
+            before = {name: rng.choice(STATUSES) for name in names
+                      if rng.random() < 0.7}
+            after = {name: rng.choice(STATUSES) for name in names
+                     if rng.random() < 0.7}
+            diff = diff_tests(store(before), store(after))
+            expected = naive_diff(before, after)
+            for kind in ("added", "removed", "changed"):
+                self.assertEqual(expected[kind], diff[kind])
+                self.assertEqual(len(expected[kind]),
+                                 diff[kind + "_total"])
+
+    def test_empty_sides(self):
+        tests = store({"a": "success", "b": "failure"})
+        self.assertEqual(["a", "b"], diff_tests(TestStore(), tests)["added"])
+        self.assertEqual(["a", "b"],
+                         diff_tests(tests, TestStore())["removed"])
+        self.assertEqual(0, diff_tests(tests, tests)["changed_total"])
+
+    def test_limit_and_offset(self):
+        before = store({})
+        after = store({"t{0:02d}".format(i): "success" for i in range(10)})
+        diff = diff_tests(before, after, limit=3, offset=4)
+        self.assertEqual(["t04", "t05", "t06"], diff["added"])
+        self.assertEqual(10, diff["added_total"])
+        self.assertEqual([], diff_tests(before, after, limit=0)["added"])
+        self.assertEqual(["t08", "t09"],
+                         diff_tests(before, after, offset=8)["added"])
@@ -0,0 +1,128 @@
+import time
+import unittest
+
+from elastic_benchmark.schema import (
+    IndexCache, TEMPLATE_VERSION, metric_record, normalize_rally_doc,
+    normalize_status_line, normalize_summary)
+
+
+class FakeIndices(object):
+    """Index and template endpoints, failing while ``down`` is set."""
+
+    def __init__(self):
+        self.templates = {}
+        self.created = []
+        self.calls = 0
+        self.down = False
+
+    def _call(self):
+        self.calls += 1
+        if self.down:
+            raise IOError("connection refused")
+
+    def get_template(self, name, ignore=None):
+        self._call()
+        if name in self.templates:
+            return {name: self.templates[name]}
+        return {}
+
+    def put_template(self, name, body):
+        self._call()
+        self.templates[name] = body
+
+    def exists(self, index):
+        self._call()
+        return index in self.created
+
+    def create(self, index, ignore=None):
+        self._call()
+        self.created.append(index)
+
+
+class FakeClient(object):
+
+    def __init__(self):
+        self.indices = FakeIndices()
+
+
+class NormalizeTest(unittest.TestCase):
+
+    def test_metric_record(self):
+        self.assertEqual({"name": "nova", "metric": "uptime", "value": 99.5},
+                         metric_record("nova", "uptime", "99.5"))
+        self.assertEqual({"name": "nova", "metric": "state", "text": "up"},
+                         metric_record("nova", "state", "up"))
+        self.assertEqual({"name": "nova", "metric": "state", "text": None},
+                         metric_record("nova", "state", None))
+
+    def test_rally_doc(self):
+        doc = normalize_rally_doc({"duration": 1, "atomic_actions": {
+            "boot": {"avg": 1.5, "max": 2}, "delete": 0.5}})
+        self.assertEqual(1, doc["duration"])
+        self.assertEqual(
+            [{"name": "boot", "metric": "avg", "value": 1.5},
+             {"name": "boot", "metric": "max", "value": 2.0},
+             {"name": "delete", "metric": "duration", "value": 0.5}],
+            doc["atomic_actions"])
+
+    def test_summary(self):
+        doc = normalize_summary({"nova_api_uptime": 99, "smoke_total": 3,
+                                 "console_plays": 2, "done_time": "now"})
+        self.assertEqual({"smoke_total": 3, "console_plays": 2,
+                          "done_time": "now",
+                          "metrics": [{"name": "nova", "metric": "api_uptime",
+                                       "value": 99.0}]}, doc)
+
+    def test_status_line(self):
+        line = {"service": "nova", "nova_status": 1, "duration": 2}
+        self.assertEqual(
+            {"service": "nova", "duration": 2,
+             "metrics": [{"name": "nova", "metric": "status", "value": 1.0}]},
+            normalize_status_line(line))
+        self.assertEqual({"duration": 2}, normalize_status_line({"duration": 2}))
+
+
+class IndexCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = FakeClient()
+        self.cache = IndexCache(self.client)
+
+    def expire(self, index, delay):
+        # Moves the next attempt to now, checking how far off it was.
+        attempts, retry_at = self.cache.failed[index]
+        self.assertAlmostEqual(time.time() + delay, retry_at, delta=0.5)
+        self.cache.failed[index] = (attempts, 0)
+
+    def test_created_once(self):
+        self.cache.ensure("env_boot", "env")
+        self.cache.ensure("env_boot", "env")
+        self.cache.ensure("env_delete", "env")
+        self.assertEqual(["env_boot", "env_delete"], self.client.indices.created)
+        template = self.client.indices.templates["elastic-benchmark-env"]
+        self.assertEqual(TEMPLATE_VERSION, template["version"])
+        self.assertEqual(["env_*"], template["index_patterns"])
+
+    def test_outdated_template_replaced(self):
+        self.client.indices.templates["elastic-benchmark-env"] = {"version": 0}
+        self.cache.ensure("env_boot", "env")
+        self.assertEqual(TEMPLATE_VERSION, self.client.indices.templates[
+            "elastic-benchmark-env"]["version"])
+
+    def test_backoff_while_unreachable(self):
+        self.client.indices.down = True
+        for i in range(100):
+            self.cache.ensure("env_boot", "env")
+        self.assertEqual(1, self.client.indices.calls)
+
+        # Retried after 1, then 2 seconds.
+        self.expire("env_boot", 1)
+        self.cache.ensure("env_boot", "env")
+        self.cache.ensure("env_boot", "env")
+        self.assertEqual(2, self.client.indices.calls)
+
+        self.client.indices.down = False
+        self.expire("env_boot", 2)
+        self.cache.ensure("env_boot", "env")
+        self.assertIn("env_boot", self.cache.indices)
+        self.assertEqual({}, self.cache.failed)
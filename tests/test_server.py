@@ -0,0 +1,137 @@
+import httplib
+import json
+import StringIO
+import sys
+import threading
+import unittest
+
+from elastic_benchmark.server import (
+    ArgumentParser, IngestHandler, IngestServer, SharedIndexer)
+
+
+class RecordingIndexer(object):
+
+    def __init__(self, flush_error=None):
+        self.docs = []
+        self.flush_error = flush_error
+        self.indexed = 0
+        self.failures = []
+
+    def index(self, scenario_name, env, **kwargs):
+        self.docs.append((scenario_name, env, kwargs))
+
+    def flush_due(self):
+        return False
+
+    def flush(self):
+        if self.flush_error:
+            raise self.flush_error
+
+
+class QuietHandler(IngestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+
+def iteration(error):
+    return {"timestamp": 1500000000, "duration": 1.0, "error": error,
+            "atomic_actions": {"nova.boot": 0.5}}
+
+
+def report(*iterations):
+    return json.dumps([{"key": {"name": "Boot"}, "result": list(iterations)}])
+
+
+class IngestServerTest(unittest.TestCase):
+
+    def start(self, indexer):
+        settings = {"percentiles": [], "sketch_accuracy": 0.01,
+                    "rollup_seconds": None, "raw_sample": 1.0}
+        self.server = IngestServer(("127.0.0.1", 0), SharedIndexer(indexer),
+                                   "devstack", settings)
+        self.server.RequestHandlerClass = QuietHandler
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def post(self, path, body):
+        connection = httplib.HTTPConnection(*self.server.server_address)
+        connection.request("POST", path, body)
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+
+    def test_rally(self):
+        indexer = RecordingIndexer()
+        self.start(indexer)
+        status, body = self.post("/rally?environment=before_x",
+                                 report(iteration([]), iteration(["Fail"])))
+        self.assertEqual((200, {"queued": 3}), (status, body))
+        self.assertEqual(["before_x"] * 3, [env for _, env, _ in indexer.docs])
+
+    def test_status(self):
+        indexer = RecordingIndexer()
+        self.start(indexer)
+        lines = "".join(json.dumps({"status": 1}) + "\n" for _ in range(4))
+        self.assertEqual((200, {"queued": 4}),
+                         self.post("/status?api=1", lines + "\n"))
+        self.assertEqual("upgrade_api_status_log", indexer.docs[0][0])
+
+    def test_malformed_report(self):
+        self.start(RecordingIndexer())
+        status, body = self.post("/rally", "[{")
+        self.assertEqual(400, status)
+        self.assertEqual(0, body["queued"])
+
+    def test_error_after_queued_documents(self):
+        self.start(RecordingIndexer())
+        status, body = self.post("/rally", report(iteration([]),
+                                                  iteration(None)))
+        self.assertEqual(400, status)
+        self.assertEqual(1, body["queued"])
+        self.assertIn("TypeError", body["error"])
+
+    def test_flush_error(self):
+        self.start(RecordingIndexer(RuntimeError("cluster down")))
+        status, body = self.post("/status?flush=1",
+                                 json.dumps({"status": 1}) + "\n")
+        self.assertEqual(500, status)
+        self.assertEqual({"error": "RuntimeError: cluster down",
+                          "queued": 1}, body)
+
+    def test_malformed_content_length(self):
+        self.start(RecordingIndexer())
+        for length in ("abc", "-1"):
+            connection = httplib.HTTPConnection(*self.server.server_address)
+            connection.putrequest("POST", "/status")
+            connection.putheader("Content-Length", length)
+            connection.endheaders()
+            response = connection.getresponse()
+            self.assertEqual(400, response.status)
+            self.assertIn("Content-Length", json.loads(response.read())["error"])
+
+    def test_unknown_path(self):
+        self.start(RecordingIndexer())
+        self.assertEqual(404, self.post("/other", "")[0])
+
+
+class ArgumentParserTest(unittest.TestCase):
+
+    def test_percentiles(self):
+        parser = ArgumentParser()
+        self.assertEqual([50.0, 90.0, 95.0, 99.0],
+                         parser.parse_args([]).percentiles)
+        self.assertEqual([], parser.parse_args(["--percentiles", ""]).percentiles)
+        stderr = sys.stderr
+        sys.stderr = StringIO.StringIO()
+        try:
+            for value in ("abc", "50,101"):
+                with self.assertRaises(SystemExit):
+                    parser.parse_args(["--percentiles", value])
+            self.assertIn("invalid percentiles 'abc'", sys.stderr.getvalue())
+        finally:
+            sys.stderr = stderr
@@ -0,0 +1,66 @@
+import gzip
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from elastic_benchmark.inputs import open_input
+from elastic_benchmark.sinks import FileSink, open_output
+
+RUN_UPGRADE = """
+import sys
+from elastic_benchmark.upgrade import entry_point
+sys.argv = ["elastic-upgrade"] + sys.argv[1:]
+entry_point()
+"""
+
+
+class FileSinkTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_bulk_file(self):
+        path = os.path.join(self.directory, "out.ndjson.gz")
+        with FileSink(open_output(path), batch_size=2) as sink:
+            for i in range(3):
+                sink.index("boot", "env", _id=str(i), n=i)
+        self.assertEqual(3, sink.indexed)
+        with gzip.open(path) as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual({"_index": "env_boot", "_type": "results",
+                          "_id": "0"}, lines[0]["index"])
+        self.assertEqual([0, 1, 2], [line["n"] for line in lines[1::2]])
+
+    def test_bz2_appended(self):
+        path = os.path.join(self.directory, "out.ndjson.bz2")
+        for i in range(2):
+            with FileSink(open_output(path)) as sink:
+                sink.index("boot", "env", _id=str(i), n=i)
+        with open_input(path) as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual([0, 1], [line["n"] for line in lines[1::2]])
+
+    def test_stdout_carries_only_bulk_lines(self):
+        log = os.path.join(self.directory, "status.log")
+        with open(log, "w") as f:
+            for i in range(3):
+                f.write(json.dumps({"service": "nova", "status": 1}) + "\n")
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        process = subprocess.Popen(
+            [sys.executable, "-c", RUN_UPGRADE, "-s", log, "--sink",
+             "stdout"], cwd=root, stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE)
+        stdout, stderr = process.communicate()
+        self.assertEqual(0, process.returncode, stderr)
+        lines = stdout.splitlines()
+        self.assertEqual(6, len(lines))
+        for line in lines:
+            json.loads(line)
+        self.assertIn("Start parsing status file", stderr)
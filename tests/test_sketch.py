@@ -0,0 +1,101 @@
+import random
+import unittest
+
+from elastic_benchmark.sketch import (
+    QuantileSketch, parse_percentiles, percentile_name)
+
+
+def exact_quantile(values, q):
+    # Same rank convention as QuantileSketch.quantile.
+    values = sorted(values)
+    return values[int(q * (len(values) - 1))]
+
+
+class QuantileSketchTest(unittest.TestCase):
+
+    quantiles = (0.0, 0.01, 0.25, 0.5, 0.9, 0.95, 0.99, 0.999, 1.0)
+
+    def assertWithinAccuracy(self, sketch, values):
+        for q in self.quantiles:
+            exact = exact_quantile(values, q)
+            self.assertLessEqual(
+                abs(sketch.quantile(q) - exact),
+                sketch.relative_accuracy * exact + 1e-12,
+                "q={0}: {1} vs {2}".format(q, sketch.quantile(q), exact))
+
+    def sketch_of(self, values, accuracy=0.01):
+        sketch = QuantileSketch(accuracy)
+        for value in values:
+            sketch.add(value)
+        return sketch
+
+    def test_error_bound(self):
+        rng = random.Random(1)
+        for accuracy in (0.05, 0.01, 0.005):
+            values = [rng.lognormvariate(0, 1) for _ in range(5000)]
+            self.assertWithinAccuracy(self.sketch_of(values, accuracy), values)
+
+    def test_merge_error_bound(self):
+        rng = random.Random(2)
+        # Parts with very different ranges, so merged buckets interleave.
+        parts = [[rng.uniform(0.001, 0.01) for _ in range(1000)],
+                 [rng.lognormvariate(3, 1) for _ in range(3000)],
+                 [rng.uniform(5, 6) for _ in range(10)],
+                 []]
+        merged = QuantileSketch(0.01)
+        for part in parts:
+            merged.merge(self.sketch_of(part))
+        values = sum(parts, [])
+        self.assertEqual(len(values), merged.count)
+        self.assertEqual(min(values), merged.min)
+        self.assertEqual(max(values), merged.max)
+        self.assertWithinAccuracy(merged, values)
+        self.assertEqual(self.sketch_of(values).bins, merged.bins)
+
+    def test_merge_into_empty(self):
+        values = [0.5, 1.5, 2.5]
+        merged = QuantileSketch(0.01)
+        merged.merge(self.sketch_of(values))
+        self.assertEqual(self.sketch_of(values).to_dict(), merged.to_dict())
+
+    def test_merge_different_accuracy(self):
+        with self.assertRaises(ValueError):
+            QuantileSketch(0.01).merge(QuantileSketch(0.02))
+
+    def test_zero_values(self):
+        values = [0.0] * 50 + [1.0] * 50
+        sketch = self.sketch_of(values)
+        self.assertEqual(0.0, sketch.quantile(0.25))
+        self.assertAlmostEqual(1.0, sketch.quantile(0.75), delta=0.01)
+
+    def test_collapse_keeps_tail(self):
+        values = [10 ** (i / 100.0) for i in range(-600, 600)]
+        sketch = QuantileSketch(0.01, max_bins=64)
+        for value in values:
+            sketch.add(value)
+        self.assertLessEqual(len(sketch.bins), 64)
+        self.assertEqual(len(values), sketch.count)
+        for q in (0.99, 0.999, 1.0):
+            exact = exact_quantile(values, q)
+            self.assertLessEqual(abs(sketch.quantile(q) - exact),
+                                 0.01 * exact)
+
+    def test_round_trip(self):
+        sketch = self.sketch_of([0.0, 0.1, 1, 10, 100])
+        restored = QuantileSketch.from_dict(sketch.to_dict())
+        self.assertEqual(sketch.to_dict(), restored.to_dict())
+        self.assertEqual(sketch.quantile(0.5), restored.quantile(0.5))
+
+    def test_empty(self):
+        self.assertIsNone(QuantileSketch().quantile(0.5))
+
+    def test_percentile_names(self):
+        self.assertEqual({"p50": 2.0, "p99_9": 2.0},
+                         self.sketch_of([2.0]).percentiles([50, 99.9]))
+        self.assertEqual("p95", percentile_name(95.0))
+
+    def test_parse_percentiles(self):
+        self.assertEqual([50.0, 99.9], parse_percentiles("50, 99.9,"))
+        self.assertEqual([], parse_percentiles(""))
+        with self.assertRaises(ValueError):
+            parse_percentiles("101")
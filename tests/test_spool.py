@@ -0,0 +1,188 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from elasticsearch.serializer import JSONSerializer
+
+from elastic_benchmark.schema import IndexCache
+from elastic_benchmark.spool import Replayer, Spool, SpoolingIndexer
+
+
+class FakeClient(object):
+    """Bulk endpoint answering from a list of outcomes, then succeeding.
+
+    An outcome is an exception to raise or a function of the request's
+    (action, source) pairs returning the item statuses.
+    """
+
+    class transport(object):
+        serializer = JSONSerializer()
+
+    def __init__(self, outcomes=()):
+        self.outcomes = list(outcomes)
+        self.indexed = {}
+        self.lock = threading.Lock()
+
+    def bulk(self, body):
+        lines = body.splitlines()
+        pairs = [(json.loads(a)["index"], json.loads(s))
+                 for a, s in zip(lines[::2], lines[1::2])]
+        with self.lock:
+            outcome = self.outcomes.pop(0) if self.outcomes else None
+        if isinstance(outcome, Exception):
+            raise outcome
+        statuses = outcome(pairs) if outcome else [201] * len(pairs)
+        items = []
+        for (action, source), status in zip(pairs, statuses):
+            result = {"_index": action["_index"], "status": status}
+            if status < 300:
+                with self.lock:
+                    self.indexed[action["_id"]] = source
+            else:
+                result["error"] = "status {0}".format(status)
+            items.append({"index": result})
+        return {"items": items}
+
+
+class FailingIndices(object):
+    # Client whose index and template endpoints are slow and unreachable.
+
+    def __init__(self):
+        self.indices = self
+        self.calls = 0
+
+    def get_template(self, **kwargs):
+        self.calls += 1
+        time.sleep(0.2)
+        raise IOError("connection refused")
+
+
+class Results(object):
+
+    def __init__(self):
+        self.indexed = 0
+        self.failures = []
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.01)
+
+
+class SpoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def body(self, *ids):
+        return "".join(json.dumps({"index": {"_index": "i", "_id": i}}) +
+                       "\n" + json.dumps({"n": i}) + "\n" for i in ids)
+
+    def test_replay_uncommitted_batch(self):
+        spool = Spool(self.directory)
+        spool.append(self.body(1, 2, 3))
+        pairs, position = spool.read_batch(2, 1024)
+        self.assertEqual(2, len(pairs))
+        spool.commit(position)
+        # Read but never acknowledged, as when a drain is interrupted.
+        pairs, position = spool.read_batch(10, 1024)
+        self.assertEqual(1, len(pairs))
+        spool.close()
+
+        spool = Spool(self.directory)
+        self.assertTrue(spool.pending())
+        pairs, position = spool.read_batch(10, 1024)
+        self.assertEqual([{"n": 3}], [json.loads(s) for _, s in pairs])
+        spool.commit(position)
+        self.assertEqual([], spool.read_batch(10, 1024)[0])
+        self.assertFalse(spool.pending())
+        spool.close()
+
+    def test_segments_roll_over(self):
+        spool = Spool(self.directory, segment_bytes=100)
+        for i in range(5):
+            spool.append(self.body(i))
+        ids = []
+        while spool.pending():
+            pairs, position = spool.read_batch(10, 1024)
+            ids.extend(json.loads(s)["n"] for _, s in pairs)
+            spool.commit(position)
+        self.assertEqual(range(5), ids)
+        spool.close()
+        self.assertLessEqual(len(Spool(self.directory).segments()), 2)
+
+    def test_locked(self):
+        spool = Spool(self.directory)
+        with self.assertRaises(RuntimeError):
+            Spool(self.directory)
+        spool.close()
+
+    def test_replayer_retries(self):
+        client = FakeClient([
+            IOError("connection refused"),
+            lambda pairs: [429] + [201] * (len(pairs) - 1),
+            lambda pairs: [400] * len(pairs)])
+        spool = Spool(self.directory)
+        results = Results()
+        replayer = Replayer(client, spool, results, max_backoff=0.01)
+        spool.append(self.body("a", "b", "c"))
+        replayer.start()
+        wait_for(lambda: not spool.pending())
+        replayer.stop()
+        replayer.join()
+        spool.close()
+
+        # "a" was retried after the 429 and then permanently rejected.
+        self.assertEqual(["b", "c"], sorted(client.indexed))
+        self.assertEqual(2, results.indexed)
+        self.assertEqual([("i", 400, "status 400")], results.failures)
+        with open(os.path.join(self.directory, "rejected.ndjson")) as f:
+            self.assertEqual(1, len(f.readlines()))
+
+    def test_drain_timeout_and_next_run(self):
+        down = FakeClient([IOError("down")] * 1000)
+        indexer = SpoolingIndexer(down, self.directory, drain_timeout=0.2,
+                                  batch_size=2)
+        for i in range(5):
+            indexer.index("s", "env", _id=str(i), n=i)
+        start = time.time()
+        indexer.close()
+        self.assertLess(time.time() - start, 5)
+        self.assertEqual({}, down.indexed)
+        self.assertTrue(indexer.report())
+        self.assertFalse(indexer.delivered())
+
+        up = FakeClient()
+        indexer = SpoolingIndexer(up, self.directory, drain_timeout=5)
+        indexer.index("s", "env", n=5)
+        indexer.close()
+        # The documents spooled while the cluster was down went first.
+        self.assertEqual(6, indexer.indexed)
+        self.assertEqual(6, len(up.indexed))
+        self.assertTrue(indexer.delivered())
+        self.assertTrue(set("01234") <= set(up.indexed))
+
+    def test_indices_prepared_by_replayer(self):
+        client = FakeClient([IOError("down")])
+        cache = IndexCache(FailingIndices())
+        indexer = SpoolingIndexer(client, self.directory, drain_timeout=5,
+                                  batch_size=1, indices=cache)
+        start = time.time()
+        for i in range(50):
+            indexer.index("s", "env", _id=str(i), n=i)
+        # Parsing never waited on the unreachable index endpoints.
+        self.assertLess(time.time() - start, 1)
+        indexer.close()
+        self.assertEqual(50, len(client.indexed))
+        # Retried with backoff, not once per document.
+        self.assertLess(cache.client.calls, 5)
@@ -0,0 +1,178 @@
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from elastic_benchmark.statuslog import (
+    StatusCheckpoint, StatusFollower, read_last_line)
+
+
+def status_lines(count, status, start=0):
+    return "".join(json.dumps({"service": "nova", "status": status,
+                               "duration": start + i + 1}) + "\n"
+                   for i in range(count))
+
+
+class LogTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.log = os.path.join(self.directory, "status.log")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, data, mode="w"):
+        with open(self.log, mode) as f:
+            f.write(data)
+
+
+class StatusCheckpointTest(LogTestCase):
+
+    def update(self):
+        return StatusCheckpoint(self.log, self.directory).update()
+
+    def test_appended_lines(self):
+        self.write(status_lines(10, 1))
+        self.assertEqual(10, self.update())
+        self.write(status_lines(5, 0, 10) + status_lines(5, 1, 15), "a")
+        checkpoint = StatusCheckpoint(self.log, self.directory)
+        self.assertEqual(15, checkpoint.update())
+        self.assertEqual(20, checkpoint.lines)
+
+    def test_partial_last_line(self):
+        line = status_lines(1, 1)
+        self.write(status_lines(3, 1) + line[:-1])
+        self.assertEqual(4, self.update())
+        self.write("\n" + status_lines(1, 1, 4), "a")
+        self.assertEqual(5, self.update())
+
+    def test_rewritten_in_place(self):
+        self.write(status_lines(100, 0))
+        self.assertEqual(0, self.update())
+        # Same path and inode, but a longer log from a new run.
+        self.write(status_lines(200, 1, 1000))
+        self.assertEqual(200, self.update())
+
+    def test_rewritten_with_same_first_line(self):
+        self.write(status_lines(1, 0))
+        self.assertEqual(0, self.update())
+        self.write(status_lines(1, 0) + status_lines(3, 1, 1))
+        self.assertEqual(3, self.update())
+
+    def test_truncated(self):
+        self.write(status_lines(100, 1))
+        self.assertEqual(100, self.update())
+        self.write(status_lines(10, 1))
+        self.assertEqual(10, self.update())
+
+    def test_compressed(self):
+        with gzip.open(self.log, "wb") as f:
+            f.write(status_lines(5, 1) + status_lines(5, 0, 5))
+        self.assertEqual(5, self.update())
+        self.assertEqual(5, self.update())
+        self.assertEqual([], [name for name in os.listdir(self.directory)
+                              if name.endswith(".checkpoint")])
+        self.assertEqual(10, json.loads(read_last_line(self.log))["duration"])
+
+    def test_replaced(self):
+        self.write(status_lines(10, 1))
+        self.assertEqual(10, self.update())
+        os.remove(self.log)
+        self.write(status_lines(10, 0) + status_lines(20, 1))
+        self.assertEqual(20, self.update())
+
+
+class StatusFollowerTest(LogTestCase):
+
+    def follower(self):
+        return StatusFollower(self.log, self.directory)
+
+    def durations(self, follower):
+        return [record["duration"] for _, record in follower.poll()]
+
+    def test_follow_and_resume(self):
+        self.write(status_lines(3, 1))
+        follower = self.follower()
+        self.assertEqual([1, 2, 3], self.durations(follower))
+        line = status_lines(1, 1, 3)
+        self.write(line[:-5], "a")
+        self.assertEqual([], self.durations(follower))
+        self.write(line[-5:], "a")
+        self.assertEqual([4], self.durations(follower))
+        follower.save()
+        follower.close()
+
+        self.write(status_lines(1, 1, 4), "a")
+        self.assertEqual([5], self.durations(self.follower()))
+
+    def test_ids(self):
+        self.write(status_lines(3, 1))
+        ids = [line_id for line_id, _ in self.follower().poll()]
+        self.assertEqual(3, len(set(ids)))
+        # Lines read again by a follower that never saved get the same ids.
+        self.assertEqual(ids, [line_id for line_id, _
+                               in self.follower().poll()])
+
+    def test_rotated(self):
+        self.write(status_lines(2, 1))
+        follower = self.follower()
+        self.assertEqual([1, 2], self.durations(follower))
+        self.write(status_lines(1, 1, 2), "a")
+        os.rename(self.log, self.log + ".1")
+        self.write(status_lines(2, 1, 10))
+        self.assertEqual([3, 11, 12], self.durations(follower))
+
+    def test_resume_after_rewrite(self):
+        self.write(status_lines(3, 0))
+        follower = self.follower()
+        self.assertEqual([1, 2, 3], self.durations(follower))
+        follower.save()
+        follower.close()
+        self.write(status_lines(6, 1, 100))
+        self.assertEqual(range(101, 107), self.durations(self.follower()))
+
+    def test_truncated_ids(self):
+        self.write(status_lines(3, 1))
+        follower = self.follower()
+        first = [line_id for line_id, _ in follower.poll()]
+        self.write(status_lines(1, 1, 10))
+        second = [line_id for line_id, _ in follower.poll()]
+        self.assertEqual(1, len(second))
+        self.assertNotIn(second[0], first)
+        follower.close()
+        # A restarted follower keeps the generation it had reached, so the
+        # line read again overwrites its own copy only.
+        self.write(status_lines(1, 1, 20), "a")
+        third = [line_id for line_id, _ in self.follower().poll()]
+        self.assertEqual(second, third[:1])
+        self.assertNotIn(third[1], first + second)
+
+    def test_rewritten_past_offset(self):
+        self.write(status_lines(3, 1))
+        follower = self.follower()
+        self.assertEqual([1, 2, 3], self.durations(follower))
+        self.write(status_lines(10, 0, 1000))
+        self.assertEqual(range(1001, 1011), self.durations(follower))
+
+    def test_malformed_line(self):
+        self.write(status_lines(1, 1) + "not json\n" + status_lines(1, 1, 1))
+        self.assertEqual([1, 2], self.durations(self.follower()))
+
+
+class ReadLastLineTest(unittest.TestCase):
+
+    def test_last_line(self):
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(status_lines(3000, 1) + "\n\n")
+            f.flush()
+            self.assertEqual(3000, json.loads(read_last_line(f.name))[
+                "duration"])
+            self.assertEqual(3000, json.loads(read_last_line(
+                f.name, block_size=7))["duration"])
+
+    def test_empty(self):
+        with tempfile.NamedTemporaryFile() as f:
+            self.assertIsNone(read_last_line(f.name))
@@ -0,0 +1,119 @@
+import os
+import shutil
+import signal
+import tempfile
+import unittest
+
+from elastic_benchmark.upgrade import Stage, parse_console_output, run_stages
+
+
+def add(a, b):
+    return a + b
+
+
+def fail(message):
+    raise ValueError(message)
+
+
+def die():
+    os.kill(os.getpid(), signal.SIGKILL)
+
+
+class RunStagesTest(unittest.TestCase):
+
+    def test_results_in_stage_order(self):
+        results, timings = run_stages(
+            [Stage("one", add, (1, 2), "process"),
+             Stage("two", add, ("a", "b"), "thread"),
+             Stage("three", add, ([1], [2]), "process")], 2)
+        self.assertEqual([("one", 3), ("two", "ab"), ("three", [1, 2])],
+                         results.items())
+        self.assertEqual(["one", "two", "three"], timings.keys())
+
+    def test_stage_error(self):
+        for pool in ("process", "thread"):
+            with self.assertRaisesRegexp(ValueError, "broken"):
+                run_stages([Stage("bad", fail, ("broken",), pool)], 1)
+
+    def test_killed_stage(self):
+        with self.assertRaisesRegexp(RuntimeError, "bad died"):
+            run_stages([Stage("good", add, (1, 2), "process"),
+                        Stage("bad", die, (), "process")], 1)
+
+
+CONSOLE = """PLAY [Install hosts] ****************************
+TASK [setup] ************************************
+fatal: [infra1]: UNREACHABLE! => {}
+PLAY [Configure hosts] **************************
+PLAY RECAP **************************************
+infra1 : ok=10 changed=2 unreachable=1 failed=0 Run Time = 120
+\x1b[0;33mcompute1\x1b[0m : ok=8 changed=3 unreachable=0 failed=1 Run Time = 120
+PLAY [Upgrade galera] ***************************
+PLAY RECAP **************************************
+infra1 : ok=4 changed=1 unreachable=0 failed=0 skipped=2
+Run Time = 45
+"""
+
+
+class ParseConsoleOutputTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "console.log")
+        with open(self.path, "w") as f:
+            f.write(CONSOLE)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_missing_file(self):
+        self.assertEqual({"console_recaps": None}, parse_console_output(None))
+
+    def test_host_totals(self):
+        summary = parse_console_output(self.path)
+        self.assertEqual(3, summary["console_plays"])
+        self.assertEqual(2, summary["console_recaps"])
+        self.assertEqual(1, summary["console_fatal_total"])
+        self.assertEqual(2, summary["console_hosts_total"])
+        self.assertEqual(
+            {"host": "infra1", "ok": 14, "changed": 3, "unreachable": 1,
+             "failed": 0, "skipped": 2}, summary["console_hosts"][0])
+        self.assertEqual(["infra1", "compute1"],
+                         summary["console_failed_hosts"])
+        self.assertEqual(22, summary["console_ok_total"])
+        self.assertEqual(2, summary["console_errors"])
+
+    def test_recap_counts(self):
+        recaps = parse_console_output(self.path)["console_recap_counts"]
+        self.assertEqual(
+            [{"recap": 1, "play": "Install hosts", "plays": 2, "hosts": 2,
+              "ok": 18, "changed": 5, "unreachable": 1, "failed": 1,
+              "skipped": 0, "run_time": 120},
+             {"recap": 2, "play": "Upgrade galera", "plays": 1, "hosts": 1,
+              "ok": 4, "changed": 1, "unreachable": 0, "failed": 0,
+              "skipped": 2, "run_time": 45}], recaps)
+
+    def test_run_times_on_recap_lines(self):
+        summary = parse_console_output(self.path)
+        # Every host line of a recap repeats its run time.
+        self.assertEqual([120, 45], summary["console_run_times"])
+        self.assertEqual(165, summary["console_run_time_total"])
+
+    def test_timestamp_prefixes(self):
+        with open(self.path, "w") as f:
+            f.write("PLAY RECAP ****\n"
+                    "2017-03-01 12:00:00.123 | infra1 : ok=1 changed=0 "
+                    "unreachable=0 failed=0\n"
+                    "[12:00:01]compute1 : ok=2 changed=1 unreachable=0 "
+                    "failed=0\n")
+        summary = parse_console_output(self.path)
+        self.assertEqual(["infra1", "compute1"], [
+            host["host"] for host in summary["console_hosts"]])
+        self.assertEqual(3, summary["console_ok_total"])
+
+    def test_limit(self):
+        summary = parse_console_output(self.path, limit=1)
+        self.assertEqual(1, len(summary["console_hosts"]))
+        self.assertEqual(1, len(summary["console_recap_counts"]))
+        self.assertEqual([120], summary["console_run_times"])
+        self.assertEqual(165, summary["console_run_time_total"])